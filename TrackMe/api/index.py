@@ -1,3 +1,4 @@
 from app import app
 
 # Vercel needs the variable 'app' to be exposed
+# Importing must stay cheap: schema changes run at deploy time (`flask db-upgrade`)
@@ -1,8 +1,31 @@
+import csv
+import io
 import os
-from datetime import date
-from flask import Flask, render_template, request, jsonify
-from models import db, User, Habit, DailyLog
-from sqlalchemy import or_
+import click
+from datetime import date, datetime
+from flask import Flask, Response, render_template, request, jsonify, redirect, url_for, g, abort, stream_with_context
+from models import db, User, Habit, HabitStreak, Subject, SyncTombstone
+from streaks import current_streak, load_streaks, rebuild_streaks
+from charts import period_range, completion_series, bucket_count, MAX_BUCKETS
+from queries import todays_habits, todays_attendance
+from attendance_stats import attendance_stats
+from timetable import weekly_schedule, todays_slots, now_and_next, timetable_grid
+import summaries
+from cache import response_cache, HABITS, ATTENDANCE
+from upserts import is_id, upsert_attendance, validate_attendance, STATUSES
+from toggles import apply_toggle
+from batching import write_batcher
+from transfer import FORMATS, export_stream, parse_records, import_records
+from overview import SECTION_NAMESPACES, parse_fields, build_summary
+import calendars
+import history
+import scoring
+import sync
+import jobs
+import auth
+import profiles
+import instrumentation
+from auth import login_required
 
 app = Flask(__name__)
 
@@ -10,35 +33,99 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY')
+# Shared response cache, e.g. redis://localhost:6379/0; without it only the dev profile caches (see cache.py)
+app.config['CACHE_URL'] = os.environ.get('CACHE_URL')
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # Bearer token for /metrics, if set
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+# In-process job workers; serverless deployments run `flask run-jobs --once` from cron instead
+app.config['JOBS_ENABLED'] = os.environ.get('JOBS_ENABLED', '').lower() in ('1', 'true', 'yes')
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 1))
+# Coalesce single toggles/marks into micro-batches (see batching.py)
+app.config['WRITE_BATCHING'] = os.environ.get('WRITE_BATCHING', '').lower() in ('1', 'true', 'yes')
+app.config['WRITE_DURABILITY'] = os.environ.get('WRITE_DURABILITY', 'commit')  # 'commit' or 'accepted'
+app.config['WRITE_BATCH_SIZE'] = int(os.environ.get('WRITE_BATCH_SIZE', 200))
+app.config['WRITE_BATCH_WINDOW_MS'] = float(os.environ.get('WRITE_BATCH_WINDOW_MS', 10))
+
+# Pool, statement cache and SQLite pragmas for the deployment (DB_PROFILE, see profiles.py)
+profiles.configure(app)
 
 db.init_app(app)
+profiles.init_app(app, db)
+response_cache.init_app(app)
+auth.init_app(app)
+instrumentation.init_app(app)
+jobs.init_app(app)
+write_batcher.init_app(app)
+
+# Endpoints whose writes may be queued by the write batcher
+BATCHED_ENDPOINTS = ('toggle_habit', 'mark_attendance')
+
+@app.before_request
+def settle_queued_writes():
+    """Read-your-writes: a user's queued toggles and marks land before their other requests run."""
+    if g.get('user') and request.endpoint not in BATCHED_ENDPOINTS:
+        write_batcher.wait_for(g.user.id)
+
+DEFAULT_HABITS = ['Morning Jog', 'Read 30 mins']
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """Log in, creating the account on first use."""
+    error = None
+    if request.method == 'POST':
+        username = (request.form.get('username') or '').strip()
+        password = request.form.get('password') or ''
+        
+        if not username or not password:
+            error = 'Username and password are required.'
+        else:
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username)
+                auth.set_password(user, password)
+                db.session.add(user)
+                db.session.flush()
+                db.session.add_all([Habit(name=name, is_recurring=True, user_id=user.id) for name in DEFAULT_HABITS])
+                db.session.commit()
+            elif user.password_hash is None:
+                # Accounts from before logins existed get a password from the
+                # set-password command; letting the first login pick it would
+                # hand the account to whoever guessed the username first
+                error = 'This account has no password yet. Set one with: flask set-password ' + username
+                user = None
+            elif not auth.check_password(user, password):
+                error = 'Invalid username or password.'
+                user = None
+            
+            if user is not None:
+                auth.login_user(user)
+                next_url = request.args.get('next') or ''
+                return redirect(next_url if next_url.startswith('/') and not next_url.startswith('//') else url_for('dashboard'))
+    
+    return render_template('login.html', error=error)
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    auth.logout_user()
+    return redirect(url_for('login'))
 
 @app.route('/')
+@login_required
 def dashboard():
     """Main dashboard landing page."""
-    from models import Subject, AttendanceRecord
-    
-    user = User.query.first()
-    if not user:
-        # Create demo user if not exists (handling first run)
-        user = User(username='Sharad')
-        db.session.add(user)
-        db.session.commit()
+    user = g.user
     
     today = date.today()
     
     # --- 1. Habit Stats ---
-    habits = Habit.query.filter(
-        Habit.user_id == user.id,
-        or_(Habit.is_recurring == True, Habit.target_date == today)
-    ).all()
+    habits = todays_habits(user.id, today)
     
     pending_habits = []
     completed_count = 0
     
-    for h in habits:
-        log = DailyLog.query.filter_by(habit_id=h.id, date=today).first()
-        completed = log.completed if log else False
+    for h, completed in habits:
         if completed:
             completed_count += 1
         else:
@@ -47,18 +134,7 @@ def dashboard():
     completion_rate = int((completed_count / len(habits) * 100)) if habits else 0
     
     # --- 2. Attendance Stats ---
-    total_present = AttendanceRecord.query.join(Subject).filter(
-        Subject.user_id == user.id,
-        AttendanceRecord.status == 'Present'
-    ).count()
-    
-    total_absent = AttendanceRecord.query.join(Subject).filter(
-        Subject.user_id == user.id,
-        AttendanceRecord.status == 'Absent'
-    ).count()
-    
-    total_records = total_present + total_absent
-    attendance_percentage = round((total_present / total_records * 100), 1) if total_records > 0 else 0
+    attendance_percentage = attendance_stats(user.id, today=today)['overall']['percentage']
     
     return render_template(
         'dashboard.html',
@@ -70,18 +146,9 @@ def dashboard():
     )
 
 @app.route('/habits', methods=['GET', 'POST'])
+@login_required
 def habits_page():
-    # For demo, get the first user or create one (Same as before)
-    user = User.query.first()
-    if not user:
-        user = User(username='Sharad')
-        db.session.add(user)
-        db.session.commit()
-        # Seed some initial habits
-        h1 = Habit(name='Morning Jog', is_recurring=True, user_id=user.id)
-        h2 = Habit(name='Read 30 mins', is_recurring=True, user_id=user.id)
-        db.session.add_all([h1, h2])
-        db.session.commit()
+    user = g.user
 
     # Handle Add Task
     if request.method == 'POST':
@@ -94,39 +161,25 @@ def habits_page():
             
             new_habit = Habit(name=name, is_recurring=is_recurring, target_date=target_date, user_id=user.id)
             db.session.add(new_habit)
+            db.session.flush()
+            summaries.record_habit_added(new_habit, date.today())
             db.session.commit()
+            response_cache.invalidate(user.id, HABITS)
 
     today = date.today()
     
-    # 1. Fetch Today's Habits
-    habits = Habit.query.filter(
-        Habit.user_id == user.id,
-        or_(
-            Habit.is_recurring == True,
-            Habit.target_date == today
-        )
-    ).all()
+    # 1. Fetch Today's Habits (with today's completion in the same query)
+    habits = todays_habits(user.id, today)
     
     habits_data = []
     completed_count = 0
-    for h in habits:
-        log = DailyLog.query.filter_by(habit_id=h.id, date=today).first()
-        completed = log.completed if log else False
+    streaks = load_streaks([h.id for h, _ in habits])
+    for h, completed in habits:
         if completed:
             completed_count += 1
         
-        # Calculate streak (consecutive days completed)
-        streak = 0
-        if h.is_recurring:  # Only calculate streaks for recurring habits
-            from datetime import timedelta
-            check_date = today
-            while True:
-                log = DailyLog.query.filter_by(habit_id=h.id, date=check_date).first()
-                if log and log.completed:
-                    streak += 1
-                    check_date -= timedelta(days=1)
-                else:
-                    break
+        # Streak is read from the precomputed HabitStreak row
+        streak = current_streak(streaks.get(h.id), today) if h.is_recurring else 0
             
         habits_data.append({
             'id': h.id,
@@ -138,128 +191,195 @@ def habits_page():
     
     completion_rate = int((completed_count / len(habits) * 100)) if habits else 0
 
-    # 2. Calculate Last 7 Days Consistency
-    from datetime import timedelta
-    dates = [today - timedelta(days=i) for i in range(6, -1, -1)] # Last 7 days including today
+    # 2. Last 7 Days Consistency, read from the daily rollup
+    dates, chart_data = summaries.consistency(user.id, today, days=7)
     chart_labels = [d.strftime('%a') for d in dates]
-    chart_data = []
-    
-    for d in dates:
-        # Get all habits active on that day? 
-        # For simplicity in this demo, we'll check ALL recurring habits + specific habits for that day
-        # But `target_date` habits from the past might be hard to query if we didn't store "active habits history".
-        # Simplified logic: Count DailyLogs for that day vs Total Recurring Habits.
-        # This is an approximation. A real system needs better history tracking.
-        
-        # Count potential habits for day 'd'
-        potential_habits_count = Habit.query.filter(
-            Habit.user_id == user.id,
-             or_(
-                Habit.is_recurring == True,
-                Habit.target_date == d
-            )
-        ).count()
-        
-        if potential_habits_count == 0:
-            chart_data.append(0)
-            continue
-
-        completed_logs = DailyLog.query.join(Habit).filter(
-            Habit.user_id == user.id,
-            DailyLog.date == d,
-            DailyLog.completed == True
-        ).count()
-        
-        percentage = int((completed_logs / potential_habits_count) * 100)
-        chart_data.append(percentage)
 
     return render_template(
         'habits.html', 
         habits=habits_data, 
         today=today.strftime('%A, %b %d'),
+        today_iso=today.isoformat(),
         completion_rate=completion_rate,
         chart_labels=chart_labels,
         chart_data=chart_data
     )
 
 @app.route('/toggle/<int:habit_id>', methods=['POST'])
+@login_required
 def toggle_habit(habit_id):
-    today = date.today()
-    log = DailyLog.query.filter_by(habit_id=habit_id, date=today).first()
-    
-    if log:
-        log.completed = not log.completed
-        is_completed = log.completed
-    else:
-        log = DailyLog(habit_id=habit_id, date=today, completed=True)
-        db.session.add(log)
-        is_completed = True
-        
+    """
+    Flip a habit for today (or 'date'). Sending 'completed' sets the state
+    instead of flipping it, which makes retries and double-clicks harmless.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Body must be a JSON object'}), 400
+    # Optional 'date' allows backfilling a past day; defaults to today
+    try:
+        log_date = date.fromisoformat(data.get('date', date.today().isoformat()))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
+    completed = data.get('completed')
+    if completed is not None and not isinstance(completed, bool):
+        return jsonify({'success': False, 'error': 'completed must be true or false'}), 400
+    habit = Habit.query.filter_by(id=habit_id, user_id=g.user.id).first_or_404()
+    
+    if write_batcher.enabled:
+        is_completed, queued = write_batcher.toggle(habit, log_date, completed)
+        write_batcher.settle(queued)
+        return jsonify({'success': True, 'completed': is_completed, 'habit_id': habit_id, 'date': log_date.isoformat()})
+    
+    is_completed = apply_toggle(habit, log_date, completed)
     db.session.commit()
+    response_cache.invalidate(habit.user_id, HABITS)
     
-    return jsonify({'success': True, 'completed': is_completed, 'habit_id': habit_id})
+    return jsonify({'success': True, 'completed': is_completed, 'habit_id': habit_id, 'date': log_date.isoformat()})
+
+@app.route('/api/toggle/bulk', methods=['POST'])
+@login_required
+def toggle_habits_bulk():
+    """
+    Apply many {habit_id, date, completed?} toggles in one transaction.
+    Entries are applied in (habit_id, date) order, so concurrent bulk requests
+    take their row locks in the same order and cannot deadlock; repeats of one
+    habit and day keep the order they were sent in.
+    """
+    user = g.user
+    data = request.get_json(silent=True) or {}
+    entries = data.get('entries') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({'success': False, 'error': 'entries must be a list'}), 400
+    
+    def habit_id_of(entry):
+        habit_id = entry.get('habit_id') if isinstance(entry, dict) else None
+        return habit_id if is_id(habit_id) else None
+    
+    habit_ids = {habit_id_of(e) for e in entries} - {None}
+    habits = {h.id: h for h in Habit.query.filter(Habit.user_id == user.id, Habit.id.in_(habit_ids))}
+    
+    results = []
+    valid = []
+    for index, entry in enumerate(entries):
+        result = {'index': index, 'success': False}
+        results.append(result)
+        habit = habits.get(habit_id_of(entry))
+        if habit is None:
+            result['error'] = 'unknown habit'
+            continue
+        try:
+            log_date = date.fromisoformat(entry.get('date', date.today().isoformat()))
+        except (TypeError, ValueError):
+            result['error'] = 'invalid date'
+            continue
+        completed = entry.get('completed')
+        if completed is not None and not isinstance(completed, bool):
+            result['error'] = 'completed must be true or false'
+            continue
+        valid.append((habit, log_date, completed, result))
+    
+    for habit, log_date, completed, result in sorted(valid, key=lambda v: (v[0].id, v[1])):
+        completed = apply_toggle(habit, log_date, completed)
+        result.update({'success': True, 'habit_id': habit.id, 'date': log_date.isoformat(), 'completed': completed})
+    
+    db.session.commit()
+    response_cache.invalidate(user.id, HABITS)
+    
+    return jsonify({'success': all(r['success'] for r in results), 'results': results})
 
 @app.route('/api/delete_habit/<int:habit_id>', methods=['DELETE'])
+@login_required
 def delete_habit(habit_id):
-    habit = Habit.query.get_or_404(habit_id)
+    habit = Habit.query.filter_by(id=habit_id, user_id=g.user.id).first_or_404()
+    
+    summaries.record_habit_removed(habit, date.today())
     
-    # Manually delete associated logs since cascade isn't set on model
-    DailyLog.query.filter_by(habit_id=habit_id).delete()
+    # Logs and calendars go with the habit via ON DELETE CASCADE
+    HabitStreak.query.filter_by(habit_id=habit_id).delete()
+    # Tells offline clients to drop it on their next sync
+    db.session.add(SyncTombstone(user_id=habit.user_id, entity='habit', entity_id=habit_id))
     
     db.session.delete(habit)
     db.session.commit()
+    response_cache.invalidate(habit.user_id, HABITS)
     return jsonify({'success': True})
 
 @app.route('/timetable')
+@login_required
 def timetable():
-    """Placeholder route for timetable page."""
-    return render_template('timetable.html')
+    """Weekly class schedule, laid out from the user's timetable slots."""
+    return render_template('timetable.html', grid=timetable_grid(weekly_schedule(g.user.id)))
 
 @app.route('/attendance')
+@login_required
 def attendance():
     """Attendance tracking page with subjects and analytics."""
-    from models import Subject, AttendanceRecord
-    user = User.query.first()
-    subjects = Subject.query.filter_by(user_id=user.id).all() if user else []
-    
-    # Get today's attendance status for each subject
     today = date.today()
+    has_timetable = any(weekly_schedule(g.user.id))
+    show_all = request.args.get('all') == '1' or not has_timetable
+    
+    # Only today's scheduled classes are loaded unless every subject is asked for
+    slots = todays_slots(g.user.id, today)
+    subject_ids = None if show_all else {slot['subjectId'] for slot in slots}
+    subjects = todays_attendance(g.user.id, today, subject_ids)
+    
+    times = {}
+    for slot in slots:
+        times.setdefault(slot['subjectId'], []).append(f"{slot['start']}–{slot['end']}")
     for subject in subjects:
-        record = AttendanceRecord.query.filter_by(subject_id=subject.id, date=today).first()
-        subject.today_status = record.status if record else None
+        subject.today_slots = times.get(subject.id, [])
+    if not show_all:
+        subjects.sort(key=lambda subject: subject.today_slots[0])
     
-    return render_template('attendance.html', subjects=subjects, today=today)
+    return render_template('attendance.html', subjects=subjects, today=today,
+                           show_all=show_all, has_timetable=has_timetable)
+
+@app.route('/api/timetable/today', methods=['GET'])
+@login_required
+def get_todays_timetable():
+    """Today's scheduled classes plus the class in progress and the next one."""
+    moment = datetime.now()
+    current, upcoming = now_and_next(g.user.id, moment)
+    return jsonify({
+        'date': moment.date().isoformat(),
+        'weekday': moment.strftime('%A'),
+        'slots': todays_slots(g.user.id, moment.date()),
+        'now': current,
+        'next': upcoming
+    })
 
 @app.route('/mark-attendance', methods=['POST'])
+@login_required
 def mark_attendance():
-    """Mark attendance for a subject."""
-    from models import Subject, AttendanceRecord
-    
-    data = request.get_json()
+    """Mark attendance for a subject. Marking the same day again overwrites the status."""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'Body must be a JSON object'}), 400
     subject_id = data.get('subject_id')
+    if not is_id(subject_id):
+        return jsonify({'success': False, 'error': 'subject_id must be an integer'}), 400
     status = data.get('status')  # 'Present' or 'Absent'
-    attendance_date = data.get('date', date.today().isoformat())
-    
-    # Parse the date
-    attendance_date = date.fromisoformat(attendance_date)
-    
-    # Find or create attendance record
-    record = AttendanceRecord.query.filter_by(
-        subject_id=subject_id,
-        date=attendance_date
-    ).first()
-    
-    if record:
-        record.status = status
-    else:
-        record = AttendanceRecord(
-            subject_id=subject_id,
-            date=attendance_date,
-            status=status
-        )
-        db.session.add(record)
+    if not isinstance(status, str) or status not in STATUSES:
+        return jsonify({'success': False, 'error': 'status must be Present or Absent'}), 400
+    try:
+        attendance_date = date.fromisoformat(data.get('date', date.today().isoformat()))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'date must be YYYY-MM-DD'}), 400
+    subject = Subject.query.filter_by(id=subject_id, user_id=g.user.id).first_or_404()
+    
+    if write_batcher.enabled:
+        write_batcher.settle(write_batcher.mark(subject.user_id, subject.id, attendance_date, status))
+        return jsonify({
+            'success': True,
+            'subject_id': subject_id,
+            'status': status,
+            'date': attendance_date.isoformat()
+        })
     
+    # One upsert, so concurrent marks of the same day cannot both insert
+    upsert_attendance([{'subject_id': subject.id, 'date': attendance_date, 'status': status}])
     db.session.commit()
+    response_cache.invalidate(subject.user_id, ATTENDANCE)
     
     return jsonify({
         'success': True,
@@ -268,221 +388,493 @@ def mark_attendance():
         'date': attendance_date.isoformat()
     })
 
+@app.route('/api/attendance/bulk', methods=['POST'])
+@login_required
+def mark_attendance_bulk():
+    """
+    Mark many {subject_id, date, status} entries at once (a day, a week or an
+    imported semester). Valid entries are written with one upsert in a single
+    transaction; the response has a result per entry.
+    """
+    user = g.user
+    data = request.get_json(silent=True) or {}
+    entries = data.get('entries') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return jsonify({'success': False, 'error': 'entries must be a list'}), 400
+    
+    rows, results = validate_attendance(user.id, entries)
+    upsert_attendance(rows)
+    db.session.commit()
+    response_cache.invalidate(user.id, ATTENDANCE)
+    
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'written': len(rows),
+        'results': results
+    })
+
+def _date_range_args():
+    """Parse optional ISO 'start'/'end' query args. Raises ValueError if malformed."""
+    start = request.args.get('start')
+    end = request.args.get('end')
+    return (date.fromisoformat(start) if start else None,
+            date.fromisoformat(end) if end else None)
+
 @app.route('/api/attendance-stats', methods=['GET'])
+@login_required
 def get_attendance_stats():
     """Get attendance statistics for analytics."""
-    from models import Subject, AttendanceRecord
-    from sqlalchemy import func
+    user = g.user
     
-    user = User.query.first()
-    if not user:
-        return jsonify({'overall': {}, 'bySubject': []})
-    
-    # Overall stats
-    total_present = AttendanceRecord.query.join(Subject).filter(
-        Subject.user_id == user.id,
-        AttendanceRecord.status == 'Present'
-    ).count()
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
     
-    total_absent = AttendanceRecord.query.join(Subject).filter(
-        Subject.user_id == user.id,
-        AttendanceRecord.status == 'Absent'
-    ).count()
+    # Today is part of the key: scheduled-session counts run up to it
+    today = date.today()
+    return response_cache.json(user.id, ATTENDANCE, ['attendance-stats', start, end, today],
+                               lambda: attendance_stats(user.id, start=start, end=end, today=today))
+
+@app.route('/api/subject_stats/<int:subject_id>', methods=['GET'])
+@login_required
+def get_subject_stats(subject_id):
+    """Get attendance stats for a specific subject (all-time unless start/end given)."""
+    user = g.user
     
-    total_records = total_present + total_absent
-    overall_percentage = round((total_present / total_records * 100), 1) if total_records > 0 else 0
+    try:
+        start, end = _date_range_args()
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
     
-    # By subject stats
-    subjects = Subject.query.filter_by(user_id=user.id).all()
-    by_subject = []
+    today = date.today()
     
-    for subject in subjects:
-        present = AttendanceRecord.query.filter_by(
-            subject_id=subject.id,
-            status='Present'
-        ).count()
-        
-        absent = AttendanceRecord.query.filter_by(
-            subject_id=subject.id,
-            status='Absent'
-        ).count()
-        
-        total = present + absent
-        percentage = round((present / total * 100), 1) if total > 0 else 0
-        
-        by_subject.append({
-            'name': subject.name,
-            'percentage': percentage,
-            'present': present,
-            'absent': absent
-        })
+    def compute():
+        stats = attendance_stats(user.id, subject_ids=[subject_id], start=start, end=end, today=today)
+        if not stats['bySubject']:
+            # Not one of this user's subjects
+            abort(404)
+        subject = stats['bySubject'][0]
+        return {key: value for key, value in subject.items() if key not in ('id', 'name')}
     
-    return jsonify({
-        'overall': {
-            'present': total_present,
-            'absent': total_absent,
-            'percentage': overall_percentage
-        },
-        'bySubject': by_subject
-    })
+    return response_cache.json(user.id, ATTENDANCE, ['subject-stats', subject_id, start, end, today], compute)
 
-@app.route('/api/subject_stats/<int:subject_id>', methods=['GET'])
-def get_subject_stats(subject_id):
-    """Get all-time attendance stats for a specific subject."""
-    from models import AttendanceRecord
+def _history_args(parent):
+    """(parent id, start, end, cursor, limit) from the query string. Raises ValueError."""
+    parent_id = request.args.get(parent)
+    start, end = _date_range_args()
+    limit = min(max(int(request.args.get('limit', history.DEFAULT_LIMIT)), 1), history.MAX_LIMIT)
+    return (int(parent_id) if parent_id else None), start, end, history.parse_cursor(request.args.get('cursor')), limit
+
+@app.route('/api/attendance/history', methods=['GET'])
+@login_required
+def get_attendance_history():
+    """Attendance records newest first, ?cursor= for the next page; ?subject_id=, ?start=, ?end= filter."""
+    user = g.user
+    try:
+        subject_id, start, end, cursor, limit = _history_args('subject_id')
+    except ValueError:
+        return jsonify({'error': 'subject_id, limit, cursor, start and end must be valid'}), 400
     
-    # Calculate counts
-    present_count = AttendanceRecord.query.filter_by(
-        subject_id=subject_id, 
-        status='Present'
-    ).count()
+    def compute():
+        page = history.attendance_page(user.id, subject_id, start, end, cursor, limit)
+        if page is None:
+            abort(404)
+        return page
     
-    absent_count = AttendanceRecord.query.filter_by(
-        subject_id=subject_id, 
-        status='Absent'
-    ).count()
+    return response_cache.json(user.id, ATTENDANCE, ['attendance-history', subject_id, start, end, cursor, limit], compute)
+
+@app.route('/api/attendance/history/<group>', methods=['GET'])
+@login_required
+def get_attendance_history_buckets(group):
+    """Present/absent totals per week or month, with the same filters as the history."""
+    user = g.user
+    if group not in history.GROUPS:
+        abort(404)
+    try:
+        subject_id, start, end, _, _ = _history_args('subject_id')
+    except ValueError:
+        return jsonify({'error': 'subject_id, start and end must be valid'}), 400
+    try:
+        return response_cache.json(user.id, ATTENDANCE, ['attendance-buckets', group, subject_id, start, end],
+                                   lambda: history.attendance_buckets(user.id, group, subject_id, start, end))
+    except ValueError:
+        return jsonify({'error': f'the range covers more than {history.MAX_BUCKETS} {group}s'}), 400
+
+@app.route('/api/habits/history', methods=['GET'])
+@login_required
+def get_habit_history():
+    """Habit logs newest first, ?cursor= for the next page; ?habit_id=, ?start=, ?end= filter."""
+    user = g.user
+    try:
+        habit_id, start, end, cursor, limit = _history_args('habit_id')
+    except ValueError:
+        return jsonify({'error': 'habit_id, limit, cursor, start and end must be valid'}), 400
     
-    total = present_count + absent_count
-    percentage = round((present_count / total * 100), 1) if total > 0 else 0
+    def compute():
+        page = history.log_page(user.id, habit_id, start, end, cursor, limit)
+        if page is None:
+            abort(404)
+        return page
     
-    return jsonify({
-        'present': present_count,
-        'absent': absent_count,
-        'total': total,
-        'percentage': percentage
-    })
+    return response_cache.json(user.id, HABITS, ['habit-history', habit_id, start, end, cursor, limit], compute)
+
+@app.route('/api/habits/history/<group>', methods=['GET'])
+@login_required
+def get_habit_history_buckets(group):
+    """Completed/logged totals per week or month, with the same filters as the history."""
+    user = g.user
+    if group not in history.GROUPS:
+        abort(404)
+    try:
+        habit_id, start, end, _, _ = _history_args('habit_id')
+    except ValueError:
+        return jsonify({'error': 'habit_id, start and end must be valid'}), 400
+    try:
+        return response_cache.json(user.id, HABITS, ['habit-buckets', group, habit_id, start, end],
+                                   lambda: history.log_buckets(user.id, group, habit_id, start, end))
+    except ValueError:
+        return jsonify({'error': f'the range covers more than {history.MAX_BUCKETS} {group}s'}), 400
 
 @app.route('/api/chart-data/<period>', methods=['GET'])
+@login_required
 def get_chart_data(period):
-    from sqlalchemy import func
-    from datetime import timedelta
-    import calendar
-    
+    """Completion counts for week/month/year or an arbitrary start/end range."""
     today = date.today()
-    user = User.query.first()
-    if not user:
-        return jsonify({'labels': [], 'data': [], 'pieData': []})
+    user = g.user
 
     # Get query parameters
-    chart_type = request.args.get('chartType', 'bar')  # 'line', 'bar', 'pie'
     selected_month = request.args.get('month', str(today.month))  # 1-12
     selected_year = request.args.get('year', str(today.year))
     
     try:
         selected_month = int(selected_month)
         selected_year = int(selected_year)
-    except:
+    except ValueError:
         selected_month = today.month
         selected_year = today.year
 
-    labels = []
-    data_points = []
-    pie_data = []
+    # 'range' accepts ISO start/end dates, e.g. for multi-year views
+    try:
+        start = date.fromisoformat(request.args['start']) if 'start' in request.args else None
+        end = date.fromisoformat(request.args['end']) if 'end' in request.args else today
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates'}), 400
 
-    if period == 'week':
-        # Last 7 days with improved labels
-        for i in range(6, -1, -1):
-            d = today - timedelta(days=i)
-            labels.append(f"{d.strftime('%a')} {d.day}")  # e.g., "Mon 12"
-            
-            count = DailyLog.query.join(Habit).filter(
-                Habit.user_id == user.id,
-                DailyLog.date == d,
-                DailyLog.completed == True
-            ).count()
-            data_points.append(count)
-        
-        # Pie chart: Breakdown by habit for last 7 days
-        if chart_type == 'pie':
-            start_date = today - timedelta(days=6)
-            habit_counts = db.session.query(
-                Habit.name,
-                func.count(DailyLog.id).label('count')
-            ).join(DailyLog).filter(
-                Habit.user_id == user.id,
-                DailyLog.date >= start_date,
-                DailyLog.date <= today,
-                DailyLog.completed == True
-            ).group_by(Habit.name).all()
-            
-            pie_data = [{'label': h.name, 'value': h.count} for h in habit_counts]
-
-    elif period == 'month':
-        # Specific month selection
-        num_days = calendar.monthrange(selected_year, selected_month)[1]
-        for day in range(1, num_days + 1):
-            labels.append(str(day))
-            d = date(selected_year, selected_month, day)
-            
-            count = DailyLog.query.join(Habit).filter(
-                Habit.user_id == user.id,
-                DailyLog.date == d,
-                DailyLog.completed == True
-            ).count()
-            data_points.append(count)
-        
-        # Pie chart: Breakdown by habit for selected month
-        if chart_type == 'pie':
-            start_date = date(selected_year, selected_month, 1)
-            end_date = date(selected_year, selected_month, num_days)
-            
-            habit_counts = db.session.query(
-                Habit.name,
-                func.count(DailyLog.id).label('count')
-            ).join(DailyLog).filter(
-                Habit.user_id == user.id,
-                DailyLog.date >= start_date,
-                DailyLog.date <= end_date,
-                DailyLog.completed == True
-            ).group_by(Habit.name).all()
-            
-            pie_data = [{'label': h.name, 'value': h.count} for h in habit_counts]
+    try:
+        resolved = period_range(period, today, selected_month, selected_year, start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not resolved:
+        return jsonify({'labels': [], 'data': [], 'pieData': []})
+    start, end, bucket = resolved
 
-    elif period == 'year':
-        # Selected year, grouped by month
-        for month in range(1, 13):
-            labels.append(calendar.month_abbr[month])
-            
-            start_date = date(selected_year, month, 1)
-            last_day = calendar.monthrange(selected_year, month)[1]
-            end_date = date(selected_year, month, last_day)
-            
-            count = DailyLog.query.join(Habit).filter(
-                Habit.user_id == user.id,
-                DailyLog.date >= start_date,
-                DailyLog.date <= end_date,
-                DailyLog.completed == True
-            ).count()
-            data_points.append(count)
-        
-        # Pie chart: Breakdown by habit for selected year
-        if chart_type == 'pie':
-            start_date = date(selected_year, 1, 1)
-            end_date = date(selected_year, 12, 31)
-            
-            habit_counts = db.session.query(
-                Habit.name,
-                func.count(DailyLog.id).label('count')
-            ).join(DailyLog).filter(
-                Habit.user_id == user.id,
-                DailyLog.date >= start_date,
-                DailyLog.date <= end_date,
-                DailyLog.completed == True
-            ).group_by(Habit.name).all()
-            
-            pie_data = [{'label': h.name, 'value': h.count} for h in habit_counts]
+    if period == 'range' and request.args.get('bucket') in ('day', 'month'):
+        bucket = request.args.get('bucket')
+    if bucket_count(start, end, bucket) > MAX_BUCKETS:
+        return jsonify({'error': f'the range covers more than {MAX_BUCKETS} {bucket}s'}), 400
 
-    return jsonify({
-        'labels': labels,
-        'data': data_points,
-        'pieData': pie_data
-    })
+    label_style = {'week': 'weekday', 'month': 'day', 'year': 'month'}.get(period)
+    return response_cache.json(user.id, HABITS, ['chart-data', period, start, end, bucket],
+                               lambda: completion_series(user.id, start, end, bucket, label_style))
 
-# Initialize DB
-with app.app_context():
-    db.create_all()
+def _year_arg(today):
+    """The ?year= argument, defaulting to this year. Raises ValueError."""
+    year = int(request.args.get('year', today.year))
+    if not 1 <= year <= 9999:
+        raise ValueError(year)
+    return year
+
+@app.route('/api/habits/<int:habit_id>/calendar', methods=['GET'])
+@login_required
+def get_habit_calendar(habit_id):
+    """Year heatmap, completion count and streaks for one habit."""
+    user = g.user
+    today = date.today()
+    try:
+        year = _year_arg(today)
+    except ValueError:
+        return jsonify({'error': 'year must be a number'}), 400
+    
+    def compute():
+        habit = Habit.query.filter_by(id=habit_id, user_id=user.id).first_or_404()
+        bits = calendars.load_bits([habit.id], year)[habit.id]
+        return {'habitId': habit.id, 'name': habit.name, **calendars.year_view(bits, year, today)}
+    
+    return response_cache.json(user.id, HABITS, ['calendar', habit_id, year, today], compute)
+
+@app.route('/api/habits/calendar', methods=['GET'])
+@login_required
+def get_habits_calendar():
+    """
+    Year heatmaps for several habits (?ids=1,2,3, default all) plus a combined
+    heatmap counting completed habits per day.
+    """
+    user = g.user
+    today = date.today()
+    try:
+        year = _year_arg(today)
+        ids = [int(part) for part in request.args['ids'].split(',') if part.strip()] if 'ids' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'year and ids must be numbers'}), 400
+    
+    def compute():
+        query = Habit.query.filter_by(user_id=user.id)
+        if ids is not None:
+            query = query.filter(Habit.id.in_(ids))
+        habits = query.order_by(Habit.id).all()
+        bits = calendars.load_bits([habit.id for habit in habits], year)
+        return {
+            'year': year,
+            'habits': [{'habitId': habit.id, 'name': habit.name, **calendars.year_view(bits[habit.id], year, today)}
+                       for habit in habits],
+            'days': calendars.combined_days(bits.values(), year),
+        }
+    
+    return response_cache.json(user.id, HABITS, ['calendars', ids, year, today], compute)
+
+@app.route('/api/scores', methods=['GET'])
+@login_required
+def get_scores():
+    """
+    Rolling 7/30/90-day consistency, weekday patterns, streaks and at-risk
+    flags for each recurring habit, with overall averages.
+    """
+    user = g.user
+    today = date.today()
+    return response_cache.json(user.id, HABITS, ['scores', today],
+                               lambda: scoring.user_scores(user.id, today))
+
+@app.route('/api/sync', methods=['GET'])
+@login_required
+def get_sync():
+    """
+    Habits, subjects, logs and attendance changed since ?cursor=, with ids
+    deleted since; a snapshot ("reset": true) without one. See sync.py.
+    """
+    try:
+        cursor = sync.parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    return jsonify(sync.pull(g.user.id, cursor, datetime.utcnow()))
+
+@app.route('/api/sync', methods=['POST'])
+@login_required
+def post_sync():
+    """
+    Apply a batch of offline ops in one transaction, then return a result per
+    op and the changes since the posted cursor, as GET /api/sync does.
+    """
+    user = g.user
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Body must be a JSON object'}), 400
+    ops = data.get('ops') or []
+    if not isinstance(ops, list) or len(ops) > sync.MAX_OPS:
+        return jsonify({'error': f'ops must be a list of at most {sync.MAX_OPS}'}), 400
+    try:
+        cursor = sync.parse_cursor(data.get('cursor'))
+        sent_at = sync.parse_cursor(data.get('sentAt'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'cursor and sentAt must be ISO timestamps'}), 400
+    
+    now = datetime.utcnow()
+    results, written = sync.push(user.id, ops, sent_at, now)
+    db.session.commit()
+    if 'log' in written:
+        response_cache.invalidate(user.id, HABITS)
+    if 'attendance' in written:
+        response_cache.invalidate(user.id, ATTENDANCE)
+    return jsonify({'results': results, **sync.pull(user.id, cursor, now)})
+
+@app.route('/api/summary', methods=['GET'])
+@login_required
+def get_summary():
+    """
+    Today's habits with streaks, completion rate, attendance and the week chart
+    in one payload. ?fields=habits,completion,attendance,week picks sections.
+    """
+    user = g.user
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    today = date.today()
+    namespaces = tuple(sorted({SECTION_NAMESPACES[field] for field in fields}))
+    return response_cache.json(user.id, namespaces, ['summary', sorted(fields), today],
+                               lambda: build_summary(user.id, today, fields))
+
+@app.route('/api/export', methods=['GET'])
+@login_required
+def export_data():
+    """Stream the user's habit and attendance history as CSV (default) or NDJSON."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    filename = f"trackme-{g.user.username}-{date.today().isoformat()}.{fmt}"
+    return Response(
+        stream_with_context(export_stream(g.user.id, fmt)),
+        mimetype=FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def _import_stream(user_id, lines, fmt):
+    """Import parsed lines for a user and drop their cached analytics. Raises ValueError."""
+    try:
+        result = import_records(user_id, parse_records(lines, fmt))
+    except (ValueError, UnicodeDecodeError, csv.Error):
+        db.session.rollback()
+        raise
+    db.session.commit()
+    
+    response_cache.invalidate(user_id, HABITS)
+    response_cache.invalidate(user_id, ATTENDANCE)
+    return result
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def import_data():
+    """
+    Import an export (CSV or NDJSON body) into the user's account. The body is
+    read line by line and written in chunks; re-importing the same data is a no-op.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == FORMATS['csv'] else 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        result = _import_stream(g.user.id, lines, fmt)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({'success': True, **result})
+
+@app.route('/api/cache-stats', methods=['GET'])
+@login_required
+def get_cache_stats():
+    """The user's hit/miss counters for the analytics response cache."""
+    return jsonify(response_cache.user_stats(g.user.id))
+
+@app.cli.command('rebuild-streaks')
+def rebuild_streaks_command():
+    """Recompute all habit streaks from DailyLog."""
+    count = rebuild_streaks()
+    print(f"Rebuilt streaks for {count} habits.")
+
+@app.cli.command('rebuild-summaries')
+def rebuild_summaries_command():
+    """Recompute the daily habit completion rollup from DailyLog."""
+    count = summaries.rebuild_summaries()
+    print(f"Rebuilt {count} daily summaries.")
+
+@app.cli.command('rebuild-calendars')
+def rebuild_calendars_command():
+    """Recompute the per-year habit completion bitmaps from DailyLog."""
+    count = calendars.rebuild_calendars()
+    print(f"Rebuilt {count} habit calendars.")
+
+@app.cli.command('export-data')
+@click.argument('username')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--output', type=click.File('w'), default='-', help='File to write (default: stdout).')
+def export_data_command(username, fmt, output):
+    """Write a user's habit and attendance history as CSV or NDJSON."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}.")
+    for chunk in export_stream(user.id, fmt):
+        output.write(chunk)
+
+@app.cli.command('import-data')
+@click.argument('username')
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default=None,
+              help='Input format (default: from the file extension).')
+def import_data_command(username, source, fmt):
+    """Import a CSV or NDJSON export into a user's account."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}.")
+    fmt = fmt or ('ndjson' if source.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+    try:
+        result = _import_stream(user.id, source, fmt)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise click.ClickException(str(e))
+    print(', '.join(f"{key}={value}" for key, value in result['counts'].items()))
+    for error in result['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+
+@app.cli.command('set-password')
+@click.argument('username')
+@click.password_option()
+def set_password_command(username, password):
+    """Set or reset a user's password, e.g. for an account from before logins existed."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}.")
+    auth.set_password(user, password)
+    db.session.commit()
+    print(f"Password set for {username}.")
+
+@app.cli.command('run-jobs')
+@click.option('--once', is_flag=True, help="Queue today's nightly jobs, run everything queued and exit.")
+@click.option('--poll-interval', default=5.0, help='Seconds between polls of an empty queue.')
+def run_jobs_command(once, poll_interval):
+    """Run background jobs: a worker loop, or one pass for cron."""
+    if once:
+        jobs.requeue_stale()
+        jobs.schedule_nightly(date.today())
+        for job in jobs.run_pending():
+            print(f"{job.name} [{job.key}] {job.status} in {job.duration_ms:.0f} ms: {job.error or job.result}")
+        return
+    worker = jobs.Worker(app, poll_interval)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+
+@app.cli.command('enqueue-job')
+@click.argument('name', type=click.Choice(sorted(jobs.HANDLERS)))
+@click.option('--key', default=None, help='Idempotency key; a job with the same name and key is only queued once.')
+@click.option('--user-id', type=int, default=None, help='Limit the job to one user.')
+def enqueue_job_command(name, key, user_id):
+    """Queue a background job for the next worker pass."""
+    params = {'user_id': user_id} if user_id is not None else {}
+    job = jobs.enqueue(name, key, **params)
+    print(f"Job {job.id} {name} [{job.key}] is {job.status}.")
+
+@app.cli.command('jobs')
+@click.option('--limit', default=20)
+@click.option('--status', type=click.Choice(['queued', 'running', 'succeeded', 'failed']), default=None)
+def jobs_command(limit, status):
+    """List recent background jobs with their status and duration."""
+    for job in jobs.recent(limit, status):
+        duration = f"{job.duration_ms:.0f} ms" if job.duration_ms is not None else '-'
+        print(f"{job.id:>6} {job.name:<16} {job.key:<26} {job.status:<10} {duration:>10} "
+              f"x{job.attempts} {job.error or job.result or ''}")
+
+@app.cli.command('db-upgrade')
+@click.option('--sql', 'dialect', default=None, help="Print the SQL for a dialect ('sqlite' or 'postgresql') instead of applying it.")
+@click.option('--from-version', default=0, help='Version the offline SQL starts from.')
+def db_upgrade_command(dialect, from_version):
+    """Create or migrate the database schema. Run once per deploy."""
+    import migrations
+    
+    if dialect:
+        for statement in migrations.pending_sql(dialect, from_version):
+            print(f"{statement};")
+        return
+    applied = migrations.upgrade()
+    print(f"Applied migrations: {applied}" if applied else "Database is up to date.")
 
 if __name__ == '__main__':
+    import migrations
+    
+    with app.app_context():
+        migrations.upgrade()
     app.run(debug=True)
 
 
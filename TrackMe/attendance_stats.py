@@ -0,0 +1,117 @@
+"""
+Attendance statistics.
+
+Overall and per-subject present/absent counts come from one
+GROUP BY subject_id, status query; percentages and the 75% projections are
+derived in Python. Sessions the timetable says were held are counted from the
+cached weekly schedule, so classes nobody marked show up as `unmarked`.
+"""
+import math
+from datetime import date
+from sqlalchemy import func, and_
+from models import db, Subject, AttendanceRecord
+from timetable import scheduled_sessions
+
+MIN_ATTENDANCE = 75  # Percentage required to stay eligible
+
+
+def _rollup(present, absent, min_percentage):
+    total = present + absent
+    percentage = round((present / total * 100), 1) if total > 0 else 0
+    ratio = min_percentage / 100
+
+    # Classes that can be skipped while staying at or above the minimum,
+    # or classes that must be attended in a row to get back above it
+    can_miss = 0
+    need_to_attend = 0
+    if total > 0 and ratio < 1:
+        if present >= ratio * total:
+            can_miss = math.floor(present / ratio - total + 1e-9) if ratio > 0 else 0
+        else:
+            need_to_attend = math.ceil((ratio * total - present) / (1 - ratio) - 1e-9)
+
+    return {
+        'present': present,
+        'absent': absent,
+        'total': total,
+        'percentage': percentage,
+        'canMiss': can_miss,
+        'needToAttend': need_to_attend
+    }
+
+
+def _with_schedule(stats, scheduled):
+    stats['scheduled'] = scheduled
+    stats['unmarked'] = max(0, scheduled - stats['total'])
+    return stats
+
+
+def attendance_stats(user_id, subject_ids=None, start=None, end=None, min_percentage=MIN_ATTENDANCE, today=None):
+    """
+    Compute overall and per-subject attendance for a user in one query.
+    Optionally restrict to some subjects and to records within [start, end].
+    `scheduled` counts timetabled sessions from `start` (or the subject's first
+    record) to `end` (or today).
+    Returns {'overall': {...}, 'bySubject': [{'id', 'name', ...}]}.
+    """
+    join_on = [AttendanceRecord.subject_id == Subject.id]
+    if start:
+        join_on.append(AttendanceRecord.date >= start)
+    if end:
+        join_on.append(AttendanceRecord.date <= end)
+
+    query = db.session.query(
+        Subject.id,
+        Subject.name,
+        AttendanceRecord.status,
+        func.count(AttendanceRecord.id),
+        func.min(AttendanceRecord.date)
+    ).outerjoin(AttendanceRecord, and_(*join_on)).filter(
+        Subject.user_id == user_id
+    )
+    if subject_ids is not None:
+        query = query.filter(Subject.id.in_(subject_ids))
+
+    rows = query.group_by(Subject.id, Subject.name, AttendanceRecord.status).order_by(Subject.id).all()
+
+    counts = {}
+    names = {}
+    first_dates = {}
+    for subject_id, name, status, count, first_date in rows:
+        names[subject_id] = name
+        if first_date is not None:
+            first_dates[subject_id] = min(first_date, first_dates.get(subject_id, first_date))
+        present, absent = counts.get(subject_id, (0, 0))
+        if status == 'Present':
+            present += count
+        elif status == 'Absent':
+            absent += count
+        counts[subject_id] = (present, absent)
+
+    end = end or today or date.today()
+    ranges = {}
+    for subject_id in counts:
+        range_start = start or first_dates.get(subject_id)
+        if range_start is not None:
+            ranges.setdefault(range_start, []).append(subject_id)
+    held = {}
+    for range_start, ids in ranges.items():
+        sessions = scheduled_sessions(user_id, range_start, end)
+        held.update({subject_id: sessions.get(subject_id, 0) for subject_id in ids})
+
+    by_subject = []
+    total_present = total_absent = total_scheduled = 0
+    for subject_id, (present, absent) in counts.items():
+        total_present += present
+        total_absent += absent
+        total_scheduled += held.get(subject_id, 0)
+        by_subject.append({
+            'id': subject_id,
+            'name': names[subject_id],
+            **_with_schedule(_rollup(present, absent, min_percentage), held.get(subject_id, 0))
+        })
+
+    return {
+        'overall': _with_schedule(_rollup(total_present, total_absent, min_percentage), total_scheduled),
+        'bySubject': by_subject
+    }
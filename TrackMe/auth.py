@@ -0,0 +1,78 @@
+"""
+Per-request user context.
+
+The logged-in user's id is kept in the Flask session. Before each request it
+is resolved to `g.user` through a small in-process identity cache, so most
+requests do not touch the user table. Views decorated with @login_required
+redirect to the login page (or answer 401 for API calls) when nobody is
+logged in.
+"""
+from functools import wraps
+from flask import g, session, request, redirect, url_for, jsonify
+from werkzeug.security import generate_password_hash, check_password_hash
+from cache import MemoryBackend
+from models import db, User
+
+
+class CurrentUser:
+    """Detached snapshot of the logged-in user, safe to keep in the cache."""
+    __slots__ = ('id', 'username')
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+
+_identities = MemoryBackend(maxsize=4096, ttl=300)
+
+
+def _resolve(user_id):
+    key = str(user_id)
+    identity = _identities.get(key)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = CurrentUser(user.id, user.username)
+        _identities.set(key, identity)
+    return identity
+
+
+def load_current_user():
+    user_id = session.get('user_id')
+    g.user = _resolve(user_id) if user_id is not None else None
+
+
+def init_app(app):
+    app.before_request(load_current_user)
+
+
+def login_user(user):
+    session.clear()
+    session['user_id'] = user.id
+    session.permanent = True
+    g.user = CurrentUser(user.id, user.username)
+
+
+def logout_user():
+    session.clear()
+    g.user = None
+
+
+def set_password(user, password):
+    user.password_hash = generate_password_hash(password)
+
+
+def check_password(user, password):
+    return user.password_hash is not None and check_password_hash(user.password_hash, password)
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if g.get('user') is None:
+            if request.method == 'GET' and not request.path.startswith('/api/'):
+                return redirect(url_for('login', next=request.path))
+            return jsonify({'success': False, 'error': 'login required'}), 401
+        return view(*args, **kwargs)
+    return wrapped
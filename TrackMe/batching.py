@@ -0,0 +1,233 @@
+"""
+Optional write coalescing for habit toggles and attendance marks.
+
+Enabled with WRITE_BATCHING=1. Single toggles and marks are queued instead
+of each committing its own transaction; a flusher thread collects them for
+up to WRITE_BATCH_WINDOW_MS or WRITE_BATCH_SIZE writes and applies the
+batch in one transaction: one multi-row upsert for attendance, one upsert
+plus one UPDATE for habit logs (see toggles.apply_toggles), one commit.
+Repeated writes to the same key within a batch collapse to the last one.
+
+WRITE_DURABILITY picks when the request returns:
+
+    commit    after the batch holding the write has committed (default);
+              requests share commits but nothing is acknowledged early
+    accepted  as soon as the write is queued; a crash can lose the writes
+              of the current window
+
+Read-your-writes: every other request from the same user waits for that
+user's queued writes to commit before it is handled (wait_for), and a flip
+without an explicit state is resolved against queued writes first. Both
+hold within one process, so with WRITE_DURABILITY=accepted run a single
+worker process or sticky sessions.
+"""
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from models import db, DailyLog
+from cache import response_cache, HABITS, ATTENDANCE
+from toggles import apply_toggles
+from upserts import upsert_attendance
+
+logger = logging.getLogger(__name__)
+
+DURABILITY = ('commit', 'accepted')
+
+
+class _Write:
+    __slots__ = ('kind', 'user_id', 'key', 'value', 'seq', 'future')
+
+    def __init__(self, kind, user_id, key, value):
+        self.kind = kind          # 'log' or 'attendance'
+        self.user_id = user_id
+        self.key = key            # (habit_id, date) or (subject_id, date)
+        self.value = value        # completed flag or status
+        self.seq = None
+        self.future = Future()
+
+
+class WriteBatcher:
+    def __init__(self):
+        self.enabled = False
+        self.app = None
+        self.durability = 'commit'
+        self.batch_size = 200
+        self.window = 0.01
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.queue = []
+        self.queued_logs = {}     # (habit_id, date) -> (seq, state) of its latest queued write, for flips
+        self.seq = 0
+        self.pending = {}         # user_id -> writes queued or in flight
+        self.thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('WRITE_BATCHING', False)
+        self.durability = app.config.get('WRITE_DURABILITY', 'commit')
+        if self.durability not in DURABILITY:
+            raise ValueError(f"WRITE_DURABILITY must be one of {', '.join(DURABILITY)}")
+        self.batch_size = app.config.get('WRITE_BATCH_SIZE', 200)
+        self.window = app.config.get('WRITE_BATCH_WINDOW_MS', 10) / 1000
+        self.app = app
+        app.extensions['write_batcher'] = self
+        if self.enabled:
+            atexit.register(self.close)
+
+    def _enqueue(self, write):
+        # Caller holds the lock
+        if self.thread is None or not self.thread.is_alive():
+            # Started lazily so it lives in the serving process, not a pre-fork parent
+            self.thread = threading.Thread(target=self._run, name='trackme-write-batcher', daemon=True)
+            self.thread.start()
+        self.seq += 1
+        write.seq = self.seq
+        self.queue.append(write)
+        if write.kind == 'log':
+            self.queued_logs[write.key] = (write.seq, write.value)
+        self.pending[write.user_id] = self.pending.get(write.user_id, 0) + 1
+        self.ready.notify_all()
+        return write.future
+
+    def toggle(self, habit, day, completed=None):
+        """
+        Queue setting `habit` for `day` (flipping it when `completed` is None).
+        Returns (state, future); the future resolves once the write commits.
+
+        A flip reads the stored state outside the lock. A log only changes
+        while it has a queued write, and that entry is dropped in the same
+        locked step that counts the batch, so if the log is not queued and no
+        batch finished since the read, the read is still current. Otherwise
+        it is read again.
+        """
+        key = (habit.id, day)
+        stored = batches = None
+        while True:
+            with self.lock:
+                if completed is None and key in self.queued_logs:
+                    state = not self.queued_logs[key][1]
+                elif completed is None and batches != self.batches:
+                    batches = self.batches
+                    state = None
+                else:
+                    state = bool(completed) if completed is not None else not stored
+                if state is not None:
+                    return state, self._enqueue(_Write('log', habit.user_id, key, state))
+            log = db.session.query(DailyLog.completed).filter_by(habit_id=habit.id, date=day).first()
+            stored = bool(log and log.completed)
+
+    def mark(self, user_id, subject_id, day, status):
+        """Queue an attendance mark. Returns a future that resolves once it commits."""
+        with self.lock:
+            return self._enqueue(_Write('attendance', user_id, (subject_id, day), status))
+
+    def settle(self, future, timeout=10):
+        """Wait for a write according to WRITE_DURABILITY. Raises what the write raised."""
+        if self.durability == 'commit':
+            future.result(timeout)
+
+    def wait_for(self, user_id, timeout=10):
+        """Block until the user's queued writes have committed (read-your-writes)."""
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.pending.get(user_id):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning("Gave up waiting for user %s's queued writes", user_id)
+                    return
+                self.ready.wait(remaining)
+
+    def _take_batch(self):
+        """Wait for a first write, then up to `window` for more. Returns up to batch_size writes."""
+        with self.lock:
+            while not self.queue:
+                self.ready.wait()
+            deadline = time.monotonic() + self.window
+            while len(self.queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.ready.wait(remaining)
+            batch, self.queue = self.queue[:self.batch_size], self.queue[self.batch_size:]
+            return batch
+
+    def _run(self):
+        while True:
+            self._flush(self._take_batch())
+
+    def _apply(self, batch):
+        logs = {}
+        attendance = {}
+        for write in batch:
+            # Later writes to the same key win
+            if write.kind == 'log':
+                logs[write.key] = write.value
+            else:
+                attendance[write.key] = write.value
+        apply_toggles(logs)
+        upsert_attendance([
+            {'subject_id': subject_id, 'date': day, 'status': status}
+            for (subject_id, day), status in attendance.items()
+        ])
+        db.session.commit()
+
+    def _flush(self, batch):
+        failures = {}
+        with self.app.app_context():
+            try:
+                self._apply(batch)
+            except Exception as e:
+                db.session.rollback()
+                if len(batch) == 1:
+                    logger.exception("Queued %s write for user %s failed", batch[0].kind, batch[0].user_id)
+                    failures[batch[0]] = e
+                else:
+                    # Find the bad write(s) without failing the rest
+                    logger.exception("Write batch of %d failed; retrying one by one", len(batch))
+                    for write in batch:
+                        try:
+                            self._apply([write])
+                        except Exception as e:
+                            db.session.rollback()
+                            failures[write] = e
+            finally:
+                db.session.remove()
+
+        for user_id, namespace in {(w.user_id, HABITS if w.kind == 'log' else ATTENDANCE) for w in batch}:
+            response_cache.invalidate(user_id, namespace)
+
+        with self.lock:
+            self.batches += 1
+            self.writes += len(batch)
+            for write in batch:
+                if write.kind == 'log' and self.queued_logs.get(write.key, (None,))[0] == write.seq:
+                    del self.queued_logs[write.key]
+                self.pending[write.user_id] -= 1
+                if not self.pending[write.user_id]:
+                    del self.pending[write.user_id]
+            self.ready.notify_all()
+
+        for write in batch:
+            if write in failures:
+                write.future.set_exception(failures[write])
+            else:
+                write.future.set_result(write.value)
+
+    def flush(self, timeout=10):
+        """Wait until everything queued so far has committed."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.pending and time.monotonic() < deadline:
+                self.ready.wait(deadline - time.monotonic())
+
+    def close(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.flush()
+
+
+write_batcher = WriteBatcher()
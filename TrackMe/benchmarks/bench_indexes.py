@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Before/after benchmark for the lookup indexes (migration 2).
+
+Seeds a large synthetic dataset into the current schema without those
+indexes, prints the query plans and timings of the hot queries, creates the
+indexes and repeats.
+
+    python benchmarks/bench_indexes.py                        # temporary SQLite file
+    python benchmarks/bench_indexes.py --database-url postgresql://...   # empty database
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Empty database to use (default: temporary SQLite file)')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--habits', type=int, default=15)
+    parser.add_argument('--subjects', type=int, default=9)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+args = parse_args()
+if args.database_url:
+    os.environ['DATABASE_URL'] = args.database_url
+else:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from app import app  # noqa: E402  (needs DATABASE_URL)
+from models import db  # noqa: E402
+import migrations  # noqa: E402
+from benchmarks.dataset import generate  # noqa: E402
+from queries import todays_habits  # noqa: E402
+from attendance_stats import attendance_stats  # noqa: E402
+from charts import habit_totals  # noqa: E402
+
+# Representative SQL for the query plans, matching the ORM queries timed below
+PLANS = {
+    'todays_habits': (
+        "SELECT habit.id, daily_log.completed FROM habit "
+        "LEFT OUTER JOIN daily_log ON daily_log.habit_id = habit.id AND daily_log.date = :today "
+        "WHERE habit.user_id = :user_id AND (habit.is_recurring = true OR habit.target_date = :today)"
+    ),
+    'attendance_stats': (
+        "SELECT subject.id, attendance_record.status, count(attendance_record.id) FROM subject "
+        "LEFT OUTER JOIN attendance_record ON attendance_record.subject_id = subject.id "
+        "WHERE subject.user_id = :user_id GROUP BY subject.id, attendance_record.status"
+    ),
+    'habit_totals': (
+        "SELECT habit.name, count(daily_log.id) FROM habit JOIN daily_log ON habit.id = daily_log.habit_id "
+        "WHERE habit.user_id = :user_id AND daily_log.date >= :start AND daily_log.date <= :today "
+        "AND daily_log.completed = true GROUP BY habit.name"
+    ),
+    'logs_on_date': (
+        "SELECT count(*) FROM daily_log WHERE daily_log.date = :today AND daily_log.completed = true"
+    ),
+}
+
+
+def explain(conn, sql, params):
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = conn.execute(db.text(prefix + sql), params).fetchall()
+    return [' '.join(str(col) for col in row) for row in rows]
+
+
+def timings(user_id, today, repeat):
+    year_start = today - timedelta(days=364)
+    cases = {
+        'todays_habits': lambda: todays_habits(user_id, today),
+        'attendance_stats': lambda: attendance_stats(user_id),
+        'habit_totals': lambda: habit_totals(user_id, year_start, today),
+    }
+    results = {}
+    for name, func in cases.items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def report(label, user_id, today):
+    params = {'user_id': user_id, 'today': today, 'start': today - timedelta(days=364)}
+    print(f"\n=== {label} ===")
+    with db.engine.connect() as conn:
+        for name, sql in PLANS.items():
+            print(f"-- {name}")
+            for line in explain(conn, sql, params):
+                print(f"   {line}")
+    results = timings(user_id, today, args.repeat)
+    for name, ms in results.items():
+        print(f"{name:<20} {ms:8.2f} ms (median of {args.repeat})")
+    return results
+
+
+def main():
+    today = date.today()
+    with app.app_context():
+        # The models' schema without the lookup indexes. It already has every
+        # column later migrations add, so it is stamped at HEAD and only the
+        # indexes are applied below, rather than replaying migrations over it.
+        db.create_all()
+        with db.engine.begin() as conn:
+            for statement in migrations._lookup_indexes(conn.dialect.name):
+                name = statement.split()[5]
+                conn.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+            migrations.schema_version.create(conn, checkfirst=True)
+            migrations._stamp(conn, migrations.HEAD, 'Benchmark schema without lookup indexes')
+            counts = generate(conn, args.users, args.habits, args.subjects, args.days, end=today)
+        print('Seeded:', ', '.join(f'{k}={v}' for k, v in counts.items()))
+
+        user_id = db.session.execute(db.text('SELECT max(id) FROM "user"')).scalar()
+        before = report('Before migrations', user_id, today)
+
+        start = time.perf_counter()
+        with db.engine.begin() as conn:
+            for statement in migrations._lookup_indexes(conn.dialect.name):
+                conn.exec_driver_sql(statement)
+        print(f"\nCreated the migration 2 indexes in {time.perf_counter() - start:.2f}s")
+        if db.engine.dialect.name == 'sqlite':
+            with db.engine.begin() as conn:
+                conn.exec_driver_sql('ANALYZE')
+
+        after = report('After migrations', user_id, today)
+
+        print('\n=== Speedup ===')
+        for name in before:
+            print(f"{name:<20} {before[name]:8.2f} -> {after[name]:8.2f} ms  ({before[name] / max(after[name], 1e-6):.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
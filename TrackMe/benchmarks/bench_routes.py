@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+Route benchmark over a large synthetic dataset.
+
+Seeds N users x M habits x D days of logs and attendance (with streaks,
+rollups and calendar bitmaps rebuilt from them), then drives the main
+pages and APIs through Flask's test client (in-process, with SQL statement
+counts) and through a local WSGI server over HTTP (with concurrent clients).
+Reports p50/p95/p99 latency, queries per request and throughput, and writes
+the results as JSON so runs can be compared between commits. In-process
+numbers are taken with the response cache emptied before each request and
+again with it warm; the HTTP run measures the warm cache.
+
+    python benchmarks/bench_routes.py --output results/head.json
+    python benchmarks/bench_routes.py --database-url postgresql://localhost/trackme_bench
+    python benchmarks/bench_routes.py --compare results/base.json results/head.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROUTES = [
+    '/',
+    '/habits',
+    '/attendance',
+    '/api/chart-data/week',
+    '/api/chart-data/month',
+    '/api/chart-data/year',
+    '/api/attendance-stats',
+    '/api/scores',
+    '/api/sync',
+]
+
+PASSWORD = 'bench'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Empty database to use (default: temporary SQLite file)')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=20)
+    parser.add_argument('--subjects', type=int, default=9)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent HTTP clients')
+    parser.add_argument('--no-http', action='store_true', help='Skip the WSGI server run')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='Compare two result files and exit')
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        'p50_ms': round(pick(50), 3),
+        'p95_ms': round(pick(95), 3),
+        'p99_ms': round(pick(99), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+    }
+
+
+def _sample(app, client, route, requests, cold):
+    """Time `requests` GETs of a route; with `cold`, the response cache is emptied before each."""
+    from queries import count_queries
+    from cache import response_cache
+
+    samples, queries = [], []
+    for _ in range(requests):
+        if cold:
+            response_cache.backend.clear()
+        with app.app_context(), count_queries() as counter:
+            start = time.perf_counter()
+            response = client.get(route)
+            samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (route, response.status_code)
+        queries.append(counter.count)
+    total_s = sum(samples) / 1000
+    return {
+        **percentiles(samples),
+        'queries_per_request': round(statistics.fmean(queries), 2),
+        'throughput_rps': round(requests / total_s, 1) if total_s else None,
+    }
+
+
+def run_test_client(app, user_id, requests):
+    """
+    Sequential in-process requests with SQL statement counts. The headline
+    numbers are cold (response cache emptied before every request), so they
+    measure the handlers; `warm` has the same for cache hits.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    results = {}
+    for route in ROUTES:
+        client.get(route)  # Warm up imports, the engine and the query caches
+        results[route] = _sample(app, client, route, requests, cold=True)
+        results[route]['warm'] = _sample(app, client, route, requests, cold=False)
+    return results
+
+
+def run_http(app, username, requests, concurrency):
+    """Concurrent requests against a threaded local WSGI server, response cache warm."""
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    def opener():
+        jar = CookieJar()
+        o = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        body = urllib.parse.urlencode({'username': username, 'password': PASSWORD}).encode()
+        o.open(base + '/login', data=body).read()
+        return o
+
+    results = {}
+    try:
+        # Logging in hashes the password; keep it out of the timed section
+        clients = [opener() for _ in range(concurrency)]
+        for route in ROUTES:
+            samples = []
+            lock = threading.Lock()
+            per_client = max(1, requests // concurrency)
+
+            def worker(o):
+                local = []
+                for _ in range(per_client):
+                    start = time.perf_counter()
+                    o.open(base + route).read()
+                    local.append((time.perf_counter() - start) * 1000)
+                with lock:
+                    samples.extend(local)
+
+            workers = [threading.Thread(target=worker, args=(o,)) for o in clients]
+            start = time.perf_counter()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            elapsed = time.perf_counter() - start
+            results[route] = {**percentiles(samples), 'throughput_rps': round(len(samples) / elapsed, 1)}
+    finally:
+        server.shutdown()
+    return results
+
+
+def compare(base_path, head_path):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(head_path) as f:
+        head = json.load(f)
+    for mode in ('test_client', 'http'):
+        if mode not in base or mode not in head:
+            continue
+        print(f"\n{mode}: p95 ms (base -> head), queries/request")
+        for route in ROUTES:
+            b, h = base[mode].get(route), head[mode].get(route)
+            if not b or not h:
+                continue
+            change = (h['p95_ms'] - b['p95_ms']) / b['p95_ms'] * 100 if b['p95_ms'] else 0
+            queries = f"  {b.get('queries_per_request', '-')} -> {h.get('queries_per_request', '-')}" if mode == 'test_client' else ''
+            print(f"  {route:<24} {b['p95_ms']:9.2f} -> {h['p95_ms']:9.2f}  ({change:+.1f}%){queries}")
+            if 'warm' in b and 'warm' in h:
+                print(f"  {'  warm':<24} {b['warm']['p95_ms']:9.2f} -> {h['warm']['p95_ms']:9.2f}"
+                      f"  {b['warm']['queries_per_request']} -> {h['warm']['queries_per_request']}")
+
+
+def print_table(title, results):
+    print(f"\n=== {title} ===")
+    print(f"  {'route':<24} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'queries':>8}")
+    for route, r in results.items():
+        rows = [(route, r)] + ([('  warm', r['warm'])] if 'warm' in r else [])
+        for label, row in rows:
+            print(f"  {label:<24} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f} "
+                  f"{row['throughput_rps']:8.1f} {row.get('queries_per_request', ''):>8}")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ.setdefault('SECRET_KEY', 'bench')
+
+    from app import app
+    from models import db, User
+    import migrations
+    import streaks
+    import summaries
+    import calendars
+    from auth import set_password
+    from benchmarks.dataset import generate
+
+    with app.app_context():
+        migrations.upgrade()
+        start = time.perf_counter()
+        with db.engine.begin() as conn:
+            counts = generate(conn, args.users, args.habits, args.subjects, args.days)
+        streaks.rebuild_streaks()
+        summaries.rebuild_summaries()
+        calendars.rebuild_calendars()
+        seed_s = time.perf_counter() - start
+
+        user = User.query.order_by(User.id.desc()).first()
+        set_password(user, PASSWORD)
+        db.session.commit()
+        user_id, username = user.id, user.username
+        dialect = db.engine.dialect.name
+
+    print('Seeded in %.1fs: %s' % (seed_s, ', '.join(f'{k}={v}' for k, v in counts.items())))
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'database': dialect,
+        'dataset': counts,
+        'requests_per_route': args.requests,
+        'test_client': run_test_client(app, user_id, args.requests),
+    }
+    print_table('Flask test client, cold cache (warm below each route)', results['test_client'])
+
+    if not args.no_http:
+        results['concurrency'] = args.concurrency
+        results['http'] = run_http(app, username, args.requests, args.concurrency)
+        print_table(f'WSGI server, {args.concurrency} clients, warm cache', results['http'])
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Cold-start benchmark for the serverless entry point.
+
+Each run starts a fresh interpreter, imports api/index.py the way the Vercel
+runtime does, and serves a first request: the login page (no database), then
+a logged-in dashboard (first connection and queries). Reports the median and
+worst time for each phase so startup changes can be compared between commits.
+
+    python benchmarks/bench_startup.py --runs 20
+    python benchmarks/bench_startup.py --env SERVERLESS=1 --env DB_POOLER=external
+    python benchmarks/bench_startup.py --database-url postgresql://localhost/trackme_bench
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints one JSON line of timings in ms
+CHILD = r'''
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, %(root)r)
+from api.index import app
+imported = time.perf_counter()
+client = app.test_client()
+assert client.get('/login').status_code == 200
+first = time.perf_counter()
+with client.session_transaction() as session:
+    session['user_id'] = %(user_id)d
+assert client.get('/').status_code == 200
+dashboard = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_response_ms': (first - imported) * 1000,
+    'first_query_ms': (dashboard - first) * 1000,
+    'total_ms': (dashboard - start) * 1000,
+}))
+'''
+
+SETUP = '''
+import migrations
+from app import app
+from models import db, User
+with app.app_context():
+    migrations.upgrade()
+    user = User.query.filter_by(username='startup').first() or User(username='startup')
+    db.session.add(user)
+    db.session.commit()
+    print(user.id)
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Database to use (default: temporary SQLite file)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='Extra environment for each run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    env = dict(os.environ)
+    env['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db')
+    env.setdefault('SECRET_KEY', 'startup')
+    env.update(item.split('=', 1) for item in args.env)
+
+    # Schema creation and the user are set up once; neither is part of a cold start
+    user_id = int(subprocess.run([sys.executable, '-c', SETUP], cwd=ROOT, env=env,
+                                 check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run([sys.executable, '-c', CHILD % {'root': ROOT, 'user_id': user_id}], cwd=ROOT, env=env,
+                             check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{args.runs} cold starts{' with ' + ' '.join(args.env) if args.env else ''}")
+    print(f"  {'phase':<20} {'median':>9} {'max':>9}")
+    for phase in ('import_ms', 'first_response_ms', 'first_query_ms', 'total_ms'):
+        samples = [r[phase] for r in runs]
+        print(f"  {phase:<20} {statistics.median(samples):9.1f} {max(samples):9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+Write-throughput benchmark for toggle_habit and mark_attendance per
+database profile (see profiles.py).
+
+For each profile a fresh database is set up, then --processes worker
+processes with --threads threads each post set-state toggles and attendance
+marks concurrently, every thread as its own user, the way a class marks
+attendance at the start of a lecture. Reports requests per second and
+p50/p95 latency per route, so profiles and settings can be compared.
+
+    python benchmarks/bench_writes.py
+    python benchmarks/bench_writes.py --profiles dev gunicorn --processes 4 --threads 4
+    python benchmarks/bench_writes.py --env WRITE_BATCHING=1
+    python benchmarks/bench_writes.py --env SQLITE_JOURNAL_MODE=DELETE --env SQLITE_SYNCHRONOUS=FULL
+    python benchmarks/bench_writes.py --database-url postgresql://localhost/trackme_bench
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from profiles import PROFILES  # noqa: E402
+
+# Creates one user with habits and subjects per thread; prints their ids as JSON
+SETUP = r'''
+import json, sys, uuid
+import migrations
+from app import app
+from models import db, User, Habit, Subject
+users, habits, subjects = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+run = uuid.uuid4().hex[:8]
+with app.app_context():
+    migrations.upgrade()
+    ids = []
+    for n in range(users):
+        user = User(username=f'writes-{run}-{n}')
+        db.session.add(user)
+        db.session.flush()
+        hs = [Habit(name=f'Habit {i}', is_recurring=True, user_id=user.id) for i in range(habits)]
+        ss = [Subject(name=f'Subject {i}', user_id=user.id) for i in range(subjects)]
+        db.session.add_all(hs + ss)
+        db.session.flush()
+        ids.append({'user': user.id, 'habits': [h.id for h in hs], 'subjects': [s.id for s in ss]})
+    db.session.commit()
+print(json.dumps(ids))
+'''
+
+# One worker process: a thread per user posting writes; prints timings as JSON
+WORKER = r'''
+import json, sys, threading, time
+from datetime import date, timedelta
+from app import app
+from batching import write_batcher
+accounts, requests = json.loads(sys.argv[1]), int(sys.argv[2])
+samples = {'toggle': [], 'mark': []}
+lock = threading.Lock()
+
+def hammer(account):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = account['user']
+    local = {'toggle': [], 'mark': []}
+    for i in range(requests):
+        day = (date.today() - timedelta(days=i // 2)).isoformat()
+        start = time.perf_counter()
+        if i % 2:
+            kind = 'mark'
+            response = client.post('/mark-attendance', json={
+                'subject_id': account['subjects'][i % len(account['subjects'])],
+                'status': 'Present' if i % 3 else 'Absent', 'date': day})
+        else:
+            kind = 'toggle'
+            response = client.post(f"/toggle/{account['habits'][i % len(account['habits'])]}",
+                                   json={'completed': i % 4 == 0, 'date': day})
+        assert response.status_code == 200, response.status_code
+        local[kind].append((time.perf_counter() - start) * 1000)
+    with lock:
+        for kind in local:
+            samples[kind].extend(local[kind])
+
+threads = [threading.Thread(target=hammer, args=(a,)) for a in accounts]
+started = time.time()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+write_batcher.flush()
+print(json.dumps({'started': started, 'finished': time.time(), 'samples': samples}))
+'''
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Database to use for every profile (default: a temporary SQLite file each)')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument('--processes', type=int, default=2, help='Worker processes, as gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='Threads (users) per process')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per thread')
+    parser.add_argument('--habits', type=int, default=8)
+    parser.add_argument('--subjects', type=int, default=8)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='Extra environment for every run')
+    parser.add_argument('--output', help='Write results JSON here')
+    return parser.parse_args()
+
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def run_profile(profile, args):
+    env = dict(os.environ)
+    env['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), f'writes-{profile}.db')
+    env.setdefault('SECRET_KEY', 'bench-writes')
+    env['DB_PROFILE'] = profile
+    env.pop('VERCEL', None)
+    env.update(item.split('=', 1) for item in args.env)
+
+    users = args.processes * args.threads
+    out = subprocess.run([sys.executable, '-c', SETUP, str(users), str(args.habits), str(args.subjects)],
+                         cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    accounts = json.loads(out.strip().splitlines()[-1])
+
+    workers = [
+        subprocess.Popen([sys.executable, '-c', WORKER,
+                          json.dumps(accounts[i * args.threads:(i + 1) * args.threads]), str(args.requests)],
+                         cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+        for i in range(args.processes)
+    ]
+    runs = []
+    for worker in workers:
+        out, _ = worker.communicate()
+        if worker.returncode:
+            raise SystemExit(f'{profile}: worker failed')
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+
+    elapsed = max(r['finished'] for r in runs) - min(r['started'] for r in runs)
+    result = {'elapsed_s': round(elapsed, 3)}
+    for kind in ('toggle', 'mark'):
+        samples = sorted(s for r in runs for s in r['samples'][kind])
+        result[kind] = {
+            'requests': len(samples),
+            'p50_ms': round(percentile(samples, 50), 2),
+            'p95_ms': round(percentile(samples, 95), 2),
+            'mean_ms': round(statistics.fmean(samples), 2),
+        }
+    result['throughput_rps'] = round((result['toggle']['requests'] + result['mark']['requests']) / elapsed, 1)
+    return result
+
+
+def main():
+    args = parse_args()
+    results = {profile: run_profile(profile, args) for profile in args.profiles}
+
+    print(f"{args.processes} processes x {args.threads} threads x {args.requests} requests"
+          f"{' with ' + ' '.join(args.env) if args.env else ''}")
+    print(f"  {'profile':<12} {'req/s':>8} {'toggle p50':>11} {'p95':>8} {'mark p50':>9} {'p95':>8}")
+    for profile, r in results.items():
+        print(f"  {profile:<12} {r['throughput_rps']:8.1f} {r['toggle']['p50_ms']:11.2f} {r['toggle']['p95_ms']:8.2f}"
+              f" {r['mark']['p50_ms']:9.2f} {r['mark']['p95_ms']:8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
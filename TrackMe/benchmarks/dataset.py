@@ -0,0 +1,105 @@
+"""
+Synthetic dataset generator for benchmarks.
+
+Bulk-inserts users, habits, daily logs, subjects, timetable slots and
+attendance records with Core executemany statements so that large volumes
+load in seconds.
+
+    DATABASE_URL=sqlite:////tmp/big.db python -m benchmarks.dataset --users 100 --habits 20 --days 1095
+"""
+import argparse
+import random
+from datetime import date, time, timedelta
+from models import db, User, Habit, DailyLog, Subject, AttendanceRecord, TimetableSlot
+
+BATCH_SIZE = 10000
+
+
+def _insert(conn, table, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        conn.execute(table.insert(), rows[i:i + BATCH_SIZE])
+
+
+def generate(conn, users=10, habits=15, subjects=9, days=365, completion=0.7, seed=42, end=None):
+    """
+    Insert `users` users, each with `habits` recurring habits and `subjects`
+    subjects, and `days` days of logs and attendance ending at `end` (today).
+    Returns row counts per table.
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    dates = [end - timedelta(days=i) for i in range(days)]
+
+    _insert(conn, User.__table__, [{'username': f'bench_user_{u}'} for u in range(users)])
+    user_ids = [row.id for row in conn.execute(db.select(User.id).order_by(User.id))][-users:]
+
+    _insert(conn, Habit.__table__, [
+        {'name': f'Habit {h}', 'is_recurring': True, 'target_date': None, 'user_id': uid}
+        for uid in user_ids for h in range(habits)
+    ])
+    _insert(conn, Subject.__table__, [
+        {'name': f'Subject {s}', 'user_id': uid}
+        for uid in user_ids for s in range(subjects)
+    ])
+
+    habit_ids = [row.id for row in conn.execute(db.select(Habit.id).where(Habit.user_id.in_(user_ids)))]
+    subject_rows = conn.execute(db.select(Subject.id, Subject.user_id).where(Subject.user_id.in_(user_ids)).order_by(Subject.id)).all()
+    subject_ids = [row.id for row in subject_rows]
+
+    # Every subject meets once each weekday, matching the attendance below
+    slots = [
+        {'user_id': row.user_id, 'subject_id': row.id, 'weekday': weekday,
+         'start_time': time(8 + i % 12), 'end_time': time(9 + i % 12), 'is_lab': False}
+        for i, row in enumerate(subject_rows) for weekday in range(5)
+    ]
+    _insert(conn, TimetableSlot.__table__, slots)
+
+    logs = [
+        {'habit_id': hid, 'date': d, 'completed': rng.random() < completion}
+        for hid in habit_ids for d in dates
+    ]
+    _insert(conn, DailyLog.__table__, logs)
+
+    records = [
+        {'subject_id': sid, 'date': d, 'status': 'Present' if rng.random() < 0.8 else 'Absent'}
+        for sid in subject_ids for d in dates if d.weekday() < 5
+    ]
+    _insert(conn, AttendanceRecord.__table__, records)
+
+    return {
+        'users': len(user_ids),
+        'habits': len(habit_ids),
+        'subjects': len(subject_ids),
+        'timetable_slots': len(slots),
+        'daily_logs': len(logs),
+        'attendance_records': len(records),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed DATABASE_URL with synthetic TrackMe data.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--habits', type=int, default=15)
+    parser.add_argument('--subjects', type=int, default=9)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from app import app
+    import migrations
+    import streaks
+    import summaries
+    import calendars
+
+    with app.app_context():
+        migrations.upgrade()
+        with db.engine.begin() as conn:
+            counts = generate(conn, args.users, args.habits, args.subjects, args.days, seed=args.seed)
+        streaks.rebuild_streaks()
+        summaries.rebuild_summaries()
+        calendars.rebuild_calendars()
+    print(', '.join(f'{k}={v}' for k, v in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Concurrency stress test for toggle_habit.
+
+Many threads hammer the same habit and day through the Flask test client.
+Checks that no request fails, that the final state matches the number of
+flips, that each habit and day has at most one DailyLog row, and that the
+incremental streak, daily rollup and calendar bitmap agree with a rebuild
+from DailyLog.
+
+    python benchmarks/stress_toggle.py                          # temporary SQLite file
+    python benchmarks/stress_toggle.py --database-url postgresql://localhost/trackme_stress
+    python benchmarks/stress_toggle.py --batching --durability accepted
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--database-url', help='Empty database to use (default: temporary SQLite file)')
+parser.add_argument('--threads', type=int, default=16)
+parser.add_argument('--requests', type=int, default=50, help='Requests per thread')
+parser.add_argument('--batching', action='store_true', help='Queue toggles through the write batcher')
+parser.add_argument('--durability', choices=['commit', 'accepted'], default='commit')
+args = parser.parse_args()
+
+if args.batching:
+    os.environ['WRITE_BATCHING'] = '1'
+    os.environ['WRITE_DURABILITY'] = args.durability
+
+os.environ['DATABASE_URL'] = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+os.environ.setdefault('SECRET_KEY', 'stress-test')
+
+from app import app  # noqa: E402  (needs DATABASE_URL)
+from batching import write_batcher  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from models import db, User, Habit, DailyLog, HabitStreak, DailyHabitSummary, HabitCalendar  # noqa: E402
+import migrations  # noqa: E402
+import streaks  # noqa: E402
+import summaries  # noqa: E402
+import calendars  # noqa: E402
+
+
+def snapshot():
+    return (
+        # A habit never completed may have no streak row incrementally; a rebuild writes zeros
+        {(s.habit_id, s.current_streak, s.longest_streak, s.last_completed) for s in HabitStreak.query
+         if s.last_completed},
+        {(s.user_id, s.date, s.active_habits, s.completed_habits) for s in DailyHabitSummary.query},
+        # Cleared bitmaps stay as all-zero rows incrementally; a rebuild omits them
+        {(c.habit_id, c.year, calendars.to_int(c.bits)) for c in HabitCalendar.query if calendars.to_int(c.bits)},
+    )
+
+
+def hammer(user_id, habit_ids, statuses, body_for):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    for i in range(args.requests):
+        habit_id = habit_ids[i % len(habit_ids)]
+        response = client.post(f'/toggle/{habit_id}', json=body_for(i))
+        statuses[response.status_code] += 1
+
+
+def run(label, user_id, habit_ids, body_for):
+    statuses = Counter()
+    threads = [threading.Thread(target=hammer, args=(user_id, habit_ids, statuses, body_for)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    write_batcher.flush()
+    elapsed = time.perf_counter() - started
+    print(f"{label}: {dict(statuses)} in {elapsed:.2f}s ({sum(statuses.values()) / elapsed:.0f} req/s)")
+    return statuses
+
+
+def main():
+    with app.app_context():
+        migrations.upgrade()
+        user = User(username='stress')
+        db.session.add(user)
+        db.session.commit()
+        habits = [Habit(name=f'Stress {i}', is_recurring=True, user_id=user.id) for i in range(3)]
+        db.session.add_all(habits)
+        db.session.commit()
+        habit_ids = [h.id for h in habits]
+        user_id = user.id
+
+    ok = True
+    flips = run('flip same habit', user_id, habit_ids[:1], lambda i: {})
+    with app.app_context():
+        # Flips that cancel out within one batch never write a row
+        log = DailyLog.query.filter_by(habit_id=habit_ids[0]).first()
+        completed = bool(log and log.completed)
+        expected = flips[200] % 2 == 1
+        print(f"  final state {completed}, expected {expected}")
+        ok &= flips[200] == args.threads * args.requests and completed == expected
+
+    sets = run('set-state across habits', user_id, habit_ids, lambda i: {'completed': i % 2 == 0})
+    ok &= sets[200] == args.threads * args.requests
+
+    with app.app_context():
+        duplicates = db.session.query(DailyLog.habit_id, DailyLog.date).group_by(
+            DailyLog.habit_id, DailyLog.date).having(func.count() > 1).count()
+        print(f"  (habit, day) pairs with more than one log: {duplicates}")
+        ok &= duplicates == 0
+
+    with app.app_context():
+        incremental = snapshot()
+        streaks.rebuild_streaks()
+        summaries.rebuild_summaries()
+        calendars.rebuild_calendars()
+        rebuilt = snapshot()
+        print(f"  streaks/rollup/calendars match rebuild: {incremental == rebuilt}")
+        ok &= incremental == rebuilt
+
+    print('PASS' if ok else 'FAIL')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
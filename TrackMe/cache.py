@@ -0,0 +1,221 @@
+"""
+Response cache for the analytics endpoints.
+
+Cached JSON bodies are keyed by user, namespace and request parameters. Each
+(user, namespace) pair carries a generation number that writes bump, so a
+toggle invalidates only that user's habit analytics and an attendance mark only
+their attendance analytics. Responses carry an ETag and honour If-None-Match.
+
+Invalidation is only as wide as the backend. Set CACHE_URL to a redis:// URL
+to share the cache between workers and instances (requires the `redis`
+package). Without it the cache is an in-process LRU with a TTL, which only
+the one-process `dev` DB_PROFILE uses: under the gunicorn and serverless
+profiles another process would keep serving (and answering 304 for) bodies
+a write had invalidated, so those run uncached.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from flask import Response, request
+
+HABITS = 'habits'
+ATTENDANCE = 'attendance'
+
+
+class MemoryBackend:
+    """Thread-safe LRU cache with per-entry expiry."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def generation(self, name):
+        with self._lock:
+            return self._generations.get(name, 0)
+
+    def bump(self, name):
+        with self._lock:
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NullBackend:
+    """Caches nothing: every request computes its body."""
+
+    evictions = 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def generation(self, name):
+        return 0
+
+    def bump(self, name):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class RedisBackend:
+    """Backend for a Redis-compatible server; entries expire after `ttl` seconds."""
+
+    def __init__(self, url, ttl=300, prefix='trackme:'):
+        import redis  # Optional dependency, only needed when CACHE_URL is set
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0  # Redis evicts on its own; not observable per client
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def generation(self, name):
+        raw = self.client.get(self.prefix + 'gen:' + name)
+        return int(raw) if raw is not None else 0
+
+    def bump(self, name):
+        self.client.incr(self.prefix + 'gen:' + name)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '[!g]*'))
+
+
+class ResponseCache:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.hits = 0
+        self.misses = 0
+        self.user_counts = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        url = app.config.get('CACHE_URL')
+        ttl = app.config.get('CACHE_TTL', 300)
+        if url:
+            self.backend = RedisBackend(url, ttl=ttl)
+        elif app.config.get('DB_PROFILE', 'dev') == 'dev':
+            self.backend = MemoryBackend(maxsize=app.config.get('CACHE_MAXSIZE', 1024), ttl=ttl)
+        else:
+            # Several processes: an in-process cache would miss their invalidations
+            self.backend = NullBackend()
+        app.extensions['response_cache'] = self
+
+    def _count(self, user_id, outcome):
+        with self._lock:
+            if outcome == 'hits':
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.user_counts.setdefault(user_id, Counter())[outcome] += 1
+
+    def _key(self, user_id, namespace, parts):
+        # A response built from several namespaces depends on each generation
+        namespaces = namespace if isinstance(namespace, tuple) else (namespace,)
+        generations = [self.backend.generation(f'{user_id}:{name}') for name in namespaces]
+        raw = json.dumps([user_id, namespaces, generations, parts], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def json(self, user_id, namespace, parts, compute):
+        """
+        Return a JSON response for `compute()`, serving it from the cache when
+        possible. `parts` identifies the request (endpoint and parameters);
+        `namespace` may be a tuple when the body depends on several.
+        Answers 304 when the client's If-None-Match matches the ETag.
+        """
+        key = self._key(user_id, namespace, parts)
+        entry = self.backend.get(key)
+        if entry is None:
+            self._count(user_id, 'misses')
+            body = json.dumps(compute(), sort_keys=True)
+            entry = {'body': body, 'etag': hashlib.md5(body.encode()).hexdigest()}
+            self.backend.set(key, entry)
+        else:
+            self._count(user_id, 'hits')
+
+        response = Response(entry['body'], mimetype='application/json')
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+
+    def invalidate(self, user_id, namespace):
+        """Drop every cached response for a user's namespace."""
+        self.backend.bump(f'{user_id}:{namespace}')
+
+    def user_stats(self, user_id):
+        """This process's hits and misses for one user's requests."""
+        counts = self.user_counts.get(user_id, Counter())
+        return {
+            'hits': counts['hits'],
+            'misses': counts['misses'],
+            'backend': type(self.backend).__name__,
+        }
+
+    def stats(self):
+        """Totals for the whole process, for /metrics."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+            'size': len(self.backend)
+        }
+
+
+response_cache = ResponseCache()
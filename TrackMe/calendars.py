@@ -0,0 +1,206 @@
+"""
+Per-habit, per-year completion bitmaps for the calendar heatmap.
+
+Each HabitCalendar row packs a habit's year into 366 bits (46 bytes): bit n
+is set when the habit was completed on day n of the year, counting 1 January
+as day 0. Toggles flip one bit next to the DailyLog write, so a year view
+reads one small row per habit instead of a row per day. Counts, the heatmap
+and streaks within the year are worked out with integer bit operations.
+"""
+import calendar as _calendar
+from datetime import date
+from itertools import groupby
+from models import db, Habit, DailyLog, HabitCalendar
+from upserts import dialect_insert
+
+YEAR_BYTES = 46  # 366 bits, rounded up
+
+# Rows per INSERT when filling in missing years
+FILL_CHUNK = 1000
+
+
+def _day_index(day):
+    return (day - date(day.year, 1, 1)).days
+
+
+def days_in_year(year):
+    return 366 if _calendar.isleap(year) else 365
+
+
+def to_int(raw):
+    return int.from_bytes(raw or b'', 'little')
+
+
+def to_bytes(bits):
+    return bits.to_bytes(YEAR_BYTES, 'little')
+
+
+def _logged_bits(habit_id, year):
+    """Build one habit's bitmap for a year from its completed logs."""
+    bits = 0
+    for row in db.session.query(DailyLog.date).filter(
+        DailyLog.habit_id == habit_id,
+        DailyLog.completed == True,
+        DailyLog.date >= date(year, 1, 1),
+        DailyLog.date <= date(year, 12, 31)
+    ):
+        bits |= 1 << _day_index(row.date)
+    return bits
+
+
+def _get_or_create(habit_id, year):
+    """
+    Fetch the habit's bitmap for a year, locked for update. A new row starts
+    from the logs already stored for that year (history from before bitmaps).
+    """
+    created = db.session.execute(
+        dialect_insert(HabitCalendar).values(
+            habit_id=habit_id, year=year, bits=to_bytes(0)
+        ).on_conflict_do_nothing(index_elements=['habit_id', 'year'])
+    ).rowcount
+    calendar = HabitCalendar.query.filter_by(habit_id=habit_id, year=year).populate_existing().with_for_update().one()
+    if created:
+        calendar.bits = to_bytes(_logged_bits(habit_id, year))
+    return calendar
+
+
+def record_toggle(habit_id, day, completed):
+    """Set or clear the habit's bit for `day`. Caller commits."""
+    calendar = _get_or_create(habit_id, day.year)
+    mask = 1 << _day_index(day)
+    bits = to_int(calendar.bits)
+    calendar.bits = to_bytes(bits | mask if completed else bits & ~mask)
+    return calendar
+
+
+def recount(habit_years):
+    """Set the bitmaps of (habit_id, year) pairs from their logs, e.g. after an import. Caller commits."""
+    for habit_id, year in sorted(habit_years):
+        calendar = _get_or_create(habit_id, year)
+        calendar.bits = to_bytes(_logged_bits(habit_id, year))
+
+
+def load_bits(habit_ids, year):
+    """Return {habit_id: bitmap int} for a year; habits without a row map to 0."""
+    if not habit_ids:
+        return {}
+    rows = HabitCalendar.query.filter(
+        HabitCalendar.habit_id.in_(habit_ids),
+        HabitCalendar.year == year
+    )
+    bits = {habit_id: 0 for habit_id in habit_ids}
+    bits.update({row.habit_id: to_int(row.bits) for row in rows})
+    return bits
+
+
+def longest_run(bits):
+    """Length of the longest run of set bits: each AND with a shift trims every run by one."""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def run_ending_at(bits, index):
+    """Length of the run of set bits ending at `index` (0 if that bit is clear)."""
+    if not (bits >> index) & 1:
+        return 0
+    clear_below = ~bits & ((1 << (index + 1)) - 1)
+    return index + 1 - clear_below.bit_length()
+
+
+def year_view(bits, year, today):
+    """Heatmap and stats for one habit's year. Streaks do not cross the year boundary."""
+    days = days_in_year(year)
+    bits &= (1 << days) - 1
+    if year == today.year:
+        current = run_ending_at(bits, _day_index(today))
+    else:
+        current = 0
+    return {
+        'year': year,
+        'days': [(bits >> i) & 1 for i in range(days)],
+        'completed': bits.bit_count(),
+        'longestStreak': longest_run(bits),
+        'currentStreak': current,
+    }
+
+
+def combined_days(bitmaps, year):
+    """Habits completed per day across several bitmaps, for a combined heatmap."""
+    counts = [0] * days_in_year(year)
+    for bits in bitmaps:
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            if index < len(counts):
+                counts[index] += 1
+            bits ^= low
+    return counts
+
+
+def rebuild_calendars(user_id=None):
+    """
+    Recreate HabitCalendar from completed DailyLog rows in one ordered,
+    streamed scan. Restrict to one user's habits when user_id is given.
+    Toggles committed while it runs can be lost, so this is for repairs, not
+    scheduled runs. Returns the number of rows written.
+    """
+    log_query = db.session.query(DailyLog.habit_id, DailyLog.date).join(Habit).filter(
+        DailyLog.completed == True
+    )
+    delete_query = HabitCalendar.query
+    if user_id is not None:
+        log_query = log_query.filter(Habit.user_id == user_id)
+        delete_query = delete_query.filter(
+            HabitCalendar.habit_id.in_(db.session.query(Habit.id).filter(Habit.user_id == user_id))
+        )
+
+    rows = []
+    ordered = log_query.order_by(DailyLog.habit_id, DailyLog.date).yield_per(10000)
+    for (habit_id, year), group in groupby(ordered, key=lambda row: (row.habit_id, row.date.year)):
+        bits = 0
+        for row in group:
+            bits |= 1 << _day_index(row.date)
+        rows.append({'habit_id': habit_id, 'year': year, 'bits': to_bytes(bits)})
+
+    delete_query.delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(HabitCalendar, rows)
+    db.session.commit()
+    return len(rows)
+
+
+def fill_calendars(user_id=None):
+    """
+    Add bitmaps for habit years that have completions but no HabitCalendar
+    row yet (history from before bitmaps, imports). Existing rows are left
+    alone, and a row a toggle creates meanwhile wins over ours. Returns
+    {user_id: rows added}.
+    """
+    existing = db.session.query(HabitCalendar.habit_id, HabitCalendar.year)
+    log_query = db.session.query(DailyLog.habit_id, DailyLog.date, Habit.user_id).join(Habit).filter(
+        DailyLog.completed == True
+    )
+    if user_id is not None:
+        existing = existing.join(Habit).filter(Habit.user_id == user_id)
+        log_query = log_query.filter(Habit.user_id == user_id)
+    existing = set(existing.all())
+
+    rows = []
+    added = {}
+    ordered = log_query.order_by(DailyLog.habit_id, DailyLog.date).yield_per(10000)
+    for (habit_id, year), group in groupby(ordered, key=lambda row: (row.habit_id, row.date.year)):
+        if (habit_id, year) in existing:
+            continue
+        bits = 0
+        for row in group:
+            bits |= 1 << _day_index(row.date)
+        rows.append({'habit_id': habit_id, 'year': year, 'bits': to_bytes(bits)})
+        added[row.user_id] = added.get(row.user_id, 0) + 1
+
+    stmt = dialect_insert(HabitCalendar).on_conflict_do_nothing(index_elements=['habit_id', 'year'])
+    for start in range(0, len(rows), FILL_CHUNK):
+        db.session.execute(stmt, rows[start:start + FILL_CHUNK])
+    db.session.commit()
+    return added
@@ -0,0 +1,158 @@
+"""
+Completion chart aggregation.
+
+Every period is answered by a fixed number of grouped queries: the bar/line
+series and completion rates come from the DailyHabitSummary rollup bucketed by
+day or by month, and the per-habit pie breakdown from one GROUP BY over
+DailyLog and ArchivedHabit. Buckets are zero-filled in Python.
+"""
+import calendar
+from datetime import date, timedelta
+from sqlalchemy import func, extract, select, union_all
+from models import db, Habit, DailyLog, DailyHabitSummary, ArchivedHabit
+
+# Ranges longer than this are bucketed by month unless a bucket is requested
+MAX_DAILY_BUCKETS = 62
+# No series has more buckets than this, whichever bucket size is used
+MAX_BUCKETS = 1000
+
+
+def period_range(period, today, month=None, year=None, start=None, end=None):
+    """
+    Resolve a chart period into (start, end, bucket). Returns None if unknown.
+    Raises ValueError for a month outside 1-12, a year outside 1-9999 or a
+    range that ends before it starts.
+    """
+    if period == 'week':
+        return today - timedelta(days=6), today, 'day'
+    if period in ('month', 'year') and not 1 <= year <= 9999:
+        raise ValueError('year must be between 1 and 9999')
+    if period == 'month':
+        if not 1 <= month <= 12:
+            raise ValueError('month must be between 1 and 12')
+        num_days = calendar.monthrange(year, month)[1]
+        return date(year, month, 1), date(year, month, num_days), 'day'
+    if period == 'year':
+        return date(year, 1, 1), date(year, 12, 31), 'month'
+    if period == 'range' and start and end:
+        if start > end:
+            raise ValueError('start must not be after end')
+        bucket = 'day' if (end - start).days < MAX_DAILY_BUCKETS else 'month'
+        return start, end, bucket
+    return None
+
+
+def bucket_count(start, end, bucket):
+    """How many day or month buckets cover [start, end]."""
+    if bucket == 'day':
+        return (end - start).days + 1
+    return (end.year - start.year) * 12 + end.month - start.month + 1
+
+
+def _day_buckets(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _month_buckets(start, end):
+    buckets = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        buckets.append((year, month))
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return buckets
+
+
+def _bucket_keys(column, bucket):
+    if bucket == 'day':
+        return [column]
+    return [extract('year', column), extract('month', column)]
+
+
+def _bucket_key(row, bucket):
+    return row[0] if bucket == 'day' else (int(row[0]), int(row[1]))
+
+
+def summary_rows(user_id, start, end, bucket):
+    """(bucket, active, completed) totals from the daily rollup."""
+    keys = _bucket_keys(DailyHabitSummary.date, bucket)
+    rows = db.session.query(
+        *keys,
+        func.sum(DailyHabitSummary.active_habits),
+        func.sum(DailyHabitSummary.completed_habits)
+    ).filter(
+        DailyHabitSummary.user_id == user_id,
+        DailyHabitSummary.date >= start,
+        DailyHabitSummary.date <= end
+    ).group_by(*keys).all()
+
+    for row in rows:
+        yield _bucket_key(row, bucket), int(row[-2] or 0), int(row[-1] or 0)
+
+
+def habit_totals(user_id, start, end):
+    """Completed-log counts per habit name over [start, end], archived habits included."""
+    logged = select(
+        Habit.name.label('name'),
+        func.count(DailyLog.id).label('value')
+    ).join(DailyLog).where(
+        Habit.user_id == user_id,
+        DailyLog.date >= start,
+        DailyLog.date <= end,
+        DailyLog.completed == True
+    ).group_by(Habit.name)
+    archived = select(
+        ArchivedHabit.name.label('name'),
+        func.count(ArchivedHabit.habit_id).label('value')
+    ).where(
+        ArchivedHabit.user_id == user_id,
+        ArchivedHabit.target_date >= start,
+        ArchivedHabit.target_date <= end,
+        ArchivedHabit.completed == True
+    ).group_by(ArchivedHabit.name)
+    combined = union_all(logged, archived).subquery()
+    rows = db.session.query(
+        combined.c.name,
+        func.sum(combined.c.value)
+    ).group_by(combined.c.name).all()
+    return [(name, int(value)) for name, value in rows]
+
+
+def completion_series(user_id, start, end, bucket, label_style=None):
+    """
+    Build bar, completion-rate and pie series for [start, end].
+    label_style picks the bar labels: 'weekday' ("Mon 12"), 'day' ("12"),
+    'month' ("Jan") or None for a style that is unambiguous across years.
+    """
+    if bucket == 'day':
+        buckets = _day_buckets(start, end)
+    else:
+        buckets = _month_buckets(start, end)
+
+    totals = {key: (0, 0) for key in buckets}
+    for key, active, completed in summary_rows(user_id, start, end, bucket):
+        if key in totals:
+            totals[key] = (active, completed)
+
+    labels = []
+    for key in buckets:
+        if bucket == 'day':
+            if label_style == 'weekday':
+                labels.append(f"{key.strftime('%a')} {key.day}")
+            elif label_style == 'day':
+                labels.append(str(key.day))
+            else:
+                labels.append(key.isoformat())
+        else:
+            if label_style == 'month':
+                labels.append(calendar.month_abbr[key[1]])
+            else:
+                labels.append(f"{calendar.month_abbr[key[1]]} {key[0]}")
+
+    return {
+        'labels': labels,
+        'data': [totals[key][1] for key in buckets],
+        'rates': [int(done / active * 100) if active else 0 for active, done in totals.values()],
+        'pieData': [{'label': name, 'value': value} for name, value in habit_totals(user_id, start, end)]
+    }
@@ -0,0 +1,208 @@
+"""
+Paginated attendance and habit-log history.
+
+Pages are newest first and keyed on (date, id): the cursor is the last row
+of the previous page, so every page costs the same however far back it is,
+unlike OFFSET. A page is one LIMITed seek joined to the parent on user_id:
+down the (date, id) index for a user-wide page, or the unique (parent, date)
+index for one subject or habit. The statement is the same size however many
+subjects or habits the user has.
+
+Week and month aggregates group by day in the database (one row per day in
+range) and fold the days into buckets here.
+"""
+import calendar
+from datetime import date, timedelta
+from sqlalchemy import or_, case, func
+from models import db, Habit, DailyLog, Subject, AttendanceRecord
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+GROUPS = ('week', 'month')
+# Week and month aggregates cover at most this many buckets (about 19 years of weeks)
+MAX_BUCKETS = 1000
+
+
+def encode_cursor(day, row_id):
+    return f'{day.isoformat()}_{row_id}'
+
+
+def parse_cursor(raw):
+    """(date, id) from a cursor string, or None. Raises ValueError if malformed."""
+    if not raw:
+        return None
+    day, _, row_id = raw.partition('_')
+    return date.fromisoformat(day), int(row_id)
+
+
+def _page(model, parent, parent_column, columns, user_id, parent_id, start, end, cursor, limit):
+    """
+    The user's rows (or one parent's) between start and end, newest first,
+    after `cursor`. Returns up to limit + 1 rows; the extra one says there
+    is another page.
+    """
+    query = db.session.query(*columns).join(parent, parent_column == parent.id).filter(parent.user_id == user_id)
+    if parent_id is not None:
+        query = query.filter(parent_column == parent_id)
+    if start:
+        query = query.filter(model.date >= start)
+    if end:
+        query = query.filter(model.date <= end)
+    if cursor:
+        day, row_id = cursor
+        # Bound on date alone keeps the index range scan; id breaks ties
+        query = query.filter(model.date <= day, or_(model.date < day, model.id < row_id))
+    return query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1).all()
+
+
+def _paginate(rows, limit, item):
+    page = rows[:limit]
+    return {
+        'items': [item(row) for row in page],
+        'nextCursor': encode_cursor(page[-1].date, page[-1].id) if len(rows) > limit else None,
+    }
+
+
+def _owned(model, user_id, parent_id):
+    return db.session.query(model.id).filter(model.id == parent_id, model.user_id == user_id).first() is not None
+
+
+def attendance_page(user_id, subject_id=None, start=None, end=None, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    One page of the user's attendance (or one subject's), newest first:
+    {'items': [...], 'nextCursor': ...}. None if the subject is not theirs.
+    """
+    if subject_id is not None and not _owned(Subject, user_id, subject_id):
+        return None
+    rows = _page(AttendanceRecord, Subject, AttendanceRecord.subject_id,
+                 [AttendanceRecord.id, AttendanceRecord.subject_id, Subject.name, AttendanceRecord.date,
+                  AttendanceRecord.status],
+                 user_id, subject_id, start, end, cursor, limit)
+    return _paginate(rows, limit, lambda row: {
+        'id': row.id,
+        'subjectId': row.subject_id,
+        'subject': row.name,
+        'date': row.date.isoformat(),
+        'status': row.status,
+    })
+
+
+def log_page(user_id, habit_id=None, start=None, end=None, cursor=None, limit=DEFAULT_LIMIT):
+    """One page of the user's habit logs (or one habit's), like attendance_page()."""
+    if habit_id is not None and not _owned(Habit, user_id, habit_id):
+        return None
+    rows = _page(DailyLog, Habit, DailyLog.habit_id,
+                 [DailyLog.id, DailyLog.habit_id, Habit.name, DailyLog.date, DailyLog.completed],
+                 user_id, habit_id, start, end, cursor, limit)
+    return _paginate(rows, limit, lambda row: {
+        'id': row.id,
+        'habitId': row.habit_id,
+        'habit': row.name,
+        'date': row.date.isoformat(),
+        'completed': bool(row.completed),
+    })
+
+
+def _bucket_start(day, group):
+    if group == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _bucket_end(bucket, group):
+    # Clamped so the buckets of December 9999 do not run past date.max
+    if group == 'week':
+        return min(bucket, date.max - timedelta(days=6)) + timedelta(days=6)
+    return bucket.replace(day=calendar.monthrange(bucket.year, bucket.month)[1])
+
+
+def bucket_count(group, start, end):
+    """How many week or month buckets cover [start, end]."""
+    first = _bucket_start(start, group)
+    if group == 'week':
+        return (end - first).days // 7 + 1
+    return (end.year - first.year) * 12 + end.month - first.month + 1
+
+
+def _fold(per_day, group, start, end, empty, add):
+    """
+    Fold {date: counts} into zero-filled buckets from start to end.
+    Raises ValueError if that is more than MAX_BUCKETS buckets.
+    """
+    if not per_day and not (start and end):
+        return []
+    start = start or min(per_day)
+    end = end or max(per_day)
+    if start > end:
+        return []
+    if bucket_count(group, start, end) > MAX_BUCKETS:
+        raise ValueError(f'more than {MAX_BUCKETS} buckets')
+    buckets = {}
+    bucket = _bucket_start(start, group)
+    while True:
+        buckets[bucket] = empty()
+        if _bucket_end(bucket, group) >= end:
+            break
+        bucket = _bucket_end(bucket, group) + timedelta(days=1)
+    for day, counts in per_day.items():
+        add(buckets[_bucket_start(day, group)], counts)
+    return [
+        {'start': max(bucket, start).isoformat(),
+         'end': min(_bucket_end(bucket, group), end).isoformat(),
+         **totals}
+        for bucket, totals in buckets.items()
+    ]
+
+
+def _ranged(query, column, start, end):
+    if start:
+        query = query.filter(column >= start)
+    if end:
+        query = query.filter(column <= end)
+    return query
+
+
+def attendance_buckets(user_id, group, subject_id=None, start=None, end=None):
+    """Present/absent counts and percentage per week or month."""
+    query = db.session.query(
+        AttendanceRecord.date, AttendanceRecord.status, func.count(AttendanceRecord.id)
+    ).join(Subject).filter(Subject.user_id == user_id)
+    if subject_id is not None:
+        query = query.filter(AttendanceRecord.subject_id == subject_id)
+    rows = _ranged(query, AttendanceRecord.date, start, end).group_by(
+        AttendanceRecord.date, AttendanceRecord.status
+    ).all()
+
+    per_day = {}
+    for day, status, count in rows:
+        per_day.setdefault(day, {})[status] = count
+
+    def add(totals, counts):
+        totals['present'] += counts.get('Present', 0)
+        totals['absent'] += counts.get('Absent', 0)
+        totals['total'] = totals['present'] + totals['absent']
+        totals['percentage'] = round(totals['present'] / totals['total'] * 100, 1)
+
+    return _fold(per_day, group, start, end,
+                 lambda: {'present': 0, 'absent': 0, 'total': 0, 'percentage': 0}, add)
+
+
+def log_buckets(user_id, group, habit_id=None, start=None, end=None):
+    """Completed and logged counts per week or month."""
+    query = db.session.query(
+        DailyLog.date,
+        func.count(DailyLog.id),
+        func.sum(case((DailyLog.completed == True, 1), else_=0))
+    ).join(Habit).filter(Habit.user_id == user_id)
+    if habit_id is not None:
+        query = query.filter(DailyLog.habit_id == habit_id)
+    rows = _ranged(query, DailyLog.date, start, end).group_by(DailyLog.date).all()
+
+    per_day = {day: (logged, int(done or 0)) for day, logged, done in rows}
+
+    def add(totals, counts):
+        totals['logged'] += counts[0]
+        totals['completed'] += counts[1]
+
+    return _fold(per_day, group, start, end, lambda: {'completed': 0, 'logged': 0}, add)
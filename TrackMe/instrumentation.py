@@ -0,0 +1,198 @@
+"""
+Opt-in request and SQL instrumentation.
+
+Enabled with METRICS_ENABLED=1. When on, every request records its latency,
+SQL statement count and time, and template render time; a Server-Timing
+header carries the breakdown to the browser, and /metrics serves the
+aggregates in Prometheus text format. Statements repeated within one request
+are flagged as likely N+1 patterns, and slow statements are logged.
+
+When disabled nothing is registered, so requests pay no overhead.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from flask import g, has_request_context, request, Response, abort, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Latency histogram bucket bounds in seconds (Prometheus convention)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide aggregates, keyed by route rule."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(Histogram)
+        self.requests = Counter()
+        self.sql_statements = Counter()
+        self.sql_seconds = Counter()
+        self.template_seconds = Counter()
+        self.n_plus_one = Counter()
+        self.slow_queries = Counter()
+
+    def record(self, route, method, status, elapsed, stats):
+        with self.lock:
+            self.latency[(route, method)].observe(elapsed)
+            self.requests[(route, method, status)] += 1
+            self.sql_statements[route] += stats['count']
+            self.sql_seconds[route] += stats['sql']
+            self.template_seconds[route] += stats['template']
+            self.n_plus_one[route] += stats['repeated']
+            self.slow_queries[route] += stats['slow']
+
+    def prometheus(self, extra=None):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            family('trackme_request_duration_seconds', 'histogram', 'Request latency by route.')
+            for (route, method), hist in sorted(self.latency.items()):
+                labels = f'route="{route}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), hist.counts):
+                    cumulative += count
+                    lines.append(f'trackme_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'trackme_request_duration_seconds_sum{{{labels}}} {hist.total:.6f}')
+                lines.append(f'trackme_request_duration_seconds_count{{{labels}}} {hist.count}')
+
+            family('trackme_requests_total', 'counter', 'Requests by route, method and status.')
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'trackme_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+
+            per_route = [
+                ('trackme_sql_statements_total', 'SQL statements executed.', self.sql_statements, '{}'),
+                ('trackme_sql_seconds_total', 'Time spent in SQL statements.', self.sql_seconds, '{:.6f}'),
+                ('trackme_template_seconds_total', 'Time spent rendering templates.', self.template_seconds, '{:.6f}'),
+                ('trackme_n_plus_one_total', 'Requests repeating one statement shape past the threshold.', self.n_plus_one, '{}'),
+                ('trackme_slow_queries_total', 'Statements slower than the slow-query threshold.', self.slow_queries, '{}'),
+            ]
+            for name, help_text, counter, fmt in per_route:
+                family(name, 'counter', help_text)
+                for route, value in sorted(counter.items()):
+                    lines.append(f'{name}{{route="{route}"}} {fmt.format(value)}')
+
+        for name, value in (extra or {}).items():
+            family(name, 'gauge' if name.endswith('_size') else 'counter', name.replace('_', ' ') + '.')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+def _stats():
+    return g.get('_instrumentation')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and _stats() is not None:
+        context._instrumentation_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_instrumentation_start', None)
+    if start is None or not has_request_context():
+        return
+    stats = _stats()
+    if stats is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats['count'] += 1
+    stats['sql'] += elapsed
+    stats['shapes'][statement] += 1
+    if elapsed * 1000 >= stats['slow_ms']:
+        stats['slow'] += 1
+        logger.warning('Slow query (%.1f ms) on %s: %s', elapsed * 1000, request.path, statement)
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None:
+        stats['template_start'] = time.perf_counter()
+
+
+def _after_render(sender, template, context, **extra):
+    stats = _stats()
+    if stats is not None and stats.get('template_start'):
+        stats['template'] += time.perf_counter() - stats.pop('template_start')
+
+
+def init_app(app):
+    """Register hooks and the /metrics route if METRICS_ENABLED is set."""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    slow_ms = app.config.get('SLOW_QUERY_MS', 100)
+    repeat_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request():
+        g._instrumentation = {
+            'start': time.perf_counter(), 'count': 0, 'sql': 0.0, 'template': 0.0,
+            'slow': 0, 'slow_ms': slow_ms, 'shapes': Counter(), 'repeated': 0,
+        }
+
+    @app.after_request
+    def finish_request(response):
+        stats = _stats()
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats['start']
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+
+        shape, repeats = stats['shapes'].most_common(1)[0] if stats['shapes'] else (None, 0)
+        if repeats >= repeat_threshold:
+            stats['repeated'] = 1
+            logger.warning('Possible N+1 on %s: statement ran %d times: %s', route, repeats, shape)
+
+        metrics.record(route, request.method, response.status_code, elapsed, stats)
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={stats["sql"] * 1000:.2f};desc="{stats["count"]} queries"',
+            f'tmpl;dur={stats["template"] * 1000:.2f}',
+            f'total;dur={elapsed * 1000:.2f}',
+        ])
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        token = app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        cache = app.extensions.get('response_cache')
+        extra = {}
+        if cache is not None:
+            stats = cache.stats()
+            extra = {
+                'trackme_cache_hits_total': stats['hits'],
+                'trackme_cache_misses_total': stats['misses'],
+                'trackme_cache_evictions_total': stats['evictions'],
+                'trackme_cache_size': stats['size'],
+            }
+        return Response(metrics.prometheus(extra), mimetype='text/plain; version=0.0.4')
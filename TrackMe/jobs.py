@@ -0,0 +1,269 @@
+"""
+Background jobs: nightly rollup fill-ins, cache pre-warming and archival.
+
+Jobs are rows in the `job` table, so they survive restarts and every process
+sharing the database sees them. enqueue() is idempotent on (name, key):
+nightly jobs are keyed by date, so any number of workers or cron runs can
+schedule a night and each job still runs once. A worker claims a queued job
+with a conditional UPDATE, runs its handler in an app context and records
+status, attempts, duration and result or error on the row.
+
+Workers run as daemon threads in the web process when JOBS_ENABLED=1, or as
+a separate process / cron entry:
+
+    flask --app app run-jobs              # worker loop, schedules each night
+    flask --app app run-jobs --once       # schedule today's jobs, drain, exit
+    flask --app app enqueue-job rollup --user-id 3
+    flask --app app jobs                  # recent jobs with status and duration
+"""
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import update
+from models import db, Job, DailyHabitSummary, AttendanceRecord, Subject
+from upserts import dialect_insert
+from cache import response_cache, NullBackend, HABITS
+import calendars
+import retention
+import summaries
+import sync
+from streaks import fill_streaks
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+# Scheduled once per day, in this order
+NIGHTLY = ('rollup', 'archive-habits', 'prewarm')
+
+# Running jobs older than this are assumed to have died with their worker
+STALE_AFTER = timedelta(hours=1)
+
+# Users active in this many days get their caches pre-warmed
+PREWARM_ACTIVE_DAYS = 7
+PREWARM_MAX_USERS = 1000
+PREWARM_PATHS = ('/api/summary', '/api/chart-data/week', '/api/attendance-stats')
+
+
+def job(name):
+    """Register a handler. It is called with the job's params and returns a JSON-able result."""
+    def register(handler):
+        HANDLERS[name] = handler
+        return handler
+    return register
+
+
+def enqueue(name, key=None, **params):
+    """
+    Queue a job unless one with the same name and key exists; a failed one is
+    queued again. `key` defaults to the current time, i.e. always a new job.
+    Returns the Job.
+    """
+    if name not in HANDLERS:
+        raise ValueError(f'unknown job {name!r}')
+    key = key or datetime.utcnow().isoformat()
+    db.session.execute(
+        dialect_insert(Job).values(
+            name=name, key=key, params=params, status='queued', attempts=0, created_at=datetime.utcnow()
+        ).on_conflict_do_nothing(index_elements=['name', 'key'])
+    )
+    db.session.execute(
+        update(Job).where(Job.name == name, Job.key == key, Job.status == 'failed').values(
+            status='queued', error=None
+        ).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return Job.query.filter_by(name=name, key=key).populate_existing().one()
+
+
+def schedule_nightly(day):
+    """Queue the nightly jobs for `day` (idempotent). Returns the Jobs."""
+    return [enqueue(name, key=day.isoformat()) for name in NIGHTLY]
+
+
+def requeue_stale(now=None):
+    """Return jobs stuck in 'running' past STALE_AFTER to the queue. Returns how many."""
+    now = now or datetime.utcnow()
+    count = db.session.execute(
+        update(Job).where(Job.status == 'running', Job.started_at < now - STALE_AFTER).values(
+            status='queued'
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def claim():
+    """Mark the oldest queued job running and return it, or None if the queue is empty."""
+    while True:
+        candidate = db.session.query(Job.id).filter(Job.status == 'queued').order_by(Job.id).first()
+        if candidate is None:
+            return None
+        claimed = db.session.execute(
+            update(Job).where(Job.id == candidate.id, Job.status == 'queued').values(
+                status='running', started_at=datetime.utcnow(), attempts=Job.attempts + 1
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, candidate.id, populate_existing=True)
+        # Another worker took it; try the next one
+
+
+def run(job_row):
+    """Run a claimed job and record the outcome on its row."""
+    job_id, name, params = job_row.id, job_row.name, dict(job_row.params or {})
+    started = time.perf_counter()
+    try:
+        result, error, status = HANDLERS[name](**params), None, 'succeeded'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Job %s (%s) failed", job_id, name)
+        result, error, status = None, f'{type(e).__name__}: {e}', 'failed'
+
+    job_row = db.session.get(Job, job_id, populate_existing=True)
+    job_row.status = status
+    job_row.result = result
+    job_row.error = error
+    job_row.finished_at = datetime.utcnow()
+    job_row.duration_ms = (time.perf_counter() - started) * 1000
+    db.session.commit()
+    return job_row
+
+
+def run_pending(limit=None):
+    """Run queued jobs in this thread until the queue is empty or `limit` ran. Returns them."""
+    done = []
+    while limit is None or len(done) < limit:
+        job_row = claim()
+        if job_row is None:
+            break
+        done.append(run(job_row))
+    return done
+
+
+class Worker(threading.Thread):
+    """
+    Polls the job table. The scheduling worker also queues the nightly jobs
+    whenever the date changes (at start-up and at midnight rollover) and
+    requeues jobs abandoned by crashed workers.
+    """
+
+    def __init__(self, app, poll_interval=5.0, schedule=True):
+        super().__init__(name='trackme-jobs', daemon=True)
+        self.app = app
+        self.poll_interval = poll_interval
+        self.schedule = schedule
+        self.stopping = threading.Event()
+        self.scheduled_day = None
+
+    def tick(self):
+        """Schedule if due and run one job. Returns True if a job ran."""
+        with self.app.app_context():
+            try:
+                if self.schedule and self.scheduled_day != date.today():
+                    requeue_stale()
+                    schedule_nightly(date.today())
+                    self.scheduled_day = date.today()
+                return bool(run_pending(limit=1))
+            except Exception:
+                # e.g. the database is down or not migrated yet; retry next poll
+                db.session.rollback()
+                logger.exception("Job worker poll failed")
+                return False
+            finally:
+                db.session.remove()
+
+    def run(self):
+        while not self.stopping.is_set():
+            if not self.tick():
+                self.stopping.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopping.set()
+
+
+def init_app(app):
+    """Start in-process workers when JOBS_ENABLED is set."""
+    if not app.config.get('JOBS_ENABLED'):
+        return
+    workers = [
+        Worker(app, app.config.get('JOBS_POLL_INTERVAL', 5.0), schedule=(i == 0))
+        for i in range(app.config.get('JOB_WORKERS', 1))
+    ]
+    for worker in workers:
+        worker.start()
+    app.extensions['job_workers'] = workers
+
+
+@job('rollup')
+def rollup_job(user_id=None):
+    """
+    Fill in daily summaries, calendar bitmaps and streaks the incremental
+    updates have not written (older history, imports). Existing rows are
+    never rewritten, so past denominators keep their values and concurrent
+    toggles are not lost. The `flask rebuild-*` commands do full rebuilds.
+    """
+    filled = {
+        'summaries': summaries.fill_summaries(user_id),
+        'calendars': calendars.fill_calendars(user_id),
+        'streaks': fill_streaks(user_id),
+    }
+    for owner in set().union(*filled.values()):
+        response_cache.invalidate(owner, HABITS)
+    return {name: sum(counts.values()) for name, counts in filled.items()}
+
+
+@job('archive-habits')
+def archive_habits_job(user_id=None, after_days=retention.ARCHIVE_AFTER_DAYS):
+    today = date.today()
+    return {
+        'archived': retention.archive_one_time_habits(today, after_days, user_id),
+        'tombstonesPurged': retention.purge_tombstones(today, sync.TOMBSTONE_DAYS),
+    }
+
+
+def _active_users(since):
+    """Ids of users who logged habits or attendance on or after `since`."""
+    habit_users = db.session.query(DailyHabitSummary.user_id).filter(DailyHabitSummary.date >= since)
+    attendance_users = db.session.query(Subject.user_id).join(AttendanceRecord).filter(
+        AttendanceRecord.date >= since
+    )
+    rows = habit_users.union(attendance_users).limit(PREWARM_MAX_USERS)
+    return [row[0] for row in rows]
+
+
+@job('prewarm')
+def prewarm_job(user_id=None):
+    """
+    Fill the response cache for the dashboard's API calls after the date rolls
+    over, by replaying them through the test client so the cache keys match
+    the routes exactly. Only the process running the job benefits unless the
+    cache is shared (CACHE_URL); with no cache at all there is nothing to do.
+    """
+    if isinstance(response_cache.backend, NullBackend):
+        return {'users': 0, 'responses': 0}
+    today = date.today()
+    user_ids = [user_id] if user_id is not None else _active_users(today - timedelta(days=PREWARM_ACTIVE_DAYS))
+    db.session.commit()
+
+    client = current_app.test_client()
+    warmed = 0
+    for uid in user_ids:
+        with client.session_transaction() as session:
+            session['user_id'] = uid
+        for path in PREWARM_PATHS:
+            if client.get(path).status_code == 200:
+                warmed += 1
+    return {'users': len(user_ids), 'responses': warmed}
+
+
+def recent(limit=20, status=None):
+    """Most recent jobs first, optionally only those with `status`."""
+    query = Job.query
+    if status:
+        query = query.filter(Job.status == status)
+    return query.order_by(Job.id.desc()).limit(limit).all()
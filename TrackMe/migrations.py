@@ -0,0 +1,279 @@
+"""
+Versioned schema migrations.
+
+Each migration is a function returning the SQL statements for a dialect
+('sqlite' or 'postgresql'). Applied versions are recorded in the
+schema_version table. A fresh database is created from the models and stamped
+at the latest version; an existing database created by an earlier db.create_all()
+starts at version 0. New tables get a migration like any other schema change,
+so the SQL printed for a dialect brings a database all the way to HEAD.
+
+    flask --app app db-upgrade                     # apply pending migrations
+    flask --app app db-upgrade --sql postgresql    # print SQL only
+    python migrations.py postgresql                # same, without app config
+"""
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, select, func
+from models import db
+
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _cascade_habit_logs(dialect):
+    if dialect == 'postgresql':
+        return [
+            'ALTER TABLE daily_log DROP CONSTRAINT IF EXISTS daily_log_habit_id_fkey',
+            'ALTER TABLE daily_log ADD CONSTRAINT daily_log_habit_id_fkey '
+            'FOREIGN KEY (habit_id) REFERENCES habit (id) ON DELETE CASCADE',
+        ]
+    # SQLite cannot alter constraints, so the table is rebuilt (dropping orphaned logs)
+    return [
+        'CREATE TABLE daily_log_new ('
+        'id INTEGER NOT NULL, '
+        'habit_id INTEGER NOT NULL, '
+        'date DATE NOT NULL, '
+        'completed BOOLEAN, '
+        'PRIMARY KEY (id), '
+        'CONSTRAINT unique_habit_date UNIQUE (habit_id, date), '
+        'FOREIGN KEY(habit_id) REFERENCES habit (id) ON DELETE CASCADE)',
+        'INSERT INTO daily_log_new (id, habit_id, date, completed) '
+        'SELECT id, habit_id, date, completed FROM daily_log WHERE habit_id IN (SELECT id FROM habit)',
+        'DROP TABLE daily_log',
+        'ALTER TABLE daily_log_new RENAME TO daily_log',
+    ]
+
+
+def _lookup_indexes(dialect):
+    return [
+        'CREATE INDEX IF NOT EXISTS ix_habit_user_recurring ON habit (user_id, is_recurring)',
+        'CREATE INDEX IF NOT EXISTS ix_habit_user_target_date ON habit (user_id, target_date)',
+        'CREATE INDEX IF NOT EXISTS ix_subject_user_id ON subject (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_daily_log_date_completed ON daily_log (date, completed)',
+        'CREATE INDEX IF NOT EXISTS ix_attendance_record_subject_status ON attendance_record (subject_id, status)',
+    ]
+
+
+def _user_password(dialect):
+    return ['ALTER TABLE "user" ADD COLUMN password_hash VARCHAR(256)']
+
+
+def _sync_timestamps(dialect):
+    timestamp = 'TIMESTAMP' if dialect == 'postgresql' else 'DATETIME'
+    statements = []
+    for table in ('habit', 'daily_log', 'subject', 'attendance_record'):
+        statements.append(f'ALTER TABLE {table} ADD COLUMN updated_at {timestamp}')
+    return statements + [
+        'CREATE INDEX IF NOT EXISTS ix_habit_user_updated ON habit (user_id, updated_at)',
+        'CREATE INDEX IF NOT EXISTS ix_daily_log_habit_updated ON daily_log (habit_id, updated_at)',
+        'CREATE INDEX IF NOT EXISTS ix_attendance_record_subject_updated ON attendance_record (subject_id, updated_at)',
+    ]
+
+
+# Tables below were first created by a trailing db.create_all() in upgrade(),
+# so databases from then already have them: hence IF NOT EXISTS.
+
+def _types(dialect):
+    if dialect == 'postgresql':
+        return {'serial': 'SERIAL', 'timestamp': 'TIMESTAMP', 'bytes': 'BYTEA'}
+    return {'serial': 'INTEGER', 'timestamp': 'DATETIME', 'bytes': 'BLOB'}
+
+
+def _habit_streak(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS habit_streak ('
+        'habit_id INTEGER NOT NULL, '
+        'current_streak INTEGER NOT NULL, '
+        'longest_streak INTEGER NOT NULL, '
+        'last_completed DATE, '
+        'PRIMARY KEY (habit_id), '
+        'FOREIGN KEY(habit_id) REFERENCES habit (id))',
+    ]
+
+
+def _daily_habit_summary(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS daily_habit_summary ('
+        f'id {_types(dialect)["serial"]} NOT NULL, '
+        'user_id INTEGER NOT NULL, '
+        'date DATE NOT NULL, '
+        'active_habits INTEGER NOT NULL, '
+        'completed_habits INTEGER NOT NULL, '
+        'PRIMARY KEY (id), '
+        'CONSTRAINT unique_user_summary_date UNIQUE (user_id, date), '
+        'FOREIGN KEY(user_id) REFERENCES "user" (id))',
+    ]
+
+
+def _timetable_slot(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS timetable_slot ('
+        f'id {_types(dialect)["serial"]} NOT NULL, '
+        'user_id INTEGER NOT NULL, '
+        'subject_id INTEGER NOT NULL, '
+        'weekday INTEGER NOT NULL, '
+        'start_time TIME NOT NULL, '
+        'end_time TIME NOT NULL, '
+        'is_lab BOOLEAN NOT NULL, '
+        'PRIMARY KEY (id), '
+        'FOREIGN KEY(user_id) REFERENCES "user" (id), '
+        'FOREIGN KEY(subject_id) REFERENCES subject (id) ON DELETE CASCADE)',
+        'CREATE INDEX IF NOT EXISTS ix_timetable_slot_user_weekday ON timetable_slot (user_id, weekday, start_time)',
+    ]
+
+
+def _habit_calendar(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS habit_calendar ('
+        'habit_id INTEGER NOT NULL, '
+        'year INTEGER NOT NULL, '
+        f'bits {_types(dialect)["bytes"]} NOT NULL, '
+        'PRIMARY KEY (habit_id, year), '
+        'FOREIGN KEY(habit_id) REFERENCES habit (id) ON DELETE CASCADE)',
+    ]
+
+
+def _archived_habit(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS archived_habit ('
+        'habit_id INTEGER NOT NULL, '
+        'user_id INTEGER NOT NULL, '
+        'name VARCHAR(200) NOT NULL, '
+        'target_date DATE NOT NULL, '
+        'completed BOOLEAN NOT NULL, '
+        f'archived_at {_types(dialect)["timestamp"]} NOT NULL, '
+        'PRIMARY KEY (habit_id), '
+        'FOREIGN KEY(user_id) REFERENCES "user" (id))',
+        'CREATE INDEX IF NOT EXISTS ix_archived_habit_user_date ON archived_habit (user_id, target_date)',
+    ]
+
+
+def _job(dialect):
+    types = _types(dialect)
+    return [
+        'CREATE TABLE IF NOT EXISTS job ('
+        f'id {types["serial"]} NOT NULL, '
+        'name VARCHAR(80) NOT NULL, '
+        '"key" VARCHAR(100) NOT NULL, '
+        'params JSON NOT NULL, '
+        'status VARCHAR(20) NOT NULL, '
+        'attempts INTEGER NOT NULL, '
+        f'created_at {types["timestamp"]} NOT NULL, '
+        f'started_at {types["timestamp"]}, '
+        f'finished_at {types["timestamp"]}, '
+        'duration_ms FLOAT, '
+        'result JSON, '
+        'error TEXT, '
+        'PRIMARY KEY (id), '
+        'CONSTRAINT unique_job_key UNIQUE (name, "key"))',
+        'CREATE INDEX IF NOT EXISTS ix_job_status ON job (status, id)',
+    ]
+
+
+def _sync_tombstone(dialect):
+    return [
+        'CREATE TABLE IF NOT EXISTS sync_tombstone ('
+        f'id {_types(dialect)["serial"]} NOT NULL, '
+        'user_id INTEGER NOT NULL, '
+        'entity VARCHAR(20) NOT NULL, '
+        'entity_id INTEGER NOT NULL, '
+        f'deleted_at {_types(dialect)["timestamp"]} NOT NULL, '
+        'PRIMARY KEY (id), '
+        'FOREIGN KEY(user_id) REFERENCES "user" (id))',
+        'CREATE INDEX IF NOT EXISTS ix_sync_tombstone_user_deleted ON sync_tombstone (user_id, deleted_at)',
+    ]
+
+
+def _history_indexes(dialect):
+    return [
+        'CREATE INDEX IF NOT EXISTS ix_daily_log_date_id ON daily_log (date, id)',
+        'CREATE INDEX IF NOT EXISTS ix_attendance_record_date_id ON attendance_record (date, id)',
+    ]
+
+
+MIGRATIONS = [
+    (1, 'Cascade deletes from habit to daily_log', _cascade_habit_logs),
+    (2, 'Indexes for habit, subject, daily_log and attendance lookups', _lookup_indexes),
+    (3, 'Password hash for session logins', _user_password),
+    (4, 'Change timestamps for client sync', _sync_timestamps),
+    (5, 'Habit streak table', _habit_streak),
+    (6, 'Daily habit summary table', _daily_habit_summary),
+    (7, 'Timetable slot table', _timetable_slot),
+    (8, 'Habit calendar bitmap table', _habit_calendar),
+    (9, 'Archived habit table', _archived_habit),
+    (10, 'Background job table', _job),
+    (11, 'Sync tombstone table', _sync_tombstone),
+    (12, 'Date indexes for user-wide history pages', _history_indexes),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def pending_sql(dialect, from_version=0):
+    """SQL for every migration after from_version, without touching a database."""
+    statements = [
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        'version INTEGER NOT NULL, '
+        'description VARCHAR(200) NOT NULL, '
+        f'applied_at {_types(dialect)["timestamp"]} NOT NULL, '
+        'PRIMARY KEY (version))'
+    ]
+    for version, description, migration in MIGRATIONS:
+        if version > from_version:
+            statements.extend(migration(dialect))
+            statements.append(
+                f"INSERT INTO schema_version (version, description, applied_at) "
+                f"VALUES ({version}, '{description}', CURRENT_TIMESTAMP)"
+            )
+    return statements
+
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return None
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def _stamp(conn, version, description):
+    conn.execute(schema_version.insert().values(
+        version=version, description=description, applied_at=datetime.utcnow()
+    ))
+
+
+def upgrade(engine=None):
+    """
+    Bring the database up to HEAD in one transaction. Returns the list of
+    versions applied (empty if already current).
+    """
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        fresh = not inspect(conn).has_table('habit')
+        version = current_version(conn)
+        schema_version.create(conn, checkfirst=True)
+
+        if fresh:
+            db.metadata.create_all(conn)
+            _stamp(conn, HEAD, 'Initial schema')
+            return [HEAD]
+
+        applied = []
+        for number, description, migration in MIGRATIONS:
+            if number > (version or 0):
+                for statement in migration(conn.dialect.name):
+                    conn.exec_driver_sql(statement)
+                _stamp(conn, number, description)
+                applied.append(number)
+        return applied
+
+
+if __name__ == '__main__':
+    # Offline mode: python migrations.py postgresql [from_version]
+    import sys
+    dialect = sys.argv[1] if len(sys.argv) > 1 else 'postgresql'
+    start = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    for statement in pending_sql(dialect, start):
+        print(f"{statement};")
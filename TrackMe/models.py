@@ -1,11 +1,22 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores ON DELETE CASCADE unless foreign keys are switched on per connection
+    if type(dbapi_connection).__module__.startswith('sqlite3'):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(256), nullable=True)  # Null for accounts created before logins
     habits = db.relationship('Habit', backref='owner', lazy=True)
     subjects = db.relationship('Subject', backref='owner', lazy=True)
 
@@ -15,30 +26,124 @@ class Habit(db.Model):
     is_recurring = db.Column(db.Boolean, default=True)  # True = Daily, False = One-time
     target_date = db.Column(db.Date, nullable=True)     # For one-time habits
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    logs = db.relationship('DailyLog', backref='habit', lazy=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)  # Sync cursor
+    logs = db.relationship('DailyLog', backref='habit', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_habit_user_recurring', 'user_id', 'is_recurring'),
+        db.Index('ix_habit_user_target_date', 'user_id', 'target_date'),
+        db.Index('ix_habit_user_updated', 'user_id', 'updated_at'),
+    )
 
 class DailyLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), nullable=False)
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id', ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
     completed = db.Column(db.Boolean, default=False)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint('habit_id', 'date', name='unique_habit_date'),
+        db.Index('ix_daily_log_date_completed', 'date', 'completed'),
+        db.Index('ix_daily_log_habit_updated', 'habit_id', 'updated_at'),
+        db.Index('ix_daily_log_date_id', 'date', 'id'),
     )
 
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
     attendance_records = db.relationship('AttendanceRecord', backref='subject', lazy=True, cascade='all, delete-orphan')
+    slots = db.relationship('TimetableSlot', backref='subject', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
 
 class AttendanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
     status = db.Column(db.String(20), nullable=False)  # 'Present' or 'Absent'
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint('subject_id', 'date', name='unique_subject_date'),
+        db.Index('ix_attendance_record_subject_status', 'subject_id', 'status'),
+        db.Index('ix_attendance_record_subject_updated', 'subject_id', 'updated_at'),
+        db.Index('ix_attendance_record_date_id', 'date', 'id'),
+    )
+
+class TimetableSlot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # 0 = Monday, as date.weekday()
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    is_lab = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        db.Index('ix_timetable_slot_user_weekday', 'user_id', 'weekday', 'start_time'),
+    )
+
+class HabitStreak(db.Model):
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id'), primary_key=True)
+    current_streak = db.Column(db.Integer, nullable=False, default=0)   # Length of the run ending at last_completed
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_completed = db.Column(db.Date, nullable=True)
+
+class HabitCalendar(db.Model):
+    habit_id = db.Column(db.Integer, db.ForeignKey('habit.id', ondelete='CASCADE'), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True)
+    bits = db.Column(db.LargeBinary(46), nullable=False)  # Bit n set = completed on day n of the year (1 Jan = 0)
+
+class DailyHabitSummary(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    active_habits = db.Column(db.Integer, nullable=False, default=0)     # Habits due that day
+    completed_habits = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', name='unique_user_summary_date'),
+    )
+
+class ArchivedHabit(db.Model):
+    habit_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # Id the habit had before archival
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    target_date = db.Column(db.Date, nullable=False)
+    completed = db.Column(db.Boolean, nullable=False, default=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_archived_habit_user_date', 'user_id', 'target_date'),
+    )
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    key = db.Column(db.String(100), nullable=False)      # Idempotency key, e.g. the date for nightly jobs
+    params = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('name', 'key', name='unique_job_key'),
+        db.Index('ix_job_status', 'status', 'id'),
+    )
+
+class SyncTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)   # 'habit' or 'subject'
+    entity_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_sync_tombstone_user_deleted', 'user_id', 'deleted_at'),
     )
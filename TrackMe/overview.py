@@ -0,0 +1,66 @@
+"""
+Consolidated summary for the dashboard and pages.
+
+One payload carries today's habits with streaks, the completion rate, overall
+and per-subject attendance and the current week's chart. Each section costs a
+fixed number of queries (habits and completion share two, attendance one, the
+week chart two), and clients can ask for only the sections they show.
+"""
+from attendance_stats import attendance_stats
+from cache import HABITS, ATTENDANCE
+from charts import period_range, completion_series
+from queries import todays_habits
+from streaks import current_streak, load_streaks
+
+SECTIONS = ('habits', 'completion', 'attendance', 'week')
+
+# Cache namespace whose writes invalidate each section
+SECTION_NAMESPACES = {'habits': HABITS, 'completion': HABITS, 'attendance': ATTENDANCE, 'week': HABITS}
+
+
+def parse_fields(raw):
+    """
+    Turn a comma-separated `fields` argument into a tuple of sections (all of
+    them when empty). Raises ValueError naming unknown sections.
+    """
+    if not raw:
+        return SECTIONS
+    fields = tuple(dict.fromkeys(part.strip() for part in raw.split(',') if part.strip()))
+    unknown = [field for field in fields if field not in SECTIONS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def build_summary(user_id, today, fields=SECTIONS):
+    """Return {'date': ..., <section>: ...} for the requested sections."""
+    summary = {'date': today.isoformat()}
+
+    if 'habits' in fields or 'completion' in fields:
+        habits = todays_habits(user_id, today)
+        done = sum(1 for _, completed in habits if completed)
+        if 'completion' in fields:
+            summary['completion'] = {
+                'completed': done,
+                'total': len(habits),
+                'rate': int(done / len(habits) * 100) if habits else 0,
+            }
+        if 'habits' in fields:
+            streaks = load_streaks([habit.id for habit, _ in habits])
+            summary['habits'] = [{
+                'id': habit.id,
+                'name': habit.name,
+                'isRecurring': habit.is_recurring,
+                'completed': completed,
+                'currentStreak': current_streak(streaks.get(habit.id), today) if habit.is_recurring else 0,
+                'longestStreak': streaks[habit.id].longest_streak if habit.id in streaks else 0,
+            } for habit, completed in habits]
+
+    if 'attendance' in fields:
+        summary['attendance'] = attendance_stats(user_id, today=today)
+
+    if 'week' in fields:
+        start, end, bucket = period_range('week', today)
+        summary['week'] = completion_series(user_id, start, end, bucket, 'weekday')
+
+    return summary
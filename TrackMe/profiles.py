@@ -0,0 +1,119 @@
+"""
+Database engine profiles per deployment.
+
+DB_PROFILE picks how the engine is tuned; it defaults to `serverless` on
+Vercel (VERCEL=1) or with SERVERLESS=1, and to `dev` otherwise.
+
+    serverless  many short-lived instances: a tiny pool that is checked
+                before use and recycled before idle timeouts drop it
+    dev         one process (`python app.py`, `flask run`): default pool
+    gunicorn    several long-lived workers, each with its own pool: sized
+                per worker, pre-pinged, recycled, most recent first
+
+With DB_POOLER=external (PgBouncer and the like) the pooler owns the
+connections, so the app keeps none and does not use prepared statements,
+which transaction pooling breaks.
+
+SQLite databases get WAL journaling, so readers do not block the writer,
+and synchronous=NORMAL, which in WAL mode syncs at checkpoints instead of
+every commit. Postgres keeps SQLAlchemy's compiled-statement cache and,
+with psycopg 3 (postgresql+psycopg://), prepares statements server-side
+after a few executions. DB_POOL_SIZE, SQLITE_JOURNAL_MODE and
+SQLITE_SYNCHRONOUS override the profile.
+"""
+import os
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+PROFILES = {
+    'serverless': {
+        'engine': {'pool_size': 1, 'max_overflow': 2, 'pool_recycle': 300, 'pool_pre_ping': True},
+        'prepare_threshold': None,
+        'sqlite_synchronous': 'NORMAL',
+    },
+    'dev': {
+        'engine': {},
+        'prepare_threshold': 5,
+        'sqlite_synchronous': 'NORMAL',
+    },
+    'gunicorn': {
+        'engine': {'pool_size': 5, 'max_overflow': 5, 'pool_recycle': 1800, 'pool_pre_ping': True,
+                   'pool_use_lifo': True, 'query_cache_size': 1200},
+        'prepare_threshold': 5,
+        'sqlite_synchronous': 'NORMAL',
+    },
+}
+
+# Seconds a SQLite connection waits for another writer's lock
+SQLITE_BUSY_TIMEOUT = 30
+
+SQLITE_SYNCHRONOUS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+SQLITE_JOURNAL_MODES = ('WAL', 'DELETE', 'TRUNCATE', 'PERSIST')
+
+
+def profile_name(environ=os.environ):
+    name = environ.get('DB_PROFILE')
+    if not name:
+        name = 'serverless' if environ.get('VERCEL') or environ.get('SERVERLESS') else 'dev'
+    if name not in PROFILES:
+        raise ValueError(f"DB_PROFILE must be one of {', '.join(PROFILES)}")
+    return name
+
+
+def engine_options(url, environ=os.environ):
+    """
+    Return (profile name, SQLALCHEMY_ENGINE_OPTIONS, SQLite pragmas) for a
+    database URL under the environment's profile.
+    """
+    name = profile_name(environ)
+    profile = PROFILES[name]
+    options = dict(profile['engine'])
+    prepare_threshold = profile['prepare_threshold']
+    if environ.get('DB_POOL_SIZE'):
+        options['pool_size'] = int(environ['DB_POOL_SIZE'])
+
+    url = url or ''
+    pragmas = {}
+    if environ.get('DB_POOLER') == 'external':
+        options = {'poolclass': NullPool}
+        prepare_threshold = None
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': SQLITE_BUSY_TIMEOUT}
+        synchronous = environ.get('SQLITE_SYNCHRONOUS', profile['sqlite_synchronous']).upper()
+        if synchronous not in SQLITE_SYNCHRONOUS:
+            raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS)}")
+        journal_mode = environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+        if journal_mode not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f"SQLITE_JOURNAL_MODE must be one of {', '.join(SQLITE_JOURNAL_MODES)}")
+        pragmas = {'journal_mode': journal_mode, 'synchronous': synchronous}
+        if ':memory:' in url or url.rstrip('/') == 'sqlite:':
+            # One shared connection per thread: no pool to size, no journal file to switch
+            options = {'connect_args': options['connect_args']}
+            del pragmas['journal_mode']
+    elif url.startswith('postgresql+psycopg:'):
+        options['connect_args'] = {'prepare_threshold': prepare_threshold}
+    return name, options, pragmas
+
+
+def configure(app):
+    """Set the engine options for the app's database URL. Call before db.init_app()."""
+    name, options, pragmas = engine_options(app.config.get('SQLALCHEMY_DATABASE_URI'))
+    app.config['DB_PROFILE'] = name
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.config['SQLITE_PRAGMAS'] = pragmas
+
+
+def init_app(app, db):
+    """Apply the SQLite pragmas on every new connection of the app's engine."""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in pragmas.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        cursor.close()
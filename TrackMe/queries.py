@@ -0,0 +1,76 @@
+"""
+Shared data access for the page views.
+
+Today's status for all of a user's habits and subjects is fetched with one
+outer-joined query each, so page renders cost a fixed number of statements
+regardless of how many habits or subjects a user has.
+"""
+from contextlib import contextmanager
+from sqlalchemy import event, or_, and_
+from models import db, Habit, DailyLog, Subject, AttendanceRecord
+
+
+def todays_habits(user_id, today):
+    """Return [(habit, completed)] for habits due today in one query."""
+    rows = db.session.query(Habit, DailyLog.completed).outerjoin(
+        DailyLog,
+        and_(DailyLog.habit_id == Habit.id, DailyLog.date == today)
+    ).filter(
+        Habit.user_id == user_id,
+        or_(Habit.is_recurring == True, Habit.target_date == today)
+    ).order_by(Habit.id).all()
+    return [(habit, bool(completed)) for habit, completed in rows]
+
+
+def todays_attendance(user_id, today, subject_ids=None):
+    """
+    Return the user's subjects (optionally only `subject_ids`) with
+    `today_status` set, in one query.
+    """
+    query = db.session.query(Subject, AttendanceRecord.status).outerjoin(
+        AttendanceRecord,
+        and_(AttendanceRecord.subject_id == Subject.id, AttendanceRecord.date == today)
+    ).filter(
+        Subject.user_id == user_id
+    )
+    if subject_ids is not None:
+        query = query.filter(Subject.id.in_(subject_ids))
+    rows = query.order_by(Subject.id).all()
+
+    subjects = []
+    for subject, status in rows:
+        subject.today_status = status
+        subjects.append(subject)
+    return subjects
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while it is active."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Count statements sent to the engine inside the block, e.g.
+
+        with app.app_context(), count_queries() as counter:
+            client.get('/')
+        assert counter.count <= 4
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._record)
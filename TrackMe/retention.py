@@ -0,0 +1,69 @@
+"""
+Archival of past one-time habits.
+
+A one-time habit is only shown on its target date, but its Habit, DailyLog,
+HabitStreak and HabitCalendar rows stay in the hot tables for good. Once the
+target date is more than ARCHIVE_AFTER_DAYS old, the habit's name, date and
+whether it was done move into ArchivedHabit and the originals are deleted
+(logs and calendars via ON DELETE CASCADE). The daily rollup rebuild, the
+per-habit pie and exports read ArchivedHabit as well, so history is unchanged.
+Archived habits leave sync tombstones so offline clients drop them too.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+from models import db, Habit, DailyLog, HabitStreak, ArchivedHabit, SyncTombstone
+
+ARCHIVE_AFTER_DAYS = 90
+BATCH_SIZE = 500
+
+
+def archive_one_time_habits(today, after_days=ARCHIVE_AFTER_DAYS, user_id=None):
+    """
+    Archive one-time habits whose target date is before today - after_days,
+    BATCH_SIZE habits per transaction. Idempotent: archived habits are gone
+    from Habit, so a second run finds nothing. Returns the number archived.
+    """
+    cutoff = today - timedelta(days=after_days)
+    archived = 0
+    while True:
+        query = db.session.query(
+            Habit.id, Habit.user_id, Habit.name, Habit.target_date, DailyLog.completed
+        ).outerjoin(DailyLog, and_(
+            DailyLog.habit_id == Habit.id,
+            DailyLog.date == Habit.target_date
+        )).filter(
+            Habit.is_recurring == False,
+            Habit.target_date < cutoff
+        )
+        if user_id is not None:
+            query = query.filter(Habit.user_id == user_id)
+        rows = query.order_by(Habit.id).limit(BATCH_SIZE).all()
+        if not rows:
+            return archived
+
+        now = datetime.utcnow()
+        ids = [row.id for row in rows]
+        db.session.bulk_insert_mappings(ArchivedHabit, [
+            {'habit_id': row.id, 'user_id': row.user_id, 'name': row.name,
+             'target_date': row.target_date, 'completed': bool(row.completed), 'archived_at': now}
+            for row in rows
+        ])
+        db.session.bulk_insert_mappings(SyncTombstone, [
+            {'user_id': row.user_id, 'entity': 'habit', 'entity_id': row.id, 'deleted_at': now}
+            for row in rows
+        ])
+        HabitStreak.query.filter(HabitStreak.habit_id.in_(ids)).delete(synchronize_session=False)
+        Habit.query.filter(Habit.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        archived += len(ids)
+
+
+def purge_tombstones(today, keep_days):
+    """
+    Delete sync tombstones older than keep_days. Clients whose cursor is
+    older than that get a full snapshot instead of a delta (see sync.py).
+    """
+    cutoff = datetime.combine(today - timedelta(days=keep_days), datetime.min.time())
+    purged = SyncTombstone.query.filter(SyncTombstone.deleted_at < cutoff).delete(synchronize_session=False)
+    db.session.commit()
+    return purged
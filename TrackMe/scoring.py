@@ -0,0 +1,150 @@
+"""
+Habit consistency scores.
+
+Scores come from the HabitCalendar bitmaps, which every toggle already
+updates, so a user's whole history is one small query (a 46-byte row per
+habit and year). Each habit's years are joined into one integer, bit n
+meaning "done n days after 1 January of the first year", and every score is
+a mask, shift or popcount over it: a window of days is a shifted mask, a
+weekday is a mask with every seventh bit set. Years of history across
+dozens of habits take a few milliseconds, so results are only cached per
+response (invalidated on toggle) and never stored.
+
+Only recurring habits are scored. The bitmaps cover years with a toggle
+since they were introduced; `flask rebuild-calendars` (or the nightly
+rollup job) fills in older history.
+"""
+from datetime import date, timedelta
+from models import db, Habit, HabitCalendar
+from calendars import to_int, longest_run, run_ending_at
+from timetable import WEEKDAYS
+
+WINDOWS = (7, 30, 90)
+
+# A streak at least this long that is not yet extended today is at risk
+RISK_STREAK = 3
+# 30-day consistency from which a collapse in the last 7 days counts as slipping
+RISK_BASELINE = 50
+
+
+def _joined(calendars, epoch):
+    """One bitmap over all years from per-year ({year: bits}) bitmaps."""
+    bits = 0
+    for year, year_bits in calendars.items():
+        bits |= year_bits << (date(year, 1, 1) - epoch).days
+    return bits
+
+
+def _ones(count):
+    return (1 << count) - 1 if count > 0 else 0
+
+
+def _window(bits, end, days):
+    """Completions in the `days` days ending at bit `end`."""
+    start = max(end - days + 1, 0)
+    return ((bits >> start) & _ones(end - start + 1)).bit_count()
+
+
+def _every_seventh(length):
+    """Bits 0, 7, 14, ... below `length`."""
+    repeats = length // 7 + 1
+    return (_ones(7 * repeats) // 127) & _ones(length)
+
+
+def _percent(done, total):
+    return round(done / total * 100, 1) if total else 0
+
+
+def score_habit(bits, epoch, today):
+    """Scores for one habit's joined bitmap (see module docstring)."""
+    end = (today - epoch).days
+    bits &= _ones(end + 1)
+    if not bits:
+        return {
+            'consistency': {str(days): 0 for days in WINDOWS},
+            'weekdays': [0] * 7, 'completed': 0, 'currentStreak': 0, 'longestStreak': 0,
+            'firstCompleted': None, 'atRisk': False, 'reasons': [],
+        }
+
+    first = (bits & -bits).bit_length() - 1
+    tracked = end - first + 1   # Days since the first completion, today included
+
+    consistency = {}
+    for days in WINDOWS:
+        # Windows longer than the habit's history only count the days it existed
+        consistency[str(days)] = _percent(_window(bits, end, days), min(days, tracked))
+
+    weekdays = [0] * 7
+    span = _ones(end + 1) & ~_ones(first)
+    pattern = _every_seventh(end + 1)
+    for offset in range(7):
+        mask = (pattern << offset) & span
+        weekdays[(epoch.weekday() + offset) % 7] = _percent((bits & mask).bit_count(), mask.bit_count())
+
+    current = run_ending_at(bits, end)
+    reasons = []
+    if not current and end and run_ending_at(bits, end - 1) >= RISK_STREAK:
+        reasons.append('streak')
+    if consistency['30'] >= RISK_BASELINE and consistency['7'] < consistency['30'] / 2:
+        reasons.append('slipping')
+
+    return {
+        'consistency': consistency,
+        'weekdays': weekdays,
+        'completed': bits.bit_count(),
+        'currentStreak': current,
+        'longestStreak': longest_run(bits),
+        'firstCompleted': (epoch + timedelta(days=first)).isoformat(),
+        'atRisk': bool(reasons),
+        'reasons': reasons,
+    }
+
+
+def user_scores(user_id, today):
+    """
+    Scores for each of the user's recurring habits plus overall averages,
+    the weekdays they do best and worst on, and the habits at risk.
+    """
+    rows = db.session.query(
+        Habit.id, Habit.name, HabitCalendar.year, HabitCalendar.bits
+    ).outerjoin(HabitCalendar, HabitCalendar.habit_id == Habit.id).filter(
+        Habit.user_id == user_id,
+        Habit.is_recurring == True
+    ).order_by(Habit.id).all()
+
+    habits = {}
+    for habit_id, name, year, bits in rows:
+        habit = habits.setdefault(habit_id, {'name': name, 'years': {}})
+        if year is not None and year <= today.year:
+            habit['years'][year] = to_int(bits)
+
+    years = [year for habit in habits.values() for year in habit['years']]
+    epoch = date(min(years), 1, 1) if years else date(today.year, 1, 1)
+
+    scored = []
+    for habit_id, habit in habits.items():
+        scored.append({'id': habit_id, 'name': habit['name'],
+                       **score_habit(_joined(habit['years'], epoch), epoch, today)})
+
+    active = [s for s in scored if s['completed']]
+    overall = {
+        'consistency': {
+            str(days): round(sum(s['consistency'][str(days)] for s in active) / len(active), 1) if active else 0
+            for days in WINDOWS
+        },
+        'weekdays': [
+            round(sum(s['weekdays'][d] for s in active) / len(active), 1) if active else 0
+            for d in range(7)
+        ],
+    }
+    if active:
+        ranked = sorted(range(7), key=lambda d: overall['weekdays'][d])
+        overall['bestWeekday'] = WEEKDAYS[ranked[-1]]
+        overall['worstWeekday'] = WEEKDAYS[ranked[0]]
+
+    return {
+        'date': today.isoformat(),
+        'overall': overall,
+        'habits': scored,
+        'atRisk': [s['id'] for s in scored if s['atRisk']],
+    }
@@ -1,43 +1,35 @@
 #!/usr/bin/env python
 """
 Seed script to populate database with subjects for the Student Corner module.
-Run this script to add the initial subjects to the database.
+Run this script to add the semester's subjects and timetable to the database.
+
+    python seed_subjects.py [username]
 """
+import sys
 from app import app
 from models import db, User, Subject
+from migrations import upgrade
+from timetable import seed_timetable
 
-def seed_subjects():
-    """Seed the database with predefined subjects."""
+def seed_subjects(username='demo_user'):
+    """Seed the database with the default timetable for one user."""
     with app.app_context():
-        # Get or create the demo user
-        user = User.query.first()
+        upgrade()
+        
+        # Get or create the user (give it a password with `flask set-password`)
+        user = User.query.filter_by(username=username).first()
         if not user:
-            user = User(username='demo_user')
+            user = User(username=username)
             db.session.add(user)
             db.session.commit()
-            print("Created demo user.")
-        
-        # Define subjects from timetable
-        subject_names = [
-            'M-II', 'DSPD-I', 'DCMP', 'BEE', 'DMGT', 'HISP-II',
-            'BEE (LAB)', 'DSPD-I (LAB)', 'DCMP (LAB)'
-        ]
-        
-        # Add subjects if they don't exist
-        added_count = 0
-        for name in subject_names:
-            existing = Subject.query.filter_by(name=name, user_id=user.id).first()
-            if not existing:
-                subject = Subject(name=name, user_id=user.id)
-                db.session.add(subject)
-                added_count += 1
-                print(f"Added subject: {name}")
-            else:
-                print(f"Subject already exists: {name}")
+            print(f"Created user {username}.")
         
+        # Subjects and their weekly slots come from the semester timetable
+        added_subjects, added_slots = seed_timetable(user)
         db.session.commit()
-        print(f"\nSeeding complete! Added {added_count} new subjects.")
+        
+        print(f"\nSeeding complete! Added {added_subjects} new subjects and {added_slots} timetable slots.")
         print(f"Total subjects in database: {Subject.query.filter_by(user_id=user.id).count()}")
 
 if __name__ == '__main__':
-    seed_subjects()
+    seed_subjects(*sys.argv[1:2])
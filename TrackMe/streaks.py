@@ -0,0 +1,154 @@
+"""
+Streak bookkeeping for habits.
+
+Each habit keeps one HabitStreak row (current run, longest run and the date the
+current run ends on). Rows are updated incrementally when a habit is toggled and
+can be rebuilt from DailyLog in a single pass.
+"""
+from datetime import timedelta
+from itertools import groupby
+from models import db, Habit, DailyLog, HabitStreak
+from upserts import dialect_insert
+
+
+def _runs(dates):
+    """Return (current, longest, last) for sorted completed dates (any iterable)."""
+    current = longest = 0
+    last = None
+    for d in dates:
+        if last is not None and d == last + timedelta(days=1):
+            current += 1
+        elif d != last:
+            current = 1
+        longest = max(longest, current)
+        last = d
+    return current, longest, last
+
+
+def _get_or_create(habit_id):
+    """Fetch the habit's streak row, creating it if needed, locked for update."""
+    db.session.execute(
+        dialect_insert(HabitStreak).values(
+            habit_id=habit_id, current_streak=0, longest_streak=0
+        ).on_conflict_do_nothing(index_elements=['habit_id'])
+    )
+    return HabitStreak.query.filter_by(habit_id=habit_id).populate_existing().with_for_update().one()
+
+
+def recompute_habit(habit_id):
+    """Recompute one habit's streak from its completed logs (one query)."""
+    dates = [row.date for row in db.session.query(DailyLog.date).filter(
+        DailyLog.habit_id == habit_id,
+        DailyLog.completed == True
+    ).order_by(DailyLog.date)]
+
+    current, longest, last = _runs(dates)
+    streak = _get_or_create(habit_id)
+    streak.current_streak = current
+    streak.longest_streak = longest
+    streak.last_completed = last
+    return streak
+
+
+def record_toggle(habit_id, day, completed):
+    """
+    Update a habit's streak after its log for `day` changed to `completed`.
+    Extending the current run is handled in place; un-toggles and backfills
+    that land inside or before the run fall back to recompute_habit().
+    Caller commits.
+    """
+    streak = _get_or_create(habit_id)
+    last = streak.last_completed
+
+    if completed and (last is None or day > last):
+        if last is not None and day == last + timedelta(days=1):
+            streak.current_streak += 1
+        else:
+            streak.current_streak = 1
+        streak.last_completed = day
+        streak.longest_streak = max(streak.longest_streak or 0, streak.current_streak)
+        return streak
+
+    if not completed and (last is None or day > last):
+        # Nothing was counted on that day, so the stored run is unchanged
+        return streak
+
+    return recompute_habit(habit_id)
+
+
+def current_streak(streak, today):
+    """Days in the run ending today (0 if today is not completed)."""
+    if streak is None or streak.last_completed != today:
+        return 0
+    return streak.current_streak
+
+
+def load_streaks(habit_ids):
+    """Fetch HabitStreak rows for the given habits keyed by habit_id."""
+    if not habit_ids:
+        return {}
+    rows = HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)).all()
+    return {row.habit_id: row for row in rows}
+
+
+def rebuild_streaks(user_id=None):
+    """
+    Recompute every habit's streak from DailyLog in one ordered scan.
+    Restrict to one user's habits when user_id is given. Rows are rewritten
+    without locks, so toggles committed meanwhile can be lost: this is for
+    repairs, not scheduled runs. Returns the number of habits rebuilt.
+    """
+    habit_query = db.session.query(Habit.id)
+    if user_id is not None:
+        habit_query = habit_query.filter(Habit.user_id == user_id)
+    habit_ids = [row.id for row in habit_query]
+
+    log_query = db.session.query(DailyLog.habit_id, DailyLog.date).join(Habit).filter(
+        DailyLog.completed == True
+    )
+    if user_id is not None:
+        log_query = log_query.filter(Habit.user_id == user_id)
+
+    # Streamed and grouped per habit, so only one habit's run is held at a time
+    runs = {habit_id: (0, 0, None) for habit_id in habit_ids}
+    rows = log_query.order_by(DailyLog.habit_id, DailyLog.date).yield_per(10000)
+    for habit_id, group in groupby(rows, key=lambda row: row.habit_id):
+        runs[habit_id] = _runs(row.date for row in group)
+
+    existing = load_streaks(habit_ids)
+    for habit_id, (current, longest, last) in runs.items():
+        streak = existing.get(habit_id)
+        if streak is None:
+            streak = HabitStreak(habit_id=habit_id)
+            db.session.add(streak)
+        streak.current_streak = current
+        streak.longest_streak = longest
+        streak.last_completed = last
+
+    db.session.commit()
+    return len(runs)
+
+
+def fill_streaks(user_id=None):
+    """
+    Compute streaks for habits with completions but no HabitStreak row yet
+    (history from before streaks were kept, imports). Existing rows are left
+    to the incremental updates; each new one is computed under the row lock
+    toggles take. Returns {user_id: habits filled}.
+    """
+    query = db.session.query(Habit.id, Habit.user_id).outerjoin(
+        HabitStreak, HabitStreak.habit_id == Habit.id
+    ).filter(
+        HabitStreak.habit_id.is_(None),
+        Habit.logs.any(DailyLog.completed == True)
+    )
+    if user_id is not None:
+        query = query.filter(Habit.user_id == user_id)
+
+    filled = {}
+    for habit_id, owner in query.all():
+        _get_or_create(habit_id)
+        recompute_habit(habit_id)
+        db.session.commit()
+        filled[owner] = filled.get(owner, 0) + 1
+    return filled
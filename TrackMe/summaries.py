@@ -0,0 +1,249 @@
+"""
+Daily habit completion rollup.
+
+DailyHabitSummary keeps, per user and date, how many habits were due and how
+many were completed. Rows are created the first time a day is written to and
+adjusted on every toggle, habit creation and deletion, so past denominators
+stay as they were on the day instead of being re-derived from today's habits.
+"""
+from collections import Counter
+from datetime import timedelta
+from sqlalchemy import case, exists, func, or_, update
+from models import db, Habit, DailyLog, DailyHabitSummary, ArchivedHabit
+from upserts import dialect_insert
+
+# Rows per INSERT when filling in missing days
+FILL_CHUNK = 1000
+
+
+def _is_due(habit, day):
+    return habit.is_recurring or habit.target_date == day
+
+
+def _count_from_logs(user_id, day):
+    """Insert a summary row for one day counted from the current Habit/DailyLog state."""
+    active = Habit.query.filter(
+        Habit.user_id == user_id,
+        or_(Habit.is_recurring == True, Habit.target_date == day)
+    ).count()
+    completed = DailyLog.query.join(Habit).filter(
+        Habit.user_id == user_id,
+        DailyLog.date == day,
+        DailyLog.completed == True
+    ).count()
+    stmt = dialect_insert(DailyHabitSummary).values(
+        user_id=user_id, date=day, active_habits=active, completed_habits=completed
+    ).on_conflict_do_nothing(index_elements=['user_id', 'date'])
+    return db.session.execute(stmt).rowcount == 1
+
+
+def _adjust(user_id, day, active=0, completed=0):
+    """
+    Atomically add to a day's counters so concurrent writers never lose an
+    update. When the row does not exist yet it is counted from the logs,
+    which already include the caller's flushed change.
+    """
+    for attempt in range(2):
+        updated = db.session.execute(
+            update(DailyHabitSummary).where(
+                DailyHabitSummary.user_id == user_id,
+                DailyHabitSummary.date == day
+            ).values(
+                active_habits=DailyHabitSummary.active_habits + active,
+                completed_habits=DailyHabitSummary.completed_habits + completed
+            ).execution_options(synchronize_session=False)
+        ).rowcount
+        if updated or attempt:
+            return
+        if _count_from_logs(user_id, day):
+            return
+        # Another writer created the row first; apply the delta to theirs
+
+
+def record_toggle(habit, day, completed):
+    """Adjust the rollup after `habit`'s log for `day` flipped. Call after flush."""
+    _adjust(habit.user_id, day, completed=1 if completed else -1)
+
+
+def record_completions(user_id, day, delta):
+    """Adjust the rollup by the net change after several logs for `day` flipped at once. Call after flush."""
+    _adjust(user_id, day, completed=delta)
+
+
+def record_import(user_id, new_habits, changed, logged_days, today):
+    """
+    Adjust the rollup after an import created `new_habits`, changed the logs
+    in `changed` ((habit_id, date, completed) rows) and logged open days in
+    `logged_days`. Each day is adjusted once, so a day without a row is
+    counted from the logs, which already hold the whole import. Call after
+    flush.
+    """
+    active = Counter()
+    for habit in new_habits:
+        if habit.is_recurring:
+            active[today] += 1
+        elif habit.target_date:
+            active[habit.target_date] += 1
+    completed = Counter()
+    for _, day, state in changed:
+        completed[day] += 1 if state else -1
+    for day in sorted(set(active) | set(completed) | set(logged_days)):
+        _adjust(user_id, day, active=active[day], completed=completed[day])
+
+
+def record_habit_added(habit, today):
+    """Count a newly created habit towards today's total. Call after flush."""
+    if _is_due(habit, today):
+        _adjust(habit.user_id, today, active=1)
+
+
+def record_habit_removed(habit, today):
+    """Drop a habit from today's totals. Call before its logs are deleted."""
+    if not _is_due(habit, today):
+        return
+    done = DailyLog.query.filter_by(habit_id=habit.id, date=today, completed=True).first() is not None
+    db.session.execute(
+        update(DailyHabitSummary).where(
+            DailyHabitSummary.user_id == habit.user_id,
+            DailyHabitSummary.date == today
+        ).values(
+            active_habits=DailyHabitSummary.active_habits - 1,
+            completed_habits=DailyHabitSummary.completed_habits - (1 if done else 0)
+        ).execution_options(synchronize_session=False)
+    )
+
+
+def completion_by_day(user_id, start, end):
+    """Return {date: (active, completed)} for days in [start, end] that have rows."""
+    rows = db.session.query(
+        DailyHabitSummary.date,
+        DailyHabitSummary.active_habits,
+        DailyHabitSummary.completed_habits
+    ).filter(
+        DailyHabitSummary.user_id == user_id,
+        DailyHabitSummary.date >= start,
+        DailyHabitSummary.date <= end
+    ).all()
+    return {day: (active, completed) for day, active, completed in rows}
+
+
+def consistency(user_id, today, days=7):
+    """Per-day completion percentages for the last `days` days (oldest first)."""
+    dates = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+    by_day = completion_by_day(user_id, dates[0], today)
+    percentages = []
+    for d in dates:
+        active, completed = by_day.get(d, (0, 0))
+        percentages.append(int(completed / active * 100) if active else 0)
+    return dates, percentages
+
+
+def _derived_totals(user_id=None, missing_only=False):
+    """
+    {(user_id, date): [active, completed]} counted from Habit/DailyLog in a
+    few grouped queries, for every date with logs or a one-time habit (only
+    those without a summary row when `missing_only`). Deleted habits are gone
+    from the source tables, so the denominator is today's recurring habits
+    plus that day's one-time habits, archived ones included.
+    """
+    def scoped(query, date_column=DailyLog.date, user_column=Habit.user_id):
+        if user_id is not None:
+            query = query.filter(user_column == user_id)
+        if missing_only:
+            # Anti-join on the summary's unique (user_id, date) index
+            query = query.filter(~exists().where(
+                DailyHabitSummary.user_id == user_column,
+                DailyHabitSummary.date == date_column
+            ))
+        return query
+
+    completed = scoped(db.session.query(
+        Habit.user_id, DailyLog.date, func.count(DailyLog.id)
+    ).join(DailyLog).filter(
+        DailyLog.completed == True
+    )).group_by(Habit.user_id, DailyLog.date).all()
+
+    logged_days = scoped(db.session.query(
+        Habit.user_id, DailyLog.date
+    ).join(DailyLog)).distinct().all()
+
+    recurring = db.session.query(
+        Habit.user_id, func.count(Habit.id)
+    ).filter(Habit.is_recurring == True)
+    if user_id is not None:
+        recurring = recurring.filter(Habit.user_id == user_id)
+    recurring = dict(recurring.group_by(Habit.user_id).all())
+
+    one_time = scoped(db.session.query(
+        Habit.user_id, Habit.target_date, func.count(Habit.id)
+    ).filter(
+        Habit.is_recurring == False,
+        Habit.target_date.isnot(None)
+    ), Habit.target_date).group_by(Habit.user_id, Habit.target_date).all()
+
+    archived = scoped(db.session.query(
+        ArchivedHabit.user_id, ArchivedHabit.target_date,
+        func.count(ArchivedHabit.habit_id),
+        func.sum(case((ArchivedHabit.completed == True, 1), else_=0))
+    ), ArchivedHabit.target_date, ArchivedHabit.user_id).group_by(
+        ArchivedHabit.user_id, ArchivedHabit.target_date
+    ).all()
+
+    totals = {}
+    for uid, day in logged_days:
+        totals[(uid, day)] = [recurring.get(uid, 0), 0]
+    for uid, day, count in one_time:
+        totals.setdefault((uid, day), [recurring.get(uid, 0), 0])[0] += count
+    for uid, day, count in completed:
+        totals[(uid, day)][1] = count
+    for uid, day, count, done in archived:
+        day_totals = totals.setdefault((uid, day), [recurring.get(uid, 0), 0])
+        day_totals[0] += count
+        day_totals[1] += int(done or 0)
+    return totals
+
+
+def rebuild_summaries(user_id=None):
+    """
+    Recreate DailyHabitSummary from Habit/DailyLog (see _derived_totals()).
+    Past denominators become today's habit set, and toggles committed while
+    it runs can be lost, so this is for repairs, not for scheduled runs.
+    Returns the number of rows written.
+    """
+    totals = _derived_totals(user_id)
+    delete_query = DailyHabitSummary.query
+    if user_id is not None:
+        delete_query = delete_query.filter(DailyHabitSummary.user_id == user_id)
+    delete_query.delete(synchronize_session=False)
+
+    db.session.bulk_insert_mappings(DailyHabitSummary, [
+        {'user_id': uid, 'date': day, 'active_habits': active, 'completed_habits': done}
+        for (uid, day), (active, done) in totals.items()
+    ])
+    db.session.commit()
+    return len(totals)
+
+
+def fill_summaries(user_id=None):
+    """
+    Add rows for days that have logs but no summary yet (history from before
+    the rollup, imports), counted like rebuild_summaries() but only for
+    those days. Existing rows are left alone, so past denominators keep
+    their values, and a row a toggle creates meanwhile wins over ours.
+    Returns {user_id: rows added}.
+    """
+    missing = [
+        {'user_id': uid, 'date': day, 'active_habits': active, 'completed_habits': done}
+        for (uid, day), (active, done) in _derived_totals(user_id, missing_only=True).items()
+    ]
+    added = {}
+    for start in range(0, len(missing), FILL_CHUNK):
+        chunk = missing[start:start + FILL_CHUNK]
+        db.session.execute(
+            dialect_insert(DailyHabitSummary).on_conflict_do_nothing(index_elements=['user_id', 'date']),
+            chunk
+        )
+        for row in chunk:
+            added[row['user_id']] = added.get(row['user_id'], 0) + 1
+    db.session.commit()
+    return added
@@ -0,0 +1,173 @@
+"""
+Offline-first client sync: deltas since a cursor and batched offline writes.
+
+Habit, Subject, DailyLog and AttendanceRecord rows carry updated_at, set on
+every write, and deleted habits and subjects leave a SyncTombstone. A pull
+returns what changed since the client's cursor. The new cursor is the server
+clock at the pull less CURSOR_LAG, so rows from transactions still open at
+that moment come with the next pull; the overlap is harmless because clients
+store rows by key. Without a cursor, or with one older than the tombstones
+are kept, the pull is a snapshot (`reset`): every habit and subject and the
+last SNAPSHOT_DAYS of logs and attendance; older history is paged through
+the history API.
+
+A push carries set-state ops recorded offline, oldest first:
+
+    {"id": "c1", "type": "log", "habit_id": 3, "date": "2026-10-12", "completed": true, "at": "<client time>"}
+    {"id": "c2", "type": "attendance", "subject_id": 5, "date": "2026-10-12", "status": "Present", "at": "..."}
+
+They are applied in one transaction. `sentAt` on the batch (the client clock
+when sending) corrects `at` for clock skew. Conflicts are last-writer-wins:
+an op made before the server row last changed, to a different value, loses
+and is answered with the server's value. Ops set a state rather than flip
+it, so resending a batch after a dropped response is harmless.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import tuple_
+from models import db, Habit, Subject, DailyLog, AttendanceRecord, SyncTombstone
+from toggles import apply_toggles
+from upserts import is_id, upsert_attendance, STATUSES
+
+CURSOR_LAG = timedelta(seconds=30)
+SNAPSHOT_DAYS = 120
+TOMBSTONE_DAYS = 180
+MAX_OPS = 1000
+
+
+def encode_cursor(moment):
+    return moment.isoformat()
+
+
+def parse_cursor(raw):
+    """A cursor or client timestamp as a naive UTC datetime, or None. Raises ValueError."""
+    if not raw:
+        return None
+    moment = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+    if moment.tzinfo is not None:
+        moment = (moment - moment.utcoffset()).replace(tzinfo=None)
+    return moment
+
+
+def pull(user_id, cursor, now):
+    """Changes since `cursor` (a datetime or None) as a JSON-able dict."""
+    since = cursor if cursor and cursor >= now - timedelta(days=TOMBSTONE_DAYS) else None
+
+    habits = Habit.query.filter(Habit.user_id == user_id).all()
+    subjects = Subject.query.filter(Subject.user_id == user_id).all()
+    habit_ids = [h.id for h in habits]
+    subject_ids = [s.id for s in subjects]
+
+    # Plain column rows: a snapshot can run to thousands of them
+    logs = db.session.query(DailyLog.habit_id, DailyLog.date, DailyLog.completed).filter(
+        DailyLog.habit_id.in_(habit_ids)
+    )
+    records = db.session.query(AttendanceRecord.subject_id, AttendanceRecord.date, AttendanceRecord.status).filter(
+        AttendanceRecord.subject_id.in_(subject_ids)
+    )
+    if since:
+        logs = logs.filter(DailyLog.updated_at > since)
+        records = records.filter(AttendanceRecord.updated_at > since)
+        habits = [h for h in habits if h.updated_at and h.updated_at > since]
+        subjects = [s for s in subjects if s.updated_at and s.updated_at > since]
+    else:
+        first_day = now.date() - timedelta(days=SNAPSHOT_DAYS)
+        logs = logs.filter(DailyLog.date >= first_day)
+        records = records.filter(AttendanceRecord.date >= first_day)
+
+    delta = {
+        'cursor': encode_cursor(now - CURSOR_LAG),
+        'reset': since is None,
+        'habits': [{'id': h.id, 'name': h.name, 'isRecurring': bool(h.is_recurring),
+                    'targetDate': h.target_date.isoformat() if h.target_date else None} for h in habits],
+        'subjects': [{'id': s.id, 'name': s.name} for s in subjects],
+        'logs': [{'habitId': l.habit_id, 'date': l.date.isoformat(), 'completed': bool(l.completed)}
+                 for l in logs] if habit_ids else [],
+        'attendance': [{'subjectId': r.subject_id, 'date': r.date.isoformat(), 'status': r.status}
+                       for r in records] if subject_ids else [],
+        'deleted': {'habits': [], 'subjects': []},
+    }
+    if since:
+        tombstones = SyncTombstone.query.filter(
+            SyncTombstone.user_id == user_id,
+            SyncTombstone.deleted_at > since
+        )
+        for tombstone in tombstones:
+            delta['deleted'][tombstone.entity + 's'].append(tombstone.entity_id)
+    return delta
+
+
+def _parse_op(op, habit_ids, subject_ids, skew, now):
+    """(kind, key, value, at) for a valid op. Raises ValueError naming the problem."""
+    if not isinstance(op, dict):
+        raise ValueError('op must be an object')
+    if op.get('type') not in ('log', 'attendance'):
+        raise ValueError(f"unknown op type {op.get('type')!r}")
+    try:
+        day = date.fromisoformat(op.get('date'))
+        at = parse_cursor(op.get('at'))
+    except (TypeError, ValueError):
+        raise ValueError('date must be YYYY-MM-DD and at an ISO timestamp')
+    at = min(at + skew, now) if at else now
+    if op['type'] == 'log':
+        if not is_id(op.get('habit_id')) or op['habit_id'] not in habit_ids:
+            raise ValueError('unknown habit')
+        if not isinstance(op.get('completed'), bool):
+            raise ValueError('completed must be true or false')
+        return 'log', (op['habit_id'], day), op['completed'], at
+    if not is_id(op.get('subject_id')) or op['subject_id'] not in subject_ids:
+        raise ValueError('unknown subject')
+    if op.get('status') not in STATUSES:
+        raise ValueError('status must be Present or Absent')
+    return 'attendance', (op['subject_id'], day), op['status'], at
+
+
+def push(user_id, ops, sent_at, now):
+    """
+    Apply offline ops in one transaction (caller commits). Returns
+    (results, kinds written): a result per op with status 'applied',
+    'conflict' (with the server's value) or 'rejected' (with an error).
+    """
+    skew = now - sent_at if sent_at else timedelta(0)
+    habit_ids = {row.id for row in db.session.query(Habit.id).filter(Habit.user_id == user_id)}
+    subject_ids = {row.id for row in db.session.query(Subject.id).filter(Subject.user_id == user_id)}
+
+    results = []
+    parsed = []
+    for op in ops:
+        result = {'id': op.get('id') if isinstance(op, dict) else None, 'status': 'rejected'}
+        results.append(result)
+        try:
+            parsed.append((result, *_parse_op(op, habit_ids, subject_ids, skew, now)))
+        except ValueError as e:
+            result['error'] = str(e)
+
+    log_keys = [key for _, kind, key, _, _ in parsed if kind == 'log']
+    attendance_keys = [key for _, kind, key, _, _ in parsed if kind == 'attendance']
+    server = {}
+    if log_keys:
+        for row in db.session.query(DailyLog.habit_id, DailyLog.date, DailyLog.completed, DailyLog.updated_at).filter(
+            tuple_(DailyLog.habit_id, DailyLog.date).in_(log_keys)
+        ):
+            server[('log', (row.habit_id, row.date))] = (bool(row.completed), row.updated_at)
+    if attendance_keys:
+        for row in db.session.query(AttendanceRecord.subject_id, AttendanceRecord.date,
+                                    AttendanceRecord.status, AttendanceRecord.updated_at).filter(
+            tuple_(AttendanceRecord.subject_id, AttendanceRecord.date).in_(attendance_keys)
+        ):
+            server[('attendance', (row.subject_id, row.date))] = (row.status, row.updated_at)
+
+    writes = {'log': {}, 'attendance': {}}
+    for result, kind, key, value, at in sorted(parsed, key=lambda entry: entry[4]):
+        current, changed_at = server.get((kind, key), (None, None))
+        if current is not None and current != value and changed_at and changed_at > at:
+            result.update({'status': 'conflict', 'server': current})
+            continue
+        writes[kind][key] = value
+        result['status'] = 'applied'
+
+    apply_toggles(writes['log'])
+    upsert_attendance([
+        {'subject_id': subject_id, 'date': day, 'status': status}
+        for (subject_id, day), status in writes['attendance'].items()
+    ])
+    return results, {kind for kind, values in writes.items() if values}
@@ -0,0 +1,62 @@
+"""
+Shared test setup: the app on a temporary SQLite database, migrated once.
+
+    python -m pytest tests
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+from app import app as flask_app  # noqa: E402  (needs DATABASE_URL)
+from models import db, User, Habit, Subject  # noqa: E402
+import migrations  # noqa: E402
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope='session')
+def app():
+    with flask_app.app_context():
+        migrations.upgrade()
+    return flask_app
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user(ctx):
+    """make_user(habits=3, subjects=0) -> (user_id, habit_ids, subject_ids) for a new account."""
+    def make(habits=3, subjects=0):
+        user = User(username=f'user-{next(_usernames)}')
+        db.session.add(user)
+        db.session.flush()
+        habit_rows = [Habit(name=f'habit {i}', is_recurring=True, user_id=user.id) for i in range(habits)]
+        subject_rows = [Subject(name=f'subject {i}', user_id=user.id) for i in range(subjects)]
+        db.session.add_all(habit_rows + subject_rows)
+        db.session.commit()
+        return user.id, [h.id for h in habit_rows], [s.id for s in subject_rows]
+    return make
+
+
+@pytest.fixture
+def login(app):
+    """login(user_id) -> a test client with that user's session."""
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+    return client_for
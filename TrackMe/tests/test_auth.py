@@ -0,0 +1,34 @@
+"""
+Accounts from before logins existed (no password hash) cannot be claimed
+by whoever logs in first; their password is set with `flask set-password`.
+"""
+from models import db, User
+import auth
+
+
+def test_account_without_password_is_not_claimed(app, make_user):
+    user_id, _, _ = make_user(habits=0)
+    username = db.session.get(User, user_id).username
+
+    response = app.test_client().post('/login', data={'username': username, 'password': 'guess'})
+    assert response.status_code == 200
+    assert b'set-password' in response.data
+    db.session.expire_all()
+    assert db.session.get(User, user_id).password_hash is None
+
+
+def test_set_password_command(app, make_user):
+    user_id, _, _ = make_user(habits=0)
+    username = db.session.get(User, user_id).username
+
+    result = app.test_cli_runner().invoke(args=['set-password', username], input='secret\nsecret\n')
+    assert result.exit_code == 0, result.output
+    db.session.expire_all()
+    assert auth.check_password(db.session.get(User, user_id), 'secret')
+
+    client = app.test_client()
+    assert client.post('/login', data={'username': username, 'password': 'wrong'}).status_code == 200
+    response = client.post('/login', data={'username': username, 'password': 'secret'})
+    assert response.status_code == 302
+
+    assert app.test_cli_runner().invoke(args=['set-password', 'nobody-here'], input='x\nx\n').exit_code != 0
@@ -0,0 +1,111 @@
+"""
+Calendar bitmaps must hold exactly the completed DailyLog days.
+
+Each write path that keeps HabitCalendar current (single toggles, bulk
+toggles, imports) and the repair paths (rebuild_calendars, fill_calendars)
+are checked against bitmaps built straight from DailyLog.
+"""
+import json
+import random
+from datetime import date, timedelta
+
+from models import db, Habit, DailyLog, HabitCalendar
+import calendars
+
+# Crosses a New Year so writes land in two bitmaps
+FIRST_DAY = date(2025, 12, 1)
+DAYS = 62
+
+
+def expected(habit_ids):
+    """{(habit_id, year): bits} from the completed logs."""
+    bits = {}
+    for habit_id, day in db.session.query(DailyLog.habit_id, DailyLog.date).filter(
+        DailyLog.habit_id.in_(habit_ids), DailyLog.completed == True
+    ):
+        key = (habit_id, day.year)
+        bits[key] = bits.get(key, 0) | 1 << (day - date(day.year, 1, 1)).days
+    return bits
+
+
+def stored(habit_ids):
+    # Cleared bitmaps stay as all-zero rows; a rebuild omits them
+    rows = HabitCalendar.query.filter(HabitCalendar.habit_id.in_(habit_ids))
+    return {(row.habit_id, row.year): calendars.to_int(row.bits) for row in rows if calendars.to_int(row.bits)}
+
+
+def random_day(rng):
+    return FIRST_DAY + timedelta(days=rng.randrange(DAYS))
+
+
+def test_toggles_match_logs(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=3)
+    client = login(user_id)
+    rng = random.Random(1)
+    for _ in range(200):
+        body = {'date': random_day(rng).isoformat()}
+        if rng.random() < 0.4:
+            body['completed'] = rng.random() < 0.6
+        assert client.post(f'/toggle/{rng.choice(habit_ids)}', json=body).status_code == 200
+    assert expected(habit_ids)
+    assert stored(habit_ids) == expected(habit_ids)
+
+
+def test_bulk_toggles_match_logs(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=3)
+    client = login(user_id)
+    rng = random.Random(2)
+    for _ in range(10):
+        entries = [{'habit_id': rng.choice(habit_ids), 'date': random_day(rng).isoformat()} for _ in range(30)]
+        for entry in entries[::3]:
+            entry['completed'] = rng.random() < 0.5
+        response = client.post('/api/toggle/bulk', json={'entries': entries})
+        assert response.status_code == 200 and response.get_json()['success']
+    assert stored(habit_ids) == expected(habit_ids)
+
+
+def test_import_matches_logs(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=2)
+    client = login(user_id)
+    # Existing bitmaps for the habit the import adds to
+    for offset in (0, 40):
+        client.post(f'/toggle/{habit_ids[0]}', json={'date': (FIRST_DAY + timedelta(days=offset)).isoformat()})
+
+    rng = random.Random(3)
+    records = [{'type': 'habit', 'id': 1, 'name': 'habit 0', 'is_recurring': True},
+               {'type': 'habit', 'id': 2, 'name': 'imported', 'is_recurring': True}]
+    records += [{'type': 'log', 'habit_id': rng.choice((1, 2)), 'date': random_day(rng).isoformat(),
+                 'completed': rng.random() < 0.7} for _ in range(80)]
+    response = client.post('/api/import', data='\n'.join(json.dumps(r) for r in records),
+                           content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+    habit_ids = [row.id for row in db.session.query(Habit.id).filter(Habit.user_id == user_id)]
+    assert len(habit_ids) == 3
+    assert stored(habit_ids) == expected(habit_ids)
+
+
+def test_rebuild_and_fill_match_logs(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=2)
+    client = login(user_id)
+    rng = random.Random(4)
+    for _ in range(60):
+        client.post(f'/toggle/{rng.choice(habit_ids)}', json={'date': random_day(rng).isoformat()})
+    want = expected(habit_ids)
+
+    calendars.rebuild_calendars(user_id)
+    assert stored(habit_ids) == want
+
+    HabitCalendar.query.filter(HabitCalendar.habit_id == habit_ids[0]).delete()
+    db.session.commit()
+    calendars.fill_calendars(user_id)
+    assert stored(habit_ids) == want
+
+
+def test_last_day_of_year_9999(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=1)
+    client = login(user_id)
+    assert client.post(f'/toggle/{habit_ids[0]}', json={'date': '9999-12-31'}).status_code == 200
+    assert stored(habit_ids) == {(habit_ids[0], 9999): 1 << 364}
+    view = client.get(f'/api/habits/{habit_ids[0]}/calendar?year=9999').get_json()
+    assert view['completed'] == 1 and len(view['days']) == 365
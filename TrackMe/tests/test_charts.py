@@ -0,0 +1,26 @@
+"""
+Chart periods outside the calendar are rejected with 400, not a 500.
+"""
+import pytest
+
+
+@pytest.mark.parametrize('query', [
+    'month?month=13', 'month?month=0', 'month?year=0', 'month?year=10000',
+    'year?year=0', 'year?year=10000', 'range?start=2026-02-01&end=2026-01-01',
+])
+def test_out_of_range_periods_are_rejected(make_user, login, query):
+    user_id, _, _ = make_user(habits=1)
+    response = login(user_id).get(f'/api/chart-data/{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+@pytest.mark.parametrize('query, buckets', [
+    ('month?month=12&year=9999', 31), ('month?month=1&year=1', 31), ('year?year=9999', 12),
+    ('range?start=2026-01-01&end=2026-01-01', 1),
+])
+def test_calendar_edges_are_served(make_user, login, query, buckets):
+    user_id, _, _ = make_user(habits=1)
+    response = login(user_id).get(f'/api/chart-data/{query}')
+    assert response.status_code == 200
+    assert len(response.get_json()['labels']) == buckets
@@ -0,0 +1,101 @@
+"""
+Concurrent toggles of the same habits and days.
+
+The in-process tests run threads against the test database (SQLite). The
+stress_toggle runs repeat the check in a fresh process, with and without
+the write batcher, on a temporary SQLite file and, when
+TRACKME_TEST_POSTGRES_URL names an empty PostgreSQL database, on Postgres.
+"""
+import os
+import subprocess
+import sys
+import threading
+from collections import Counter
+from datetime import date
+
+import pytest
+from models import db, DailyLog, HabitStreak
+import streaks
+
+THREADS = 8
+REQUESTS = 20
+DAY = date(2026, 3, 2)
+STRESS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'stress_toggle.py')
+POSTGRES_URL = os.environ.get('TRACKME_TEST_POSTGRES_URL')
+
+
+def hammer(login, user_id, requests_for):
+    """Run THREADS clients, each posting requests_for(i) -> (habit_id, body). Returns status counts."""
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker():
+        client = login(user_id)
+        for i in range(REQUESTS):
+            habit_id, body = requests_for(i)
+            status = client.post(f'/toggle/{habit_id}', json=body).status_code
+            with lock:
+                statuses[status] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def logs(habit_ids):
+    """{(habit_id, date): [completed, ...]} for every stored log."""
+    rows = {}
+    for habit_id, day, completed in db.session.query(DailyLog.habit_id, DailyLog.date, DailyLog.completed).filter(
+        DailyLog.habit_id.in_(habit_ids)
+    ):
+        rows.setdefault((habit_id, day), []).append(completed)
+    return rows
+
+
+def test_concurrent_flips_of_one_day(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=1)
+    statuses = hammer(login, user_id, lambda i: (habit_ids[0], {'date': DAY.isoformat()}))
+    assert statuses == {200: THREADS * REQUESTS}
+
+    db.session.expire_all()
+    stored = logs(habit_ids)
+    assert list(stored) == [(habit_ids[0], DAY)]
+    # An even number of flips ends where it started
+    assert stored[(habit_ids[0], DAY)] == [THREADS * REQUESTS % 2 == 1]
+
+
+def test_concurrent_set_state(make_user, login):
+    user_id, habit_ids, _ = make_user(habits=3)
+    # Every request for a habit sets the same state, so the outcome is known whatever the order
+    statuses = hammer(login, user_id, lambda i: (habit_ids[i % 3], {'date': DAY.isoformat(), 'completed': i % 3 != 1}))
+    assert statuses == {200: THREADS * REQUESTS}
+
+    db.session.expire_all()
+    stored = logs(habit_ids)
+    assert stored[(habit_ids[0], DAY)] == stored[(habit_ids[2], DAY)] == [True]
+    # Clearing a day that has no log does not write one
+    assert stored.get((habit_ids[1], DAY), [False]) == [False]
+
+    incremental = {(s.habit_id, s.current_streak, s.longest_streak, s.last_completed)
+                   for s in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)) if s.last_completed}
+    streaks.rebuild_streaks(user_id)
+    rebuilt = {(s.habit_id, s.current_streak, s.longest_streak, s.last_completed)
+               for s in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)) if s.last_completed}
+    assert incremental == rebuilt
+
+
+@pytest.mark.parametrize('database', ['sqlite', pytest.param('postgresql', marks=pytest.mark.skipif(
+    not POSTGRES_URL, reason='set TRACKME_TEST_POSTGRES_URL to an empty PostgreSQL database'))])
+@pytest.mark.parametrize('mode', [[], ['--batching'], ['--batching', '--durability', 'accepted']],
+                         ids=['direct', 'batched', 'batched-accepted'])
+def test_stress_toggle(database, mode):
+    args = [sys.executable, STRESS, '--threads', '6', '--requests', '15', *mode]
+    if database == 'postgresql':
+        args += ['--database-url', POSTGRES_URL]
+    env = {key: value for key, value in os.environ.items() if key != 'DATABASE_URL'}
+    result = subprocess.run(args, capture_output=True, text=True, timeout=300, env=env)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert result.stdout.rstrip().endswith('PASS')
@@ -0,0 +1,51 @@
+"""
+Page renders cost a fixed number of SQL statements, however many habits
+and subjects the user has (see queries.count_queries).
+"""
+from datetime import date, time, timedelta
+
+import pytest
+
+from cache import response_cache
+from models import db, TimetableSlot
+from queries import count_queries
+from toggles import apply_toggles
+from upserts import upsert_attendance
+
+PAGES = ['/', '/habits', '/attendance']
+
+
+def populate(user_id, habit_ids, subject_ids, days=5):
+    """A few days of logs and marks for every habit and subject, each subject on today's timetable."""
+    today = date.today()
+    recent = [today - timedelta(days=n) for n in range(days)]
+    apply_toggles({(habit_id, day): n % 2 == 0 for n, habit_id in enumerate(habit_ids) for day in recent})
+    upsert_attendance([{'subject_id': subject_id, 'date': day, 'status': 'Present' if n % 3 else 'Absent'}
+                       for n, subject_id in enumerate(subject_ids) for day in recent])
+    db.session.add_all([TimetableSlot(user_id=user_id, subject_id=subject_id, weekday=today.weekday(),
+                                      start_time=time(9 + n % 8), end_time=time(10 + n % 8))
+                        for n, subject_id in enumerate(subject_ids)])
+    db.session.commit()
+
+
+def statements(app, make_user, login, habits, subjects):
+    """{page: statement count} for a second render with the response cache emptied."""
+    user_id, habit_ids, subject_ids = make_user(habits=habits, subjects=subjects)
+    populate(user_id, habit_ids, subject_ids)
+    client = login(user_id)
+    counts = {}
+    for page in PAGES:
+        assert client.get(page).status_code == 200
+        response_cache.backend.clear()
+        with count_queries() as counter:
+            assert client.get(page).status_code == 200
+        counts[page] = counter.count
+    return counts
+
+
+@pytest.mark.parametrize('grow', ['habits', 'subjects'])
+def test_statement_count_does_not_grow(app, make_user, login, grow):
+    small = statements(app, make_user, login, habits=1, subjects=1)
+    large = statements(app, make_user, login, habits=25 if grow == 'habits' else 1,
+                       subjects=25 if grow == 'subjects' else 1)
+    assert large == small
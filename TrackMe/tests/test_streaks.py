@@ -0,0 +1,75 @@
+"""
+Incremental streaks must match a rebuild from DailyLog.
+
+Toggles go through the route (flips, set-state, backfills and un-toggles)
+and through apply_toggles (bulk and sync writes) in random order; after
+each round the stored HabitStreak rows are compared with rebuild_streaks().
+"""
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from models import db, DailyLog, HabitStreak
+from toggles import apply_toggles
+import streaks
+
+DAYS = 40
+
+
+@pytest.fixture
+def habits(make_user):
+    user_id, habit_ids, _ = make_user(habits=3)
+    return user_id, habit_ids
+
+
+def stored(habit_ids):
+    # A habit never completed may have no streak row incrementally; a rebuild writes zeros
+    return {(s.habit_id, s.current_streak, s.longest_streak, s.last_completed)
+            for s in HabitStreak.query.filter(HabitStreak.habit_id.in_(habit_ids)) if s.last_completed}
+
+
+def rebuilt(user_id, habit_ids):
+    incremental = stored(habit_ids)
+    streaks.rebuild_streaks(user_id)
+    return incremental, stored(habit_ids)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_matches_rebuild(habits, login, seed):
+    user_id, habit_ids = habits
+    rng = random.Random(seed)
+    today = date.today()
+    client = login(user_id)
+
+    for _ in range(6):
+        for _ in range(40):
+            habit_id = rng.choice(habit_ids)
+            day = today - timedelta(days=rng.randrange(DAYS))
+            body = {'date': day.isoformat()}
+            if rng.random() < 0.5:
+                body['completed'] = rng.random() < 0.7
+            assert client.post(f'/toggle/{habit_id}', json=body).status_code == 200
+
+        states = {(rng.choice(habit_ids), today - timedelta(days=rng.randrange(DAYS))): rng.random() < 0.6
+                  for _ in range(15)}
+        apply_toggles(states)
+        db.session.commit()
+
+        incremental, expected = rebuilt(user_id, habit_ids)
+        assert incremental == expected
+
+
+def test_clearing_every_day_empties_the_streak(habits):
+    user_id, habit_ids = habits
+    habit_id = habit_ids[0]
+    days = [date.today() - timedelta(days=n) for n in range(5)]
+    apply_toggles({(habit_id, day): True for day in days})
+    db.session.commit()
+    assert stored(habit_ids) == {(habit_id, 5, 5, days[0])}
+
+    apply_toggles({(habit_id, day): False for day in days})
+    db.session.commit()
+    assert not DailyLog.query.filter_by(habit_id=habit_id, completed=True).count()
+    incremental, expected = rebuilt(user_id, habit_ids)
+    assert incremental == expected == set()
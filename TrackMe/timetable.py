@@ -0,0 +1,183 @@
+"""
+Class timetable.
+
+A user's week is built once from their TimetableSlot rows and kept in an
+in-process cache, so today's classes, "now/next" and the scheduled-session
+counts behind the attendance stats are lookups rather than queries. Entries
+expire after an hour so edits made by other processes (the seed script) are
+picked up; in-process writes call invalidate().
+"""
+from datetime import time, timedelta
+from cache import MemoryBackend
+from models import db, Subject, TimetableSlot
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Tailwind colour per subject, labs share their subject's colour
+PALETTE = ['emerald', 'purple', 'blue', 'amber', 'indigo', 'pink', 'cyan', 'rose']
+
+# Semester timetable used by seed_subjects.py: (subject, weekday, start hour, end hour, is_lab)
+DEFAULT_TIMETABLE = [
+    ('M-II', 0, 9, 10, False), ('DSPD-I', 0, 10, 11, False), ('DCMP', 0, 11, 12, False),
+    ('BEE (LAB)', 0, 14, 16, True),
+    ('DMGT', 1, 10, 11, False), ('BEE', 1, 11, 12, False), ('DSPD-I (LAB)', 1, 14, 16, True),
+    ('DMGT', 2, 8, 9, False), ('M-II', 2, 9, 10, False), ('DSPD-I', 2, 10, 11, False),
+    ('BEE', 2, 11, 12, False), ('M-II', 2, 16, 17, False), ('DSPD-I', 2, 17, 18, False),
+    ('DSPD-I', 3, 8, 9, False), ('DCMP', 3, 10, 11, False), ('DMGT', 3, 12, 13, False),
+    ('M-II', 4, 8, 9, False), ('DCMP', 4, 10, 11, False), ('BEE', 4, 12, 13, False),
+    ('DCMP (LAB)', 4, 14, 16, True), ('HISP-II', 4, 16, 17, False),
+]
+
+_schedules = MemoryBackend(maxsize=4096, ttl=3600)
+
+
+def _base_name(name):
+    return name.replace('(LAB)', '').strip()
+
+
+def weekly_schedule(user_id):
+    """
+    Return the user's week as seven lists (Monday first) of slot dicts
+    {'id', 'subjectId', 'subject', 'start', 'end', 'isLab', 'color'},
+    ordered by start time. Times are 'HH:MM' strings.
+    """
+    key = str(user_id)
+    week = _schedules.get(key)
+    if week is None:
+        rows = db.session.query(TimetableSlot, Subject.name).join(
+            Subject, Subject.id == TimetableSlot.subject_id
+        ).filter(
+            TimetableSlot.user_id == user_id
+        ).order_by(TimetableSlot.weekday, TimetableSlot.start_time, TimetableSlot.subject_id).all()
+
+        colors = {}
+        for slot, name in sorted(rows, key=lambda row: row[0].subject_id):
+            colors.setdefault(_base_name(name), PALETTE[len(colors) % len(PALETTE)])
+
+        week = [[] for _ in WEEKDAYS]
+        for slot, name in rows:
+            week[slot.weekday].append({
+                'id': slot.id,
+                'subjectId': slot.subject_id,
+                'subject': name,
+                'start': slot.start_time.strftime('%H:%M'),
+                'end': slot.end_time.strftime('%H:%M'),
+                'isLab': slot.is_lab,
+                'color': colors[_base_name(name)],
+            })
+        _schedules.set(key, week)
+    return week
+
+
+def invalidate(user_id):
+    """Forget a user's cached week after their timetable changes."""
+    _schedules.delete(str(user_id))
+
+
+def todays_slots(user_id, day):
+    return weekly_schedule(user_id)[day.weekday()]
+
+
+def now_and_next(user_id, moment):
+    """
+    Return (current, upcoming) slots for a datetime. `upcoming` may fall on a
+    later day and carries its 'date'; either is None when there is none.
+    """
+    week = weekly_schedule(user_id)
+    clock = moment.strftime('%H:%M')
+    today = moment.date()
+
+    current = next((s for s in week[today.weekday()] if s['start'] <= clock < s['end']), None)
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        for slot in week[day.weekday()]:
+            if offset or slot['start'] > clock:
+                return current, {**slot, 'date': day.isoformat()}
+    return current, None
+
+
+def scheduled_sessions(user_id, start, end):
+    """Number of timetabled sessions per subject id between start and end inclusive."""
+    week = weekly_schedule(user_id)
+    days = (end - start).days + 1
+    counts = {}
+    if days <= 0:
+        return counts
+    for weekday, slots in enumerate(week):
+        # Occurrences of this weekday in the range: whole weeks plus the remainder
+        occurrences = days // 7 + (1 if (weekday - start.weekday()) % 7 < days % 7 else 0)
+        for slot in slots:
+            counts[slot['subjectId']] = counts.get(slot['subjectId'], 0) + occurrences
+    return counts
+
+
+def timetable_grid(week):
+    """
+    Lay a week out as table rows for the timetable page. Rows run between
+    consecutive slot boundaries and whole hours; a slot spanning several rows
+    is emitted once with its rowspan and omitted from the rows it covers.
+    """
+    days = [d for d in range(len(WEEKDAYS)) if d < 5 or week[d]]
+    bounds = {t for d in days for s in week[d] for t in (s['start'], s['end'])}
+    if bounds:
+        # Hourly rows in between, so free hours and multi-hour labs show as such
+        first, last = min(bounds), max(bounds)
+        bounds |= {f'{h:02d}:00' for h in range(24) if first < f'{h:02d}:00' < last}
+    bounds = sorted(bounds)
+
+    rows = []
+    covered = set()
+    for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        cells = []
+        busy = False
+        for d in days:
+            if (i, d) in covered:
+                busy = True
+                continue
+            slot = next((s for s in week[d] if s['start'] == start), None)
+            span = 1
+            if slot:
+                busy = True
+                while i + span < len(bounds) - 1 and bounds[i + span + 1] <= slot['end']:
+                    covered.add((i + span, d))
+                    span += 1
+            cells.append({'slot': slot, 'rowspan': span})
+        rows.append({'start': start, 'end': end, 'cells': cells, 'free': not busy})
+
+    legend = {}
+    for d in days:
+        for slot in week[d]:
+            legend.setdefault(_base_name(slot['subject']), slot['color'])
+
+    return {
+        'days': [WEEKDAYS[d] for d in days],
+        'rows': rows,
+        'legend': list(legend.items()),
+    }
+
+
+def seed_timetable(user, entries=DEFAULT_TIMETABLE):
+    """
+    Create the user's subjects and slots from `entries`, reusing subjects that
+    already exist by name. Slots are only added if the user has none.
+    Returns (subjects added, slots added); the caller commits.
+    """
+    subjects = {s.name: s for s in Subject.query.filter_by(user_id=user.id)}
+    added_subjects = 0
+    for name, *_ in entries:
+        if name not in subjects:
+            subjects[name] = Subject(name=name, user_id=user.id)
+            db.session.add(subjects[name])
+            added_subjects += 1
+    db.session.flush()
+
+    if TimetableSlot.query.filter_by(user_id=user.id).first() is not None:
+        return added_subjects, 0
+
+    db.session.add_all([
+        TimetableSlot(user_id=user.id, subject_id=subjects[name].id, weekday=weekday,
+                      start_time=time(start), end_time=time(end), is_lab=is_lab)
+        for name, weekday, start, end, is_lab in entries
+    ])
+    invalidate(user.id)
+    return added_subjects, len(entries)
@@ -0,0 +1,52 @@
+"""
+Habit toggling.
+
+The DailyLog write is a single upsert, so concurrent toggles of the same habit
+and day serialize on the row instead of racing into the unique constraint.
+Streak, rollup and calendar bookkeeping run afterwards in the same
+transaction.
+"""
+from collections import Counter
+from models import Habit
+from upserts import upsert_toggle, set_logs
+import streaks
+import summaries
+import calendars
+
+
+def apply_toggle(habit, day, completed=None):
+    """
+    Flip `habit` for `day`, or set it to `completed` when given (idempotent,
+    safe to retry). Returns the resulting state. Caller commits.
+    """
+    state = upsert_toggle(habit.id, day, completed)
+    if state is None:
+        # Already in the requested state; nothing derived changes
+        return bool(completed)
+    streaks.record_toggle(habit.id, day, state)
+    summaries.record_toggle(habit, day, state)
+    calendars.record_toggle(habit.id, day, state)
+    return state
+
+
+def apply_toggles(states):
+    """
+    Set many habits at once from {(habit_id, day): completed}: the logs are
+    written with multi-row statements and bookkeeping runs for the rows that
+    changed. Returns those rows as (habit_id, day, completed). Caller commits.
+    """
+    changed = sorted(set_logs(states))
+    if changed:
+        owners = dict(Habit.query.with_entities(Habit.id, Habit.user_id).filter(
+            Habit.id.in_({habit_id for habit_id, _, _ in changed})
+        ).all())
+        net = Counter()
+        for habit_id, day, state in changed:
+            streaks.record_toggle(habit_id, day, state)
+            calendars.record_toggle(habit_id, day, state)
+            net[owners[habit_id], day] += 1 if state else -1
+        # One rollup adjustment per user and day: a missing row is counted from
+        # the logs, which already hold every change in the batch
+        for (user_id, day), delta in net.items():
+            summaries.record_completions(user_id, day, delta)
+    return changed
@@ -0,0 +1,278 @@
+"""
+Export and import of a user's habit and attendance history.
+
+Exports stream Habit, DailyLog (plus archived habits), Subject and
+AttendanceRecord rows as CSV or NDJSON, one record per line with a `type`
+field, parents before children.
+Rows are read through server-side cursors in CHUNK_SIZE partitions and
+encoded a chunk at a time, so memory stays flat however long the history.
+
+Imports read the same formats line by line. Habits and subjects are matched
+to the account's existing ones (by name, and schedule for habits) or created;
+logs and attendance are buffered per chunk and written with multi-row upserts
+on their unique constraints, so re-importing an export is idempotent. Streaks,
+calendar bitmaps and the daily rollup are then updated for the logs the
+import changed, in the same transaction.
+
+    flask --app app export-data alice --output alice.csv
+    flask --app app import-data alice alice.csv
+"""
+import csv
+import io
+import json
+from datetime import date
+from sqlalchemy import select
+from models import db, Habit, DailyLog, Subject, AttendanceRecord, ArchivedHabit
+from upserts import dialect_insert, set_logs, upsert_attendance, STATUSES
+import calendars
+import streaks
+import summaries
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+FIELDS = ['type', 'id', 'name', 'is_recurring', 'target_date', 'habit_id', 'subject_id', 'date', 'completed', 'status']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _stream(stmt):
+    """Iterate a select through a server-side cursor, CHUNK_SIZE rows at a time."""
+    result = db.session.execute(stmt.execution_options(yield_per=CHUNK_SIZE))
+    for partition in result.partitions():
+        yield from partition
+
+
+def export_records(user_id):
+    """Yield the user's history as record dicts, each parent before its children."""
+    habits = select(Habit.id, Habit.name, Habit.is_recurring, Habit.target_date).where(
+        Habit.user_id == user_id
+    ).order_by(Habit.id)
+    for row in _stream(habits):
+        yield {'type': 'habit', 'id': row.id, 'name': row.name,
+               'is_recurring': bool(row.is_recurring), 'target_date': row.target_date}
+
+    logs = select(DailyLog.habit_id, DailyLog.date, DailyLog.completed).join(
+        Habit, Habit.id == DailyLog.habit_id
+    ).where(Habit.user_id == user_id).order_by(DailyLog.habit_id, DailyLog.date)
+    for row in _stream(logs):
+        yield {'type': 'log', 'habit_id': row.habit_id, 'date': row.date, 'completed': bool(row.completed)}
+
+    # Archived one-time habits come back as a habit plus its target-date log
+    archived = select(ArchivedHabit.habit_id, ArchivedHabit.name, ArchivedHabit.target_date,
+                      ArchivedHabit.completed).where(
+        ArchivedHabit.user_id == user_id
+    ).order_by(ArchivedHabit.habit_id)
+    for row in _stream(archived):
+        habit_id = f'archived-{row.habit_id}'
+        yield {'type': 'habit', 'id': habit_id, 'name': row.name,
+               'is_recurring': False, 'target_date': row.target_date}
+        if row.completed:
+            yield {'type': 'log', 'habit_id': habit_id, 'date': row.target_date, 'completed': True}
+
+    subjects = select(Subject.id, Subject.name).where(Subject.user_id == user_id).order_by(Subject.id)
+    for row in _stream(subjects):
+        yield {'type': 'subject', 'id': row.id, 'name': row.name}
+
+    records = select(AttendanceRecord.subject_id, AttendanceRecord.date, AttendanceRecord.status).join(
+        Subject, Subject.id == AttendanceRecord.subject_id
+    ).where(Subject.user_id == user_id).order_by(AttendanceRecord.subject_id, AttendanceRecord.date)
+    for row in _stream(records):
+        yield {'type': 'attendance', 'subject_id': row.subject_id, 'date': row.date, 'status': row.status}
+
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def export_stream(user_id, fmt='csv'):
+    """Yield the encoded export in chunks of up to CHUNK_SIZE records."""
+    buffer = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS, lineterminator='\n')
+        writer.writeheader()
+
+    pending = 0
+    for record in export_records(user_id):
+        if writer:
+            writer.writerow({key: _csv_value(value) for key, value in record.items()})
+        else:
+            buffer.write(json.dumps(record, default=date.isoformat) + '\n')
+        pending += 1
+        if pending >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def parse_records(lines, fmt='csv'):
+    """
+    Yield (line number, record dict) from an iterable of text lines.
+    Raises ValueError for lines that cannot be parsed at all.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, {key: value for key, value in record.items() if value not in ('', None)}
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            raise ValueError(f'line {number}: invalid JSON')
+        if not isinstance(record, dict):
+            raise ValueError(f'line {number}: expected an object')
+        yield number, record
+
+
+def _bool(value, default=False):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+
+def _date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _id(parent):
+    """Id of an existing parent (an int) or of a new one once it is flushed."""
+    return parent if isinstance(parent, int) else parent.id
+
+
+class _Importer:
+    """
+    Resolves parents and buffers children for one import. New habits and
+    subjects are added to the session unflushed and inserted together with
+    the next chunk of children.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.habits = {}     # Source habit id -> habit id (or new Habit) in this account
+        self.subjects = {}   # Source subject id -> subject id (or new Subject) in this account
+        self.existing_habits = {
+            (h.name, bool(h.is_recurring), h.target_date): h.id
+            for h in Habit.query.filter_by(user_id=user_id).order_by(Habit.id.desc())
+        }
+        self.existing_subjects = {
+            s.name: s.id for s in Subject.query.filter_by(user_id=user_id).order_by(Subject.id.desc())
+        }
+        self.logs = {}
+        self.attendance = {}
+        self.new_habits = []
+        self.changed = []    # (habit_id, date, completed) for logs whose state changed
+        self.open_days = set()
+        self.counts = {'habits': 0, 'logs': 0, 'subjects': 0, 'attendance': 0, 'skipped': 0}
+        self.errors = []
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind == 'habit':
+            name = (record.get('name') or '').strip()[:200]
+            if not name:
+                raise ValueError('habit needs a name')
+            key = (name, _bool(record.get('is_recurring'), True), _date(record.get('target_date')))
+            if key not in self.existing_habits:
+                habit = Habit(name=key[0], is_recurring=key[1], target_date=key[2], user_id=self.user_id)
+                db.session.add(habit)
+                self.existing_habits[key] = habit
+                self.new_habits.append(habit)
+                self.counts['habits'] += 1
+            self.habits[str(record.get('id'))] = self.existing_habits[key]
+        elif kind == 'subject':
+            name = (record.get('name') or '').strip()[:100]
+            if not name:
+                raise ValueError('subject needs a name')
+            if name not in self.existing_subjects:
+                subject = Subject(name=name, user_id=self.user_id)
+                db.session.add(subject)
+                self.existing_subjects[name] = subject
+                self.counts['subjects'] += 1
+            self.subjects[str(record.get('id'))] = self.existing_subjects[name]
+        elif kind == 'log':
+            habit = self.habits.get(str(record.get('habit_id')))
+            day = _date(record.get('date'))
+            if habit is None or day is None:
+                raise ValueError('log needs a date and a habit earlier in the file')
+            self.logs[(habit, day)] = _bool(record.get('completed'))
+        elif kind == 'attendance':
+            subject = self.subjects.get(str(record.get('subject_id')))
+            day = _date(record.get('date'))
+            if subject is None or day is None:
+                raise ValueError('attendance needs a date and a subject earlier in the file')
+            if record.get('status') not in STATUSES:
+                raise ValueError('status must be Present or Absent')
+            self.attendance[(subject, day)] = record['status']
+        else:
+            raise ValueError(f'unknown record type {kind!r}')
+
+        if len(self.logs) + len(self.attendance) >= CHUNK_SIZE:
+            self.flush()
+
+    def skip(self, number, error):
+        self.counts['skipped'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': number, 'error': error})
+
+    def flush(self):
+        db.session.flush()
+        states = {(_id(habit), day): completed for (habit, day), completed in self.logs.items()}
+        self.changed += set_logs(states)
+        # set_logs() only writes completions and clears; keep the export's open days as rows too
+        open_days = [{'habit_id': habit_id, 'date': day, 'completed': False}
+                     for (habit_id, day), completed in states.items() if not completed]
+        if open_days:
+            self.open_days.update(row['date'] for row in open_days)
+            db.session.execute(
+                dialect_insert(DailyLog).on_conflict_do_nothing(index_elements=['habit_id', 'date']),
+                open_days
+            )
+        upsert_attendance([
+            {'subject_id': _id(subject), 'date': day, 'status': status}
+            for (subject, day), status in self.attendance.items()
+        ])
+        self.counts['logs'] += len(self.logs)
+        self.counts['attendance'] += len(self.attendance)
+        self.logs.clear()
+        self.attendance.clear()
+
+    def update_derived(self, today):
+        """Bring streaks, bitmaps and the rollup up to date with the changed logs."""
+        for habit_id in sorted({habit_id for habit_id, _, _ in self.changed}):
+            streaks.recompute_habit(habit_id)
+        calendars.recount({(habit_id, day.year) for habit_id, day, _ in self.changed})
+        summaries.record_import(self.user_id, self.new_habits, self.changed, self.open_days, today)
+
+
+def import_records(user_id, records):
+    """
+    Upsert (line number, record) pairs from parse_records() into a user's
+    account, CHUNK_SIZE log/attendance rows per statement. Invalid records are
+    skipped and reported. Streaks, bitmaps and the rollup are updated for
+    the affected habits and days only. Returns {'counts': {...}, 'errors':
+    [...]}; the caller commits.
+    """
+    importer = _Importer(user_id)
+    for number, record in records:
+        try:
+            importer.add(record)
+        except (TypeError, ValueError) as e:
+            importer.skip(number, str(e))
+    importer.flush()
+    importer.update_derived(date.today())
+    return {'counts': importer.counts, 'errors': importer.errors}
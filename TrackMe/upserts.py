@@ -0,0 +1,135 @@
+"""
+Multi-row upserts against the unique constraints.
+
+Rows are written with one INSERT ... ON CONFLICT DO UPDATE statement executed
+over the whole batch (SQLAlchemy packs it into multi-row VALUES where the
+driver supports it), so the cost is one round trip per few thousand rows
+instead of a select and an insert per row.
+"""
+from datetime import date, datetime
+from sqlalchemy import func, not_, tuple_, update
+from models import db, Subject, AttendanceRecord, DailyLog
+
+STATUSES = ('Present', 'Absent')
+
+
+def is_id(value):
+    """Whether a JSON value is an integer id. bool is an int subclass, and True would match id 1."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def dialect_insert(model):
+    """INSERT construct for the bound dialect that supports on_conflict_do_update()."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def upsert_toggle(habit_id, day, completed=None):
+    """
+    Flip a habit's log for `day` (or set it to `completed`) in one statement.
+    A missing log counts as not completed. Returns the new state, or None
+    when set-state semantics found the log already in the requested state.
+    """
+    if completed is not None and not completed:
+        # Clearing only touches an existing completed log
+        stmt = update(DailyLog).where(
+            DailyLog.habit_id == habit_id,
+            DailyLog.date == day,
+            DailyLog.completed == True
+        ).values(completed=False).execution_options(synchronize_session=False)
+    else:
+        stmt = dialect_insert(DailyLog).values(habit_id=habit_id, date=day, completed=True)
+        if completed is None:
+            set_, where = {'completed': not_(func.coalesce(DailyLog.completed, False))}, None
+        else:
+            set_, where = {'completed': True}, not_(func.coalesce(DailyLog.completed, False))
+        set_['updated_at'] = datetime.utcnow()
+        stmt = stmt.on_conflict_do_update(index_elements=['habit_id', 'date'], set_=set_, where=where)
+
+    row = db.session.execute(stmt.returning(DailyLog.completed)).first()
+    return bool(row[0]) if row else None
+
+
+def set_logs(states):
+    """
+    Set many logs from {(habit_id, date): completed} with one multi-row
+    upsert for completions and one multi-row UPDATE for clears. Only rows
+    whose state changes are touched. Returns the changed rows as
+    (habit_id, date, completed). Caller commits.
+    """
+    changed = []
+    done = [{'habit_id': habit_id, 'date': day, 'completed': True}
+            for (habit_id, day), completed in states.items() if completed]
+    cleared = [key for key, completed in states.items() if not completed]
+    if done:
+        stmt = dialect_insert(DailyLog).values(done).on_conflict_do_update(
+            index_elements=['habit_id', 'date'],
+            set_={'completed': True, 'updated_at': datetime.utcnow()},
+            where=not_(func.coalesce(DailyLog.completed, False))
+        )
+        changed += db.session.execute(stmt.returning(DailyLog.habit_id, DailyLog.date, DailyLog.completed)).all()
+    if cleared:
+        stmt = update(DailyLog).where(
+            tuple_(DailyLog.habit_id, DailyLog.date).in_(cleared),
+            DailyLog.completed == True
+        ).values(completed=False).execution_options(synchronize_session=False)
+        changed += db.session.execute(stmt.returning(DailyLog.habit_id, DailyLog.date, DailyLog.completed)).all()
+    return [(row.habit_id, row.date, bool(row.completed)) for row in changed]
+
+
+def upsert_attendance(rows):
+    """
+    Insert or update AttendanceRecord rows keyed on (subject_id, date); rows
+    already holding the status are left alone. Caller commits.
+    """
+    if not rows:
+        return
+    stmt = dialect_insert(AttendanceRecord)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['subject_id', 'date'],
+        set_={'status': stmt.excluded.status, 'updated_at': stmt.excluded.updated_at},
+        where=AttendanceRecord.status != stmt.excluded.status
+    )
+    db.session.execute(stmt, rows)
+
+
+def validate_attendance(user_id, entries):
+    """
+    Check bulk attendance entries against the user's subjects.
+    Returns (rows, results): rows to upsert, de-duplicated on (subject_id, date)
+    with the last entry winning, and one result dict per input entry.
+    """
+    owned = {row.id for row in db.session.query(Subject.id).filter(Subject.user_id == user_id)}
+
+    rows = {}
+    results = []
+    for index, entry in enumerate(entries):
+        result = {'index': index, 'success': False}
+        results.append(result)
+        if not isinstance(entry, dict):
+            result['error'] = 'entry must be an object'
+            continue
+
+        subject_id = entry.get('subject_id')
+        status = entry.get('status')
+        if not is_id(subject_id) or subject_id not in owned:
+            result['error'] = 'unknown subject'
+            continue
+        result['subject_id'] = subject_id
+        try:
+            entry_date = date.fromisoformat(entry.get('date', date.today().isoformat()))
+        except (TypeError, ValueError):
+            result['error'] = 'invalid date'
+            continue
+        result['date'] = entry_date.isoformat()
+
+        if not isinstance(status, str) or status not in STATUSES:
+            result['error'] = 'status must be Present or Absent'
+        else:
+            rows[(subject_id, entry_date)] = {'subject_id': subject_id, 'date': entry_date, 'status': status}
+            result.update({'success': True, 'status': status})
+
+    return list(rows.values()), results